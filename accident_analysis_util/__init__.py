@@ -0,0 +1,52 @@
+'''
+This package contains the functions and imports used in accident_analysis.ipynb, split
+into submodules so each only loads the dependencies it needs:
+
+- ingest: downloading and preparing accident data (no heavy dependencies).
+- spatial: totalling casualties within areas (geopandas).
+- maps: folium maps of casualties (folium, branca and shapely).
+- plotting: styling plotnine plots.
+
+Importing the package itself loads none of them. Each function can be imported from the
+package as before, which loads its submodule on first use, and the notebook imports
+everything at once with `from accident_analysis_util.notebook import *`.
+
+Run in command line (in main project directory) to check the package still imports quickly:
+python import_benchmark.py
+'''
+
+from importlib import import_module
+
+# Submodule each name is loaded from
+_SUBMODULES = {
+    'SEVERITY_COLUMNS': 'ingest',
+    'get_session': 'ingest',
+    'normalise_saint': 'ingest',
+    'list_to_path': 'ingest',
+    'dict_to_filenames_list': 'ingest',
+    'save_files_from_zip': 'ingest',
+    'casualties_severities': 'ingest',
+    'get_severity': 'ingest',
+    'get_area_casualties': 'spatial',
+    'MAPBOX_API_KEY_PATH': 'maps',
+    'mapbox_api_key': 'maps',
+    'get_tooltip': 'maps',
+    'make_map': 'maps',
+    'get_size': 'plotting',
+    'spaces_to_breaks': 'plotting',
+}
+
+def __getattr__(name):
+    # The key and session used to be module constants, so they are still served as attributes
+    if name == 'MAPBOX_API_KEY':
+        return import_module(f'{__name__}.maps').mapbox_api_key()
+    if name == 'session':
+        return import_module(f'{__name__}.ingest').get_session()
+    if name in _SUBMODULES:
+        value = getattr(import_module(f'{__name__}.{_SUBMODULES[name]}'), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + list(_SUBMODULES) + ['MAPBOX_API_KEY', 'session'])
@@ -0,0 +1,176 @@
+'''
+This module contains the functions used to download and prepare accident data in
+accident_analysis.ipynb. It imports nothing heavier than requests, and only when a
+download is made.
+'''
+
+from instrumentation import timed
+
+SEVERITY_COLUMNS = ['slight', 'serious', 'fatal', 'total', 'weighted_total']
+
+_session = None
+
+def get_session():
+    """
+    Gets the requests session shared by downloads, creating it on first use.
+
+    Returns:
+        (requests.Session): Shared session.
+    """
+    global _session
+    if _session == None:
+        from requests import Session
+        _session = Session()
+    return _session
+
+def normalise_saint(ward):
+    """
+    Normalises a ward starting with "St" so that it begins with "St."
+
+    Args:
+        ward (str): Ward in London.
+    
+    Returns:
+        (str): Ward in London with saint normalised as "St."
+    """
+    if ward[:3] == 'St ':
+        ward = 'St. ' + ward[3:]
+    return ward
+
+def list_to_path(directories):
+    """
+    Takes a list of folders and makes it into a relative path.
+
+    Args:
+        directories (list): 
+            List of strings containing the names of directories (or dots for relative path
+            structure) in the path. Each directory after the first in the list is a
+            subdirectory of the preceding directory.
+    
+    Returns:
+        (str): Relative path.
+    """
+    if directories == None:
+        return ''
+    string = ''
+    for item in directories:
+        string += item + '/'
+    return string
+
+def dict_to_filenames_list(filenames_dict):
+    '''
+    Turns a dictionary of partial filenames with multiple endings into a 
+    list of full filenames.
+
+    Args:
+        filenames_dict (dict):
+            keys (str): Partial filenames.
+            values (list): One or more strings that are found at the
+                           end of the key in the full filename.
+    
+    Returns (list): Full filenames as strings within the list.
+    '''
+    filenames_list = []
+    for filename in filenames_dict.keys():
+        for filetype in filenames_dict[filename]:
+            filenames_list.append(filename + filetype)
+    return filenames_list
+
+@timed('load.zip')
+def save_files_from_zip(url, filenames_in_zip, output_filenames = None, 
+                        zip_folders = None, output_folders = None, sha256 = None):
+    """
+    Downloads a specific file or specific files from a zip URL
+    and saves it with (a) chosen name(s).
+
+    The zip file is cached in archives.ARCHIVE_CACHE_FOLDER, so it is only downloaded
+    again if it has changed, and files already identical to their originals are left alone.
+
+    Args:
+        url (str): The URL of the zip file.
+        filenames_in_zips (str, list, or dict): The name of the files within the zip archive.
+        output_filenames (str, list, or dict, default = None): 
+            The desired filenames for the downloaded files. 
+            If None then the files keep their original names.
+        zip_folders (list, default = None): 
+            The folders that the file is found in within the zip in order.
+        output_folders (list, default = None):
+            The relative folders that the file will be saved at in order.
+        sha256 (str, default = None): SHA-256 the zip file must have. If given and the
+                                      cached zip file has it, the download is skipped.
+
+    Returns: None.
+    """
+    # Make filenames_in_zip into a list of filenames
+    if type(filenames_in_zip) == str:
+        filenames_in_zip = [filenames_in_zip]
+    elif type(filenames_in_zip) == dict:
+        filenames_in_zip = dict_to_filenames_list(filenames_in_zip)
+    elif type(filenames_in_zip) != list:
+        raise TypeError("filenames_in_zip expects str, list, or dict, "\
+                        f"got {type(filenames_in_zip)}")
+    
+    # Make output_filenames into a list of filenames
+    if output_filenames != None:
+        if type(output_filenames) == str:
+            output_filenames = [output_filenames]
+        elif type(output_filenames) == dict:
+            output_filenames = dict_to_filenames_list(output_filenames)
+        elif type(output_filenames) != list:
+            raise TypeError("output_filenames expects str, list, or dict, "\
+                            f"got {type(output_filenames)}")
+    else:
+        output_filenames = filenames_in_zip
+    
+    # Convert lists of directories to directory paths
+    zip_folder_path = list_to_path(zip_folders)
+    output_folders = list_to_path(output_folders)
+
+    if len(filenames_in_zip) != len(output_filenames):
+        raise ValueError(f"{len(filenames_in_zip)} filenames in zip requested but "\
+                         f"{len(output_filenames)} new filenames given.")
+    
+    # Extract each file straight to its new name, from one read of the cached zip file
+    from archives import fetch_archive, extract_members
+    archive = fetch_archive(url, session = get_session(), expected_sha256 = sha256)
+    extract_members(archive, {zip_folder_path + filename_in_zip: output_folders + output_filename
+                              for filename_in_zip, output_filename in zip(filenames_in_zip, output_filenames)})
+
+def casualties_severities(casualties):
+    """
+    Takes a list of casualties of an accident as they are formatted in TfL's API
+    and returns a dictionary containing the counts of how many casualties that occured
+    during that accident broken down by severity.
+
+    Args:
+        casualties (list): Casualties of an accident as they are formatted in TfL's API.
+
+    Returns:
+        (dict):
+            keys (str): TfL API's accident severities.
+            values (int): Number of casualties of the corresponding severity 
+                          in the given list of casualties.
+    """
+    severities = {'Slight': 0, 'Serious': 0, 'Fatal': 0}
+    for casualty in casualties:
+        severities[casualty['severity']] += 1
+    return severities
+
+def get_severity(accident):
+    """
+    Assigns severity based on casualty counts, handling missing values.
+
+    Args:
+        accident (Series): Row in gdf_severities.
+
+    Returns:
+        (str): Most severe classification of the accident's casualties.
+    """
+    if accident.get('fatal', 0) > 0:
+        return 'Fatal'
+    elif accident.get('serious', 0) > 0:
+        return 'Serious'
+    elif accident.get('slight', 0) > 0:
+        return 'Slight'
+    else:
+        raise ValueError(f"Accident must have at least one casualty but accident: {accident} has none.")
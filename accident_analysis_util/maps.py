@@ -0,0 +1,176 @@
+'''
+This module contains the functions used to make folium maps of casualties in
+accident_analysis.ipynb.
+'''
+
+import os
+import numpy as np
+import shapely
+import folium
+from branca.colormap import LinearColormap
+from boundary_lod import simplify_coverage
+from instrumentation import timed
+
+MAPBOX_API_KEY_PATH = 'mapbox_api_key'
+
+_mapbox_api_key = None
+
+def mapbox_api_key(path = MAPBOX_API_KEY_PATH):
+    """
+    Reads the Mapbox API key, the first time it is needed. The MAPBOX_API_KEY environment
+    variable is used instead if it is set, so maps can be made without the key file.
+
+    Args:
+        path (str, default = MAPBOX_API_KEY_PATH): Path to the file containing the key.
+
+    Returns:
+        (str): Mapbox API key.
+    """
+    global _mapbox_api_key
+    if _mapbox_api_key == None:
+        if 'MAPBOX_API_KEY' in os.environ:
+            _mapbox_api_key = os.environ['MAPBOX_API_KEY']
+        else:
+            with open(path, 'r') as f:
+                _mapbox_api_key = f.read()
+    return _mapbox_api_key
+
+def get_tooltip(borough, column, gdf_area_casualties, borough_logos, ward = None, output_string = False,
+                value = None):
+    """
+    Gets the desired tooltip for a given borough or ward in London.
+
+    Args:
+        borough (str): London borough (of ward if ward does not equal None) or City of London.
+        column (str): Severity per capita column in gdf_area_casualties.
+        gdf_area_casualties (GeoDataFrame): gdf_borough_casualties or gdf_ward_casualties.
+        borough_logos (dict):
+            keys (str): London boroughs and City of London.
+            values (str): Image source of corresponding the borough or City of London's logo.
+        ward (str, Default = None): Ward in London or City of London.
+        output_string (bool, Default = False): True if the output should be a string instead
+                                               of a tooltip.
+        value (float, Default = None): Value of column for the ward or borough. If None then it
+                                       is looked up in gdf_area_casualties.
+
+    Returns:
+        (folium.Tooltip): Tooltip containing string with HTML code to control what is displayed
+                          when the ward or borough is hovered over in a folium map.
+    """
+    string = """<div style = "text-align: center; width: 130px;">"""
+    if ward != None:
+        if value == None:
+            value = gdf_area_casualties[(gdf_area_casualties['ward'] == ward) & 
+                                        (gdf_area_casualties['borough'] == borough)][column].iloc[0]
+        string += f"""<p style = "font-family: gill sans; font-size: 12px; """\
+            f"""font-weight: bold; white-space: wrap;">{ward.upper()}</p>"""
+    else:
+        if value == None:
+            value = gdf_area_casualties[gdf_area_casualties['borough'] == borough][column].iloc[0]
+        
+        # City of London's logo does not contain its name, so it is added when it is not used as a ward name
+        if borough == "City of London":
+            string += """<p style = "font-family: gill sans; font-size: 12px; """\
+                """font-weight: bold; white-space: wrap;">City of London</p>"""
+    
+    string += f"""<img style = "max-width: 130px; max-height: 90px" src = {borough_logos[borough]} """\
+        f"""alt="{borough} logo"><br><br><p style = "font-family: palatino; font-size: 10px; """\
+        f"""white-space: wrap;"><b>{round(value * 1000, 2)}</b> {column.split('_')[0]} casualties """\
+        f"""per 10,000 people (workday population) per year in <b>{borough}</b></p></div>"""
+    
+    # Since the value of weighted_total is an arbitrary weighting, its tooltip omits the useless value.
+    # The map's colour mapping suffices to compare areas.
+    if column == 'weighted_total_per_capita':
+        if output_string == True:
+            return string.split('<br><br>')[0] + '</div>'
+        return folium.Tooltip(string.split('<br><br>')[0] + '</div>')
+    
+    if output_string == True:
+            return string
+    return folium.Tooltip(string)
+
+@timed('plot_build.folium_map')
+def make_map(severity, gdf_area_casualties, borough_logos, tile_provider, simplify_tolerance = None,
+             smooth_factor = 1.0):
+    """
+    Makes a folium map based on the requested severity within gdf_area_casualties.
+
+    Every area is drawn by a single GeoJSON layer, with each area's colour and tooltip
+    stored as properties of its feature.
+
+    Args:
+        severity (str): Severity of accidents the map focuses on.
+        gdf_area_casualties (GeoDataFrame): gdf_borough_casualties or gdf_ward_casualties.
+        borough_logos (dict):
+            keys (str): London boroughs and City of London.
+            values (str): Image source of corresponding the borough or City of London's logo.
+        tile_provider (xyzservices.lib.TileProvider): Tile provider for map base.
+        simplify_tolerance (float, default = None): Tolerance in metres to simplify the areas'
+                                                    boundaries by before they are embedded. Shared
+                                                    boundaries are simplified once, so neighbouring
+                                                    areas don't gap. If None then they are not simplified.
+        smooth_factor (float, default = 1.0): How much Leaflet simplifies the boundaries at each
+                                              zoom level. Higher values draw faster but coarser.
+
+    Returns:
+        (folium.Map): Map based on the requested severity within gdf_area_casualties.
+    """
+    column = f'{severity}_per_capita'
+    colour_map = LinearColormap(['#B4ffbe', '#900000'],
+                                vmin = gdf_area_casualties[column].min(),
+                                vmax = gdf_area_casualties[column].max())
+    
+    if 'ward' in gdf_area_casualties and 'borough' in gdf_area_casualties:
+        wards = list(gdf_area_casualties['ward'])
+    elif 'borough' in gdf_area_casualties:
+        wards = [None] * len(gdf_area_casualties)
+    else:
+        raise ValueError(f"gdf_area_casualties must in include 'borough' column")
+
+    gdf_features = gdf_area_casualties[['geometry']].copy()
+    if simplify_tolerance != None:
+        gdf_features = simplify_coverage(gdf_features, simplify_tolerance)
+    # Coordinates beyond 5 decimal places (about 1 metre) only add size to the HTML
+    gdf_features['geometry'] = shapely.transform(np.asarray(gdf_features.geometry),
+                                                 lambda coordinates: np.round(coordinates, 5))
+
+    values = gdf_area_casualties[column].to_numpy()
+    boroughs = list(gdf_area_casualties['borough'])
+    gdf_features['fill_color'] = [colour_map(value) for value in values]
+    gdf_features['tooltip'] = [get_tooltip(boroughs[area], column, gdf_area_casualties, borough_logos,
+                                           ward = wards[area], output_string = True, value = values[area])
+                               for area in range(len(gdf_area_casualties))]
+
+    polygons = folium.GeoJson(
+        data = gdf_features,
+        style_function = lambda x: {'fillColor': x['properties']['fill_color'],
+                                    'fillOpacity': 0.5,
+                                    'weight': 0},
+        highlight_function = lambda x: {'fillColor': '#000000',
+                                        'fillOpacity': 0.75,
+                                        'weight': 0.1},
+        tooltip = folium.GeoJsonTooltip(fields = ['tooltip'], labels = False),
+        smooth_factor = smooth_factor,
+        )
+
+    map = folium.Map(
+        # Location is LSE Centre Building, but map doesn't centre on it because of its bounds.
+        # If zoom_start were to be made a higher value then location would be higher.
+        location = [51.51392455461779, -0.11641135450232364],
+        zoom_start = 10,
+        max_bounds = True,
+        tiles = tile_provider.build_url(api_key = mapbox_api_key()),
+        attr = tile_provider['attribution'],
+        name = tile_provider['name'],
+        max_zoom = tile_provider['max_zoom'],
+        min_zoom = tile_provider['min_zoom'],
+        detect_retina = True,
+        max_lat = 51.7,
+        min_lon = -.53,
+        min_lat = 51.28,
+        max_lon = .35,
+        )
+    
+    map.add_child(polygons)
+    
+    return map
@@ -0,0 +1,27 @@
+'''
+This module imports everything used in accident_analysis.ipynb at once, as the notebook
+uses all of it. Other code should import from accident_analysis_util or its submodules so
+only the dependencies it needs are loaded.
+'''
+
+import os
+from io import BytesIO
+from pickle import dump
+from tqdm.notebook import trange, tqdm
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely.geometry import Point
+from scrapy import Selector
+import xyzservices.providers as xyz
+import folium
+from branca.colormap import LinearColormap
+from plotnine import *
+from accident_analysis_util.ingest import *
+from accident_analysis_util.spatial import *
+from accident_analysis_util.maps import *
+from accident_analysis_util.plotting import *
+
+MAPBOX_API_KEY = mapbox_api_key()
+session = get_session()
@@ -0,0 +1,42 @@
+'''
+This module contains the functions used to style the plotnine plots of accidents in
+accident_analysis.ipynb.
+'''
+
+def get_size(severity):
+    """
+    Scales the point size of an accident's severity.
+
+    Args:
+        severity (str): Severity of an accident.
+
+    Returns:
+        (int): Relative scale for point sizing.
+    """
+    if severity == "Fatal":
+        return 15
+    elif severity == "Serious":
+        return 8
+    elif severity == "Slight":
+        return 1
+    else:
+        raise ValueError(f"Argument: severity equals {severity}, it must equal 'Fatal', 'Serious', or 'Slight'")
+
+def spaces_to_breaks(string):
+    '''
+    Replaces the spaces in a string into line breaks.
+
+    Args:
+        ward (str): Any string.
+    
+    Returns:
+        (str): Original string with '\n' in place of spaces.
+    '''
+    if type(string) == str:
+        new_string = ''
+        for character in string:
+            if character != ' ':
+                new_string += character
+            else:
+                new_string += '\n'
+        return new_string
@@ -0,0 +1,90 @@
+'''
+This module contains the functions used to total casualties within London's wards and
+boroughs in accident_analysis.ipynb.
+'''
+
+import pandas as pd
+import geopandas as gpd
+from accident_analysis_util.ingest import SEVERITY_COLUMNS
+from instrumentation import stage, timed
+
+@timed('aggregate.area_casualties')
+def get_area_casualties(boundaries, casualties, workday_population, severity_columns = SEVERITY_COLUMNS,
+                        denominators = None, assignment = None, return_assignment = False):
+    """
+    Creates a GeoDataFrame containing London wards or boroughs and their respective counts of 
+    casualties by severity and counts of casualties by severity per capita.
+
+    Args:
+        boundaries (GeoDataFrame): GeoDataFrame containing the boundaries and names of London
+                                   wards or boroughs.
+        casualties (GeoDataFrame): GeoDataFrame containing the number of casualties by severity
+                                   and locations of accidents.
+        workday_population (DataFrame): DataFrame containing the workday populations and names
+                                        of London wards or boroughs, along with any other
+                                        columns named in denominators.
+        severity_columns (list, default = SEVERITY_COLUMNS): Columns of casualties to total
+                                                             for each area.
+        denominators (dict, default = None):
+            keys (str): Columns of workday_population to divide the totals by.
+            values (str): Suffix of the resulting columns, e.g. 'per_capita' makes 'slight_per_capita'.
+            If None then {'workday_population': 'per_capita'}.
+        assignment (DataFrame, default = None): Area of each accident as returned by a previous
+                                                call with return_assignment = True. If None then
+                                                a spatial join is performed.
+        return_assignment (bool, default = False): True if the area of each accident should also
+                                                   be returned.
+    
+    Returns:
+        (GeoDataFrame): GeoDataFrame containing London wards or boroughs and their respective
+                        counts of casualties by severity and counts of casualties by severity
+                        per capita (by workday population).
+        (DataFrame): Only if return_assignment is True. The 'borough' (and 'ward' if the area
+                     type is ward) of each accident that falls within an area, indexed like
+                     casualties.
+    """
+    if denominators == None:
+        denominators = {'workday_population': 'per_capita'}
+
+    gdf_area_casualties = boundaries.copy()
+    if 'combined_name' in workday_population: # True if area type is ward
+        area_columns = ['borough', 'ward']
+        gdf_area_casualties['combined_name'] = gdf_area_casualties['ward'] + ', ' +\
+            gdf_area_casualties['borough']
+        on = 'combined_name'
+    else:
+        area_columns = ['borough']
+        on = 'borough'
+    
+    # Perform spatial join, unless the accidents have already been assigned to areas
+    if assignment is None:
+        with stage('spatial_join'):
+            assignment = gpd.sjoin(casualties[['geometry']], boundaries[area_columns + ['geometry']],
+                                   how = "inner", predicate = "within")[area_columns]
+    joined_data = assignment[area_columns].join(casualties[severity_columns], how = 'inner')
+    if on == 'combined_name':
+        joined_data['combined_name'] = joined_data['ward'] + ', ' + joined_data['borough']
+
+    # Group by ward and aggregate casualties
+    grouped_data = joined_data.groupby(on)[severity_columns].agg("sum")
+
+    # Merge aggregated data back to the original ward polygons
+    gdf_area_casualties = gdf_area_casualties.merge(grouped_data, on = on)
+    
+    if on == 'combined_name': # True if area type is ward
+        gdf_area_casualties = pd.merge(gdf_area_casualties, workday_population)\
+            .sort_values(['borough', 'ward']).reset_index(drop = True)\
+                .drop(columns = 'combined_name')
+    else:
+        gdf_area_casualties = pd.merge(gdf_area_casualties, workday_population)\
+            .sort_values('borough').reset_index(drop = True)  
+
+    # Divide every severity column by each denominator in one array operation
+    counts = gdf_area_casualties[severity_columns].to_numpy(dtype = float)
+    for denominator, suffix in denominators.items():
+        gdf_area_casualties[[f'{column}_{suffix}' for column in severity_columns]] =\
+            counts / gdf_area_casualties[[denominator]].to_numpy(dtype = float)
+    
+    if return_assignment:
+        return gdf_area_casualties, assignment
+    return gdf_area_casualties
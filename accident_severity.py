@@ -0,0 +1,106 @@
+'''
+This module classifies accidents by the severity of their casualties using array
+operations, in place of accident_analysis_util.casualties_severities, get_severity
+and get_size applied row by row.
+'''
+
+import numpy as np
+import pandas as pd
+
+SEVERITIES = ['Slight', 'Serious', 'Fatal']
+SEVERITY_TYPE = pd.CategoricalDtype(SEVERITIES, ordered = True)
+
+# The weighting of weighted_total is arbitrary, as in accident_analysis.ipynb
+WEIGHTS = {'slight': 1, 'serious': 15, 'fatal': 250}
+
+# Relative point sizes, as in accident_analysis_util.get_size
+POINT_SIZES = {'Slight': 1, 'Serious': 8, 'Fatal': 15}
+
+def casualty_counts(casualties, accident_ids = None):
+    """
+    Counts each accident's casualties by severity.
+
+    Args:
+        casualties (DataFrame): Casualties with 'accident_id' and 'severity' columns, as in the
+                                casualties table from tfl_ingest.flatten.
+        accident_ids (array-like, default = None): Accidents to count for, including any without
+                                                   casualties. If None then every accident with a
+                                                   casualty is counted, in order of id.
+
+    Returns:
+        (DataFrame): 'slight', 'serious', 'fatal', 'total' and 'weighted_total' columns
+                     indexed by accident id.
+    """
+    if accident_ids is None:
+        accident_ids = np.unique(casualties['accident_id'].to_numpy())
+    accident_ids = pd.Index(accident_ids, name = 'id')
+
+    positions = accident_ids.get_indexer(casualties['accident_id'])
+    codes = pd.Categorical(casualties['severity'], dtype = SEVERITY_TYPE).codes
+    if (codes < 0).any():
+        unknown = set(casualties['severity'][codes < 0])
+        raise ValueError(f"Casualty severities must be 'Slight', 'Serious', or 'Fatal', got {unknown}")
+    counted = positions >= 0
+
+    # Each (accident, severity) pair gets its own bin, so one bincount counts everything
+    counts = np.bincount(positions[counted] * len(SEVERITIES) + codes[counted],
+                         minlength = len(accident_ids) * len(SEVERITIES))\
+        .reshape(len(accident_ids), len(SEVERITIES))
+
+    df_counts = pd.DataFrame(counts, columns = ['slight', 'serious', 'fatal'], index = accident_ids)
+    df_counts['total'] = counts.sum(axis = 1)
+    df_counts['weighted_total'] = counts @ np.array([WEIGHTS['slight'], WEIGHTS['serious'], WEIGHTS['fatal']])
+    return df_counts
+
+def worst_severity(counts):
+    """
+    Gets the most severe classification of each accident's casualties.
+
+    Args:
+        counts (DataFrame): 'slight', 'serious' and 'fatal' casualty counts of accidents,
+                            e.g. from casualty_counts.
+
+    Returns:
+        (Series): Ordered categorical of 'Slight', 'Serious' or 'Fatal', indexed like counts.
+    """
+    fatal = counts['fatal'].fillna(0).to_numpy() > 0
+    serious = counts['serious'].fillna(0).to_numpy() > 0
+    slight = counts['slight'].fillna(0).to_numpy() > 0
+    no_casualties = ~(fatal | serious | slight)
+    if no_casualties.any():
+        raise ValueError(f"Accident must have at least one casualty but accidents: "\
+                         f"{list(counts.index[no_casualties][:10])} have none.")
+
+    codes = np.select([fatal, serious], [2, 1], default = 0)
+    return pd.Series(pd.Categorical.from_codes(codes, dtype = SEVERITY_TYPE), index = counts.index)
+
+def point_size(severity):
+    """
+    Scales the point size of each accident's severity.
+
+    Args:
+        severity (Series): 'Slight', 'Serious' or 'Fatal' for each accident.
+
+    Returns:
+        (Series): Relative scale for point sizing, indexed like severity.
+    """
+    sizes = severity.astype(object).map(POINT_SIZES)
+    if sizes.isna().any():
+        invalid = set(severity[sizes.isna()])
+        raise ValueError(f"Argument: severity contains {invalid}, it must equal 'Fatal', 'Serious', or 'Slight'")
+    return sizes.astype('int64')
+
+def classify(counts):
+    """
+    Adds 'Severity' and 'size' columns, as used by the points in data/gdf_points.
+
+    Args:
+        counts (DataFrame or GeoDataFrame): Accidents with 'slight', 'serious' and 'fatal' columns.
+
+    Returns:
+        (DataFrame or GeoDataFrame): Copy of counts with 'Severity' and 'size' columns.
+    """
+    classified = counts.copy()
+    classified['Severity'] = worst_severity(counts)
+    classified['size'] = point_size(classified['Severity'])
+    return classified
@@ -0,0 +1,82 @@
+'''
+This module contains the data context shared by every page of the Streamlit application.
+
+The context is created once per process, and everything in it is loaded the first time a
+page asks for it, so opening one page doesn't load the data of the others. It also holds
+what pages used to work out from the data on every rerun, such as the sorted list of
+boroughs and the wards of each borough. A new context is made whenever a file it is drawn
+from changes.
+'''
+
+import threading
+import streamlit as st
+import app_data
+from figure_cache import data_version
+
+# Files the context is drawn from
+CONTEXT_PATHS = (app_data.WARD_BOUNDARIES_PATH, app_data.WARD_CASUALTIES_PATH,
+                 app_data.BOROUGH_LOGOS_PATH, app_data.CASUALTY_CUBE_FOLDER + '/metadata.json')
+
+class AppContext:
+    """
+    Lazily loaded data shared by the pages of the Streamlit application.
+
+    Attributes:
+        boroughs (list): London boroughs and City of London, sorted.
+        wards_by_borough (dict):
+            keys (str): Boroughs.
+            values (list): Wards of the borough, in the order of the ward boundaries.
+        casualty_areas (list): 'Greater London' followed by the boroughs with casualties.
+        borough_logos (dict): Output of app_data.load_borough_logos.
+        cube (CasualtyCube): Output of app_data.load_casualty_cube, which may be None.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _get(self, name, load):
+        # Sessions run in their own threads, so the first to ask loads and the rest wait for it
+        if name not in self._values:
+            with self._lock:
+                if name not in self._values:
+                    self._values[name] = load()
+        return self._values[name]
+
+    @property
+    def boroughs(self):
+        return self._get('boroughs', lambda: list(app_data.load_ward_boundaries()['borough']
+                                                  .drop_duplicates().sort_values()))
+
+    @property
+    def wards_by_borough(self):
+        def load():
+            gdf_ward_boundaries = app_data.load_ward_boundaries()
+            return {borough: list(wards) for borough, wards in
+                    gdf_ward_boundaries.groupby('borough', sort = False)['ward']}
+        return self._get('wards_by_borough', load)
+
+    @property
+    def casualty_areas(self):
+        return self._get('casualty_areas', lambda: ['Greater London'] +
+                         list(app_data.load_ward_casualties()['borough'].drop_duplicates()))
+
+    @property
+    def borough_logos(self):
+        return self._get('borough_logos', app_data.load_borough_logos)
+
+    @property
+    def cube(self):
+        return self._get('cube', app_data.load_casualty_cube)
+
+@st.cache_resource(show_spinner = False, max_entries = 1)
+def _cached_context(version):
+    return AppContext()
+
+def get_context():
+    """
+    Gets the process-wide data context.
+
+    Returns:
+        (AppContext): Context for the current versions of the data.
+    """
+    return _cached_context(data_version(*CONTEXT_PATHS))
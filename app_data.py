@@ -0,0 +1,313 @@
+'''
+This module contains cached data loaders shared by the Streamlit applications.
+
+Loaders are wrapped in st.cache_resource so that each process holds a single copy
+of each dataset across reruns and sessions. The objects they return are shared,
+so callers must filter or copy them rather than modify them in place.
+'''
+
+import os
+from pickle import load
+import geopandas as gpd
+import streamlit as st
+import boundary_lod
+import casualty_cube
+import points_store
+from instrumentation import stage
+
+WARD_BOUNDARIES_PATH = 'boundaries/wards_2004_to_14.shp'
+BOROUGH_BOUNDARIES_PATH = 'boundaries/boroughs_1996_to_present.shp'
+POINTS_PATH = points_store.POINTS_PATH
+POINTS_BUFFER_PATH = points_store.POINTS_BUFFER_PATH
+WARD_CASUALTIES_PATH = 'data/workday_population/gdf_plot_ward_casualties.shp'
+BOROUGH_CASUALTIES_PATH = 'data/workday_population/gdf_plot_borough_casualties.shp'
+BOROUGH_LOGOS_PATH = 'data/borough_logos.pkl'
+CASUALTY_CUBE_FOLDER = casualty_cube.CASUALTY_CUBE_FOLDER
+
+# Columns dropped and renamed when boundaries are loaded, as in accident_analysis.ipynb
+BOUNDARY_COLUMNS = {
+    WARD_BOUNDARIES_PATH: (['GSS_CODE', 'HECTARES', 'NONLD_AREA', 'LB_GSS_CD', 'POLY_ID'],
+                           {'NAME': 'ward', 'BOROUGH': 'borough'}),
+    BOROUGH_BOUNDARIES_PATH: (['GSS_CODE', 'HECTARES', 'NONLD_AREA', 'ONS_INNER', 'SUB_2009', 'SUB_2006'],
+                              {'NAME': 'borough'}),
+}
+
+def shapefile_mtime(shapefile):
+    """
+    Gets the latest modification time of a shapefile's component files.
+
+    Args:
+        shapefile (str): Path to a .shp file.
+
+    Returns:
+        (float): Latest modification time of the .shp, .shx and .dbf files.
+    """
+    stem = os.path.splitext(shapefile)[0]
+    return max(os.path.getmtime(stem + extension) for extension in ['.shp', '.shx', '.dbf']
+               if os.path.exists(stem + extension))
+
+def sidecar_path(shapefile):
+    """
+    Gets the path of the reprojected GeoParquet copy of a shapefile.
+
+    Args:
+        shapefile (str): Path to a .shp file.
+
+    Returns:
+        (str): Path to the GeoParquet sidecar next to the shapefile.
+    """
+    return os.path.splitext(shapefile)[0] + '.parquet'
+
+def read_boundaries(shapefile):
+    """
+    Reads ward or borough boundaries, reprojected to EPSG:4326 with unused columns dropped.
+
+    The result is saved as a GeoParquet sidecar next to the shapefile, which is read
+    instead of the shapefile for as long as it is newer than the shapefile.
+
+    Args:
+        shapefile (str): WARD_BOUNDARIES_PATH or BOROUGH_BOUNDARIES_PATH.
+
+    Returns:
+        (GeoDataFrame): Boundaries and names of London wards or boroughs.
+    """
+    sidecar = sidecar_path(shapefile)
+    if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= shapefile_mtime(shapefile):
+        return gpd.read_parquet(sidecar)
+
+    columns_to_drop, column_names = BOUNDARY_COLUMNS[shapefile]
+    gdf_boundaries = gpd.read_file(shapefile)\
+        .set_crs(epsg = 27700).to_crs(epsg = 4326)\
+            .drop(columns = columns_to_drop)\
+                .rename(columns = column_names)
+
+    # A read-only deployment still works, it just reprojects on every cold start
+    try:
+        gdf_boundaries.to_parquet(sidecar)
+    except OSError:
+        pass
+    return gdf_boundaries
+
+@st.cache_resource(show_spinner = False)
+def _cached_boundaries(shapefile, mtime):
+    # mtime is only part of the cache key, so editing the shapefile invalidates the cache
+    with stage('load.boundaries', source = shapefile):
+        return read_boundaries(shapefile)
+
+def read_lod(source, tolerance):
+    """
+    Reads a simplified level of detail (LOD) of boundaries.
+
+    The LOD is saved by boundary_lod.py, or simplified and saved the first time it is needed
+    if it hasn't been.
+
+    Args:
+        source (str): One of LOD_SOURCES.
+        tolerance (float): One of boundary_lod.TOLERANCES.
+
+    Returns:
+        (GeoDataFrame): Boundaries in the same order and with the same columns as the source.
+    """
+    path = boundary_lod.lod_path(source, tolerance)
+    if os.path.exists(path) and os.path.getmtime(path) >= shapefile_mtime(source):
+        return gpd.read_parquet(path)
+
+    gdf_lod = boundary_lod.simplify_coverage(LOD_SOURCES[source](), tolerance)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        gdf_lod.to_parquet(path)
+    except OSError:
+        pass
+    return gdf_lod
+
+@st.cache_resource(show_spinner = False)
+def _cached_lod(source, tolerance, mtime):
+    with stage('load.lod', source = source, tolerance = tolerance):
+        return read_lod(source, tolerance)
+
+def load_ward_boundaries(tolerance = 0):
+    """
+    Gets the process-wide ward boundaries GeoDataFrame.
+
+    Args:
+        tolerance (float, default = 0): Simplification tolerance in metres, from
+                                        boundary_lod.choose_tolerance. If 0 then the
+                                        full-resolution boundaries are returned.
+
+    Returns:
+        (GeoDataFrame): Boundaries of London wards with 'ward' and 'borough' columns.
+    """
+    if tolerance > 0:
+        return _cached_lod(WARD_BOUNDARIES_PATH, tolerance, shapefile_mtime(WARD_BOUNDARIES_PATH))
+    return _cached_boundaries(WARD_BOUNDARIES_PATH, shapefile_mtime(WARD_BOUNDARIES_PATH))
+
+def load_borough_boundaries(tolerance = 0):
+    """
+    Gets the process-wide borough boundaries GeoDataFrame.
+
+    Args:
+        tolerance (float, default = 0): Simplification tolerance in metres. If 0 then the
+                                        full-resolution boundaries are returned.
+
+    Returns:
+        (GeoDataFrame): Boundaries of London boroughs with a 'borough' column.
+    """
+    if tolerance > 0:
+        return _cached_lod(BOROUGH_BOUNDARIES_PATH, tolerance, shapefile_mtime(BOROUGH_BOUNDARIES_PATH))
+    return _cached_boundaries(BOROUGH_BOUNDARIES_PATH, shapefile_mtime(BOROUGH_BOUNDARIES_PATH))
+
+@st.cache_resource(show_spinner = False)
+def _cached_points(path, mtime):
+    with stage('load.points', source = path):
+        gdf_points = points_store.read_points(path)
+        return gdf_points, points_store.build_index(gdf_points)
+
+def _points_slice(kind, key):
+    gdf_points, index = _cached_points(POINTS_PATH, os.path.getmtime(POINTS_PATH))
+    start, stop = index[kind].get(key, (0, 0))
+    return gdf_points.iloc[start:stop]
+
+def load_ward_points(borough, ward):
+    """
+    Gets the accident points within a ward.
+
+    Points are sliced from a single cached copy of data/accident_points.parquet. Until
+    points_store.py has been run, the ward's shapefile in data/gdf_points is read instead.
+
+    Args:
+        borough (str): Borough of the ward.
+        ward (str): Ward in London or City of London.
+
+    Returns:
+        (GeoDataFrame): Accident points with 'Severity' and 'size' columns.
+    """
+    if not os.path.exists(POINTS_PATH):
+        with stage('load.shapefile', source = f"{points_store.POINTS_TREE}/{borough}/{ward}.shp"):
+            return gpd.read_file(f"{points_store.POINTS_TREE}/{borough}/{ward}.shp")
+    return _points_slice('wards', (borough, ward))
+
+def load_borough_points(borough):
+    """
+    Gets the accident points within a borough.
+
+    Args:
+        borough (str): London borough or City of London.
+
+    Returns:
+        (GeoDataFrame): Accident points with 'Severity' and 'size' columns.
+    """
+    if not os.path.exists(POINTS_PATH):
+        with stage('load.shapefile', source = f"{points_store.POINTS_TREE}/boroughs/{borough}.shp"):
+            return gpd.read_file(f"{points_store.POINTS_TREE}/boroughs/{borough}.shp")
+    return _points_slice('boroughs', borough)
+
+@st.cache_resource(show_spinner = False)
+def _cached_points_buffer(path, mtime):
+    with stage('load.points_buffer', source = path):
+        return points_store.read_points_buffer(path)
+
+@st.cache_resource(show_spinner = False)
+def _cached_built_points_buffer(source):
+    with stage('load.points_buffer', source = source):
+        if source == POINTS_PATH:
+            gdf_points = points_store.read_points(POINTS_PATH)
+        else:
+            gdf_points = points_store.read_points_tree(source)
+        # A read-only deployment still works, it just builds the buffer on every cold start
+        try:
+            points_store.write_points_buffer(gdf_points, POINTS_BUFFER_PATH)
+        except OSError:
+            return points_store.points_buffer(gdf_points)
+    return points_store.read_points_buffer(POINTS_BUFFER_PATH)
+
+def load_points_buffer():
+    """
+    Gets every accident as float32 coordinates and a uint8 severity code.
+
+    The buffer is written by points_store.py, or from the points themselves the first time
+    it is needed if it hasn't been.
+
+    Returns:
+        (numpy.memmap): Structured array with 'lon', 'lat' and 'severity' fields, where
+                        severity indexes points_store.BUFFER_SEVERITIES. If the buffer can't
+                        be saved then it is an in-memory array instead.
+    """
+    if not os.path.exists(POINTS_BUFFER_PATH):
+        return _cached_built_points_buffer(POINTS_PATH if os.path.exists(POINTS_PATH) else points_store.POINTS_TREE)
+    return _cached_points_buffer(POINTS_BUFFER_PATH, os.path.getmtime(POINTS_BUFFER_PATH))
+
+@st.cache_resource(show_spinner = False)
+def _cached_shapefile(shapefile, mtime):
+    with stage('load.shapefile', source = shapefile):
+        return gpd.read_file(shapefile)
+
+def load_ward_casualties(tolerance = 0):
+    """
+    Gets the wards' casualties per 10,000 people (workday population) per year.
+
+    Args:
+        tolerance (float, default = 0): Simplification tolerance of the wards' boundaries in
+                                        metres. If 0 then they are full-resolution.
+
+    Returns:
+        (GeoDataFrame): Contents of data/workday_population/gdf_plot_ward_casualties.shp.
+    """
+    if tolerance > 0:
+        return _cached_lod(WARD_CASUALTIES_PATH, tolerance, shapefile_mtime(WARD_CASUALTIES_PATH))
+    return _cached_shapefile(WARD_CASUALTIES_PATH, shapefile_mtime(WARD_CASUALTIES_PATH))
+
+def load_borough_casualties(tolerance = 0):
+    """
+    Gets the boroughs' casualties per 10,000 people (workday population) per year.
+
+    Args:
+        tolerance (float, default = 0): Simplification tolerance of the boroughs' boundaries in
+                                        metres. If 0 then they are full-resolution.
+
+    Returns:
+        (GeoDataFrame): Contents of data/workday_population/gdf_plot_borough_casualties.shp.
+    """
+    if tolerance > 0:
+        return _cached_lod(BOROUGH_CASUALTIES_PATH, tolerance, shapefile_mtime(BOROUGH_CASUALTIES_PATH))
+    return _cached_shapefile(BOROUGH_CASUALTIES_PATH, shapefile_mtime(BOROUGH_CASUALTIES_PATH))
+
+@st.cache_resource(show_spinner = False)
+def _cached_casualty_cube(folder, mtime):
+    return casualty_cube.CasualtyCube(folder)
+
+def load_casualty_cube():
+    """
+    Gets the process-wide memory-mapped casualty cube.
+
+    Returns:
+        (CasualtyCube): Casualties by ward, year, month, weekday, hour and severity, or None
+                        if casualty_cube.py hasn't been run.
+    """
+    metadata = os.path.join(CASUALTY_CUBE_FOLDER, 'metadata.json')
+    if not os.path.exists(metadata):
+        return None
+    return _cached_casualty_cube(CASUALTY_CUBE_FOLDER, os.path.getmtime(metadata))
+
+# Uncached readers of the full-resolution boundaries that levels of detail are simplified from
+LOD_SOURCES = {
+    WARD_BOUNDARIES_PATH: lambda: read_boundaries(WARD_BOUNDARIES_PATH),
+    BOROUGH_BOUNDARIES_PATH: lambda: read_boundaries(BOROUGH_BOUNDARIES_PATH),
+    WARD_CASUALTIES_PATH: lambda: gpd.read_file(WARD_CASUALTIES_PATH),
+    BOROUGH_CASUALTIES_PATH: lambda: gpd.read_file(BOROUGH_CASUALTIES_PATH),
+}
+
+@st.cache_resource(show_spinner = False)
+def _cached_borough_logos(path, mtime):
+    with open(path, 'rb') as f:
+        return load(f)
+
+def load_borough_logos():
+    """
+    Gets the borough logos scraped in accident_analysis.ipynb.
+
+    Returns:
+        (dict):
+            keys (str): London boroughs and City of London.
+            values (str): Image source of corresponding the borough or City of London's logo.
+    """
+    return _cached_borough_logos(BOROUGH_LOGOS_PATH, os.path.getmtime(BOROUGH_LOGOS_PATH))
@@ -0,0 +1,245 @@
+'''
+This module contains the pages of the Streamlit application.
+
+Each page is a Streamlit fragment, so interacting with a page's widgets reruns only that
+page rather than the whole script. Pages take their data from the shared context in
+app_context.py. They are used by the multipage application in streamlitwebsitecombined.py
+and by the single-page applications in streamlit_applications.
+'''
+
+import pandas as pd
+import streamlit as st
+import plotly.express as px
+from app_context import get_context
+from casualty_cube import WEEKDAYS
+from app_plots import SEVERITIES, accident_locations_image, casualties_image, london_deck
+from weather_data import WEATHER_PARAMETERS
+from weather_histograms import borough_histogram
+import instrumentation
+from instrumentation import stage, timed
+
+@st.fragment
+@timed('page.accident_locations')
+def accident_locations():
+    """
+    Draws the locations of accidents in a ward, a borough, or all of London.
+    """
+    context = get_context()
+
+    if "ward_disabled" not in st.session_state:
+        st.session_state.ward_disabled = True
+
+    if "borough_disabled" not in st.session_state:
+        st.session_state.borough_disabled = True
+
+    london = st.checkbox("Display all of London")
+
+    if london == True:
+        st.session_state.borough = None
+        st.session_state.ward = None
+        st.session_state.borough_disabled = True
+        borough = st.selectbox(
+            'Borough',
+            [],  # Empty list when london is checked
+            index = None,
+            placeholder = "Select a borough",
+            disabled = st.session_state.borough_disabled,
+        )
+        ward = st.selectbox(
+            'Ward',
+            [],  # Empty list when london is checked
+            index = None,
+            placeholder = "Select a ward",
+            disabled = st.session_state.ward_disabled,
+        )
+        layer_type = st.radio('Map type', ['Points', 'Hexagons'], horizontal = True)
+        severities = st.multiselect('Severities', ['Fatal', 'Serious', 'Slight'], default = ['Fatal', 'Serious', 'Slight'])
+        deck = london_deck(severities, layer_type)
+        with stage('streamlit.pydeck_chart'):
+            st.pydeck_chart(deck)
+    else:
+        st.session_state.borough_disabled = False
+        borough = st.selectbox(
+            'Borough',
+            context.boroughs,
+            index = None,
+            placeholder = "Select a borough",
+            disabled = st.session_state.borough_disabled,
+            )
+
+        if borough != None and borough != "City of London":
+            st.session_state.ward_disabled = False
+        else:
+            st.session_state.ward_disabled = True
+
+        ward = st.selectbox(
+            'Ward',
+            context.wards_by_borough.get(borough, []),
+            index = None,
+            placeholder = "Select a ward",
+            disabled = st.session_state.ward_disabled,
+            )
+
+        if ward != None:
+            image = accident_locations_image(borough, ward)
+        elif borough != None:
+            image = accident_locations_image(borough)
+        else:
+            image = "london_accidents.png"
+        with stage('streamlit.image'):
+            st.image(image, use_column_width = borough != None)
+
+@st.fragment
+@timed('page.workday_population')
+def workday_population():
+    """
+    Draws casualties per capita (by workday population) in Greater London or a borough.
+    """
+    context = get_context()
+
+    area = st.selectbox(
+            'Select area of focus',
+            context.casualty_areas,
+            )
+
+    severity = st.radio('', SEVERITIES, horizontal = True)
+
+    # Centring the radio
+    st.markdown("""
+            <style>
+            .stRadio [role=radiogroup]{
+                align-items: center;
+                justify-content: center;
+            }
+            </style>
+        """,unsafe_allow_html=True)
+
+    # Time filters, once casualty_cube.py has been run
+    cube = context.cube
+    years = weekdays = hours = None
+    if cube != None:
+        with st.expander('Filter by time'):
+            first_year, last_year = st.slider('Years', cube.years[0], cube.years[-1],
+                                              (cube.years[0], cube.years[-1]))
+            selected_weekdays = st.multiselect('Weekdays', WEEKDAYS, default = WEEKDAYS)
+            first_hour, last_hour = st.slider('Time of day', 0, 24, (0, 24), format = '%d:00')
+        if (first_year, last_year) != (cube.years[0], cube.years[-1]):
+            years = tuple(range(first_year, last_year + 1))
+        if len(selected_weekdays) < len(WEEKDAYS):
+            weekdays = tuple(WEEKDAYS.index(weekday) for weekday in selected_weekdays)
+        if (first_hour, last_hour) != (0, 24):
+            hours = tuple(range(first_hour, last_hour))
+
+    image = casualties_image(area, severity, years, weekdays, hours)
+    with stage('streamlit.image'):
+        st.image(image, use_column_width = True)
+
+    if area != 'Greater London': # We don't think the Greater London Assembly's logo is worth displaying here as if it were a council logo
+        logo = context.borough_logos[area]
+        col1, col2, col3 = st.columns(3) # Centring image
+
+        with col1:
+            st.write(' ')
+
+        with col2:
+            st.markdown(f"<img style='max-height: 175px; max-width: 350px;' src='{logo}'>", unsafe_allow_html = True)
+
+        with col3:
+            st.write(' ')
+
+@st.fragment
+@timed('page.fatal_accident_weather')
+def fatal_accident_weather():
+    """
+    Draws the number of fatal accidents in each borough by the weather at the time.
+    """
+    # List of available weather parameters
+    available_parameters = list(WEATHER_PARAMETERS.values())
+
+    st.title('Fatal Accidents by Borough and Weather Parameter')
+
+    # Dropdown menu for selecting the weather parameter
+    selected_parameter = st.selectbox('Select Weather Parameter', available_parameters)
+
+    # Look up the precomputed counts by borough and bins of the selected weather parameter
+    with stage('filter.weather_histogram'):
+        aggregated_data = borough_histogram(selected_parameter)
+
+    # Calculate the total number of fatal accidents per borough
+    total_fatal_accidents = aggregated_data.groupby('borough')['count'].sum().reset_index(name='total_count')
+
+    # Sort boroughs by total number of fatal accidents in ascending order
+    sorted_boroughs = total_fatal_accidents.sort_values(by='total_count', ascending=True)['borough']
+
+    # Convert the borough column to a categorical type with the order based on the sorted total counts
+    aggregated_data['borough'] = pd.Categorical(aggregated_data['borough'], categories=sorted_boroughs, ordered=True)
+
+    # Create a plot using Plotly
+    with stage('plot_build', view = 'fatal_accident_weather'):
+        fig = px.bar(
+            aggregated_data,
+            x='count',
+            y='borough',
+            color=selected_parameter,
+            orientation='h',
+            category_orders={selected_parameter: list(aggregated_data[selected_parameter].cat.categories)},
+            color_discrete_sequence=px.colors.sequential.Viridis,
+            title=f'Fatal Accidents by Borough and {selected_parameter.capitalize()}'
+        )
+
+        # Update layout to make the figure larger and adjust margins
+        fig.update_layout(
+            xaxis_title='Number of Fatal Accidents',
+            yaxis_title='Borough',
+            height=800,  # Adjust height as needed
+            margin=dict(l=200, r=20, t=50, b=50)  # Adjust left margin to ensure borough names fit
+        )
+
+    # Display the plot
+    with stage('streamlit.plotly_chart'):
+        st.plotly_chart(fig)
+
+    # Add additional information about weather parameters
+    st.markdown("""
+    ### Weather Parameter Descriptions
+    - **Temperature (°C):** Air temperature at 2 meters above ground
+    - **Humidity (%):** Relative humidity at 2 meters above ground
+    - **Precipitation (mm):** Total precipitation (rain, showers, snow) sum of the preceding hour. Data is stored with a 0.1 mm precision. If precipitation data is summed up to monthly sums, there might be small inconsistencies with the total precipitation amount.
+    - **Rain (mm):** Only liquid precipitation of the preceding hour including local showers and rain from large scale systems.
+    - **Snowfall (cm):** Snowfall amount of the preceding hour in centimeters. For the water equivalent in millimeter, divide by 7. E.g. 7 cm snow = 10 mm precipitation water equivalent.
+    - **Cloud Cover (%):** Total cloud cover as an area fraction.
+    - **Wind Speed (km/h):** Wind speed at 10 meters above ground.
+    """)
+
+def _stage_table(summary):
+    return pd.DataFrame([{'stage': name, 'calls': values['calls'],
+                          'wall (s)': values['wall_seconds'], 'cpu (s)': values['cpu_seconds'],
+                          'peak RSS (MB)': values['peak_rss_bytes'] / 2 ** 20}
+                         for name, values in summary.items()])
+
+@st.fragment
+def diagnostics():
+    """
+    Shows how long each stage of the application has taken, for this session and for the
+    whole process.
+    """
+    st.title('Diagnostics')
+    if not instrumentation.ENABLED:
+        st.write('Instrumentation is turned off (INSTRUMENTATION=0).')
+        return
+    st.button('Refresh')
+
+    session_records = instrumentation.records(instrumentation.session_id())
+    st.header('This session')
+    st.dataframe(_stage_table(instrumentation.summarise(session_records)), hide_index = True)
+
+    st.header('Process')
+    st.write(f"Peak RSS: {(instrumentation.peak_rss() or 0) / 2 ** 20:.1f} MB")
+    st.dataframe(_stage_table(instrumentation.summarise(instrumentation.records())), hide_index = True)
+
+    st.header('Recent stages')
+    st.dataframe(pd.DataFrame(instrumentation.records()[::-1][:200]), hide_index = True)
+    if instrumentation.LOG_PATH != '':
+        st.write(f"Every stage is logged to {instrumentation.LOG_PATH}.")
+    else:
+        st.write("Set INSTRUMENTATION_LOG to log every stage to a file.")
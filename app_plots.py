@@ -0,0 +1,363 @@
+'''
+This module contains the plots drawn by the Streamlit applications. Plotnine plots are
+rendered through figure_cache, so each view is only drawn once per data version, and the
+all-London map is an interactive pydeck (WebGL) map of accidents counted in small density
+bins, so the browser is sent a bounded number of bins rather than every accident.
+
+Run in command line (in main project directory) to render every view ahead of time:
+python app_plots.py
+'''
+
+import argparse
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+from plotnine import *
+import app_data
+import boundary_lod
+import density_bins
+import figure_cache
+import points_store
+from instrumentation import stage
+
+SEVERITIES = ('Weighted total', 'Total', 'Slight', 'Serious', 'Fatal')
+
+# Colours match scale_fill_manual in ward_plot and borough_plot
+SEVERITY_COLOURS = {'Slight': [0, 128, 0], 'Serious': [255, 165, 0], 'Fatal': [255, 0, 0]}
+SEVERITY_RADII = {'Slight': 15, 'Serious': 40, 'Fatal': 80} # Metres
+LONDON_VIEW = pdk.ViewState(latitude = 51.5, longitude = -0.12, zoom = 9.3)
+# Density bin level of the London map, whose bins (about 95 m across in London) are
+# smaller than a pixel at LONDON_VIEW's zoom
+LONDON_BIN_LEVEL = 13
+
+def blank_theme():
+    """
+    Makes the theme shared by every map, without gridlines or axes.
+
+    Returns:
+        (plotnine.themes.theme): theme_minimal with gridlines, axis titles and axis text removed.
+    """
+    return theme_minimal() + theme(
+        panel_grid_major = element_blank(),
+        panel_grid_minor = element_blank(),
+        axis_title = element_blank(),
+        axis_text = element_blank(),
+        )
+
+def ward_plot(ward_boundary, gdf_plot):
+    """
+    Plots the accidents within a ward.
+
+    Args:
+        ward_boundary (GeoDataFrame): Boundary of the ward.
+        gdf_plot (GeoDataFrame): Accident points within the ward.
+
+    Returns:
+        (ggplot): Plot of the ward's accidents coloured by severity.
+    """
+    if 'Fatal' in list(gdf_plot['Severity'].drop_duplicates()): # 122 wards have no fatal accidents
+        fill_values = ['red', 'orange', 'green']
+        max_point_size = 2.5
+    else:
+        fill_values = ['orange', 'green']
+        max_point_size = 1.66
+
+    return (
+        ggplot()
+        + geom_map(ward_boundary, fill = '#E6e6e6', alpha = 0.5, size = 0)
+        + geom_point(gdf_plot, aes(x = "geometry.x", y = "geometry.y", fill = 'Severity', size = "size"), stroke = 0)
+        + scale_size_radius(range = (0.7, max_point_size))
+        + scale_fill_manual(values = fill_values)
+        + guides(size = False)
+        + blank_theme()
+    )
+
+def borough_plot(borough_boundaries, gdf_plot):
+    """
+    Plots the accidents within a borough.
+
+    Args:
+        borough_boundaries (GeoDataFrame): Boundaries of the borough's wards.
+        gdf_plot (GeoDataFrame): Accident points within the borough.
+
+    Returns:
+        (ggplot): Plot of the borough's accidents coloured by severity.
+    """
+    return (
+        ggplot()
+        + geom_map(borough_boundaries, fill = '#E6e6e6', alpha = 0.5, size = 0.1)
+        + geom_point(gdf_plot, aes(x = "geometry.x", y = "geometry.y", fill = 'Severity', size = "size"), stroke = 0)
+        + scale_size_radius(range = (0.7, 3))
+        + scale_fill_manual(values = ['red', 'orange', 'green'])
+        + guides(size = False)
+        + blank_theme()
+    )
+
+def severity_column(severity):
+    """
+    Gets the column of the workday population shapefiles that holds a severity.
+
+    Args:
+        severity (str): One of SEVERITIES.
+
+    Returns:
+        (str): Column name.
+    """
+    if severity != 'Weighted total':
+        return severity.lower()
+    return 'weighted'
+
+def casualties_plot(gdf_plot, severity, area):
+    """
+    Plots casualties per 10,000 people (workday population) per year as a choropleth.
+
+    Args:
+        gdf_plot (GeoDataFrame): Boroughs' casualties if area is 'Greater London', otherwise
+                                 the casualties of the wards within the area.
+        severity (str): One of SEVERITIES.
+        area (str): 'Greater London' or a London borough.
+
+    Returns:
+        (ggplot): Choropleth of the area.
+    """
+    if area == 'Greater London':
+        label = None # Too many boroughs to plot titles without it being extremely cluttered
+    else:
+        centroids = gdf_plot.geometry.centroid
+        label = geom_label(
+            aes(x = centroids.x, y = centroids.y, label = 'ward'),
+            family = "gill sans",
+            label_size = 0.2,
+            label_padding = 0.1,
+            alpha = 0.75,
+            boxcolor = 'white',
+            size = 7,
+            )
+
+    return (
+        ggplot(gdf_plot)
+        + geom_map(aes(fill = severity_column(severity)), alpha = 0.5, size = 0.1)
+        + scale_fill_gradient(low = "#B4ffbe", high = '#900000')
+        + blank_theme()
+        + theme(
+            legend_title = element_blank(),
+            title = element_text(family = "gill sans"),
+            legend_text = element_text(family = 'gill sans'),
+            )
+        + label
+        + labs(title = f"{severity} casualties by ward per 10,000 people (workday population) per year in {area}")
+    )
+
+def accident_locations_image(borough, ward = None):
+    """
+    Gets the rendered plot of the accidents within a borough or ward.
+
+    Args:
+        borough (str): London borough or City of London.
+        ward (str, default = None): Ward within borough. If None then the whole borough is plotted.
+
+    Returns:
+        (bytes): PNG image.
+    """
+    if ward != None:
+        points_source = f"{points_store.POINTS_TREE}/{borough}/{ward}.shp"
+    else:
+        points_source = f"{points_store.POINTS_TREE}/boroughs/{borough}.shp"
+    version = figure_cache.data_version(app_data.WARD_BOUNDARIES_PATH, app_data.POINTS_PATH, points_source)
+
+    def render():
+        gdf_ward_boundaries = app_data.load_ward_boundaries()
+        with stage('filter', view = 'accident_locations'):
+            selected = gdf_ward_boundaries['borough'] == borough
+            if ward != None:
+                selected &= gdf_ward_boundaries['ward'] == ward
+            # Draw the coarsest boundaries that look the same at the size the plot is rendered
+            tolerance = boundary_lod.choose_tolerance(gdf_ward_boundaries[selected].total_bounds)
+        boundaries = app_data.load_ward_boundaries(tolerance)[selected.to_numpy()]
+        if ward != None:
+            points = app_data.load_ward_points(borough, ward)
+            with stage('plot_build', view = 'accident_locations'):
+                plot = ward_plot(boundaries, points)
+        else:
+            points = app_data.load_borough_points(borough)
+            with stage('plot_build', view = 'accident_locations'):
+                plot = borough_plot(boundaries, points)
+        with stage('draw', view = 'accident_locations'):
+            return ggplot.draw(plot)
+
+    return figure_cache.get_image(('accident_locations', borough, ward, None, version), render)
+
+def with_rates(gdf_plot, rates):
+    """
+    Replaces the casualties per capita of a workday population shapefile with rates from
+    the casualty cube.
+
+    Args:
+        gdf_plot (GeoDataFrame): Rows of data/workday_population/gdf_plot_ward_casualties.shp
+                                 or gdf_plot_borough_casualties.shp.
+        rates (DataFrame): Output of CasualtyCube.per_capita for the same area type.
+
+    Returns:
+        (GeoDataFrame): Copy of gdf_plot with the cube's rates in its severity columns.
+    """
+    on = ['borough', 'ward'] if 'ward' in rates else ['borough']
+    names = gdf_plot[on].copy()
+    if 'ward' in on: # Ward names in the shapefile have line breaks in place of spaces
+        names['ward'] = names['ward'].str.replace('\n', ' ')
+    rates = rates.set_index(pd.MultiIndex.from_frame(rates[on])).reindex(pd.MultiIndex.from_frame(names))
+
+    gdf_plot = gdf_plot.copy()
+    for severity in SEVERITIES:
+        gdf_plot[severity_column(severity)] = rates[severity.lower().replace(' ', '_')].to_numpy()
+    return gdf_plot
+
+def casualties_image(area, severity, years = None, weekdays = None, hours = None):
+    """
+    Gets the rendered choropleth of casualties per capita for Greater London or a borough.
+
+    Args:
+        area (str): 'Greater London' or a London borough.
+        severity (str): One of SEVERITIES.
+        years (tuple, default = None): Years to count, from the casualty cube. If None then
+                                       every year is counted.
+        weekdays (tuple, default = None): Weekdays (0 is Monday) to count. If None then every
+                                          weekday is counted.
+        hours (tuple, default = None): Hours (0-23) to count. If None then every hour is counted.
+
+    Returns:
+        (bytes): PNG image.
+    """
+    filtered = years != None or weekdays != None or hours != None
+    if area == 'Greater London':
+        source = app_data.BOROUGH_CASUALTIES_PATH
+    else:
+        source = app_data.WARD_CASUALTIES_PATH
+    sources = [source, source[:-len('.shp')] + '.dbf']
+    if filtered:
+        sources.append(f"{app_data.CASUALTY_CUBE_FOLDER}/metadata.json")
+    version = figure_cache.data_version(*sources)
+
+    def render():
+        if area == 'Greater London':
+            gdf_plot = app_data.load_borough_casualties()
+            gdf_plot = app_data.load_borough_casualties(boundary_lod.choose_tolerance(gdf_plot.total_bounds))
+        else:
+            gdf_plot = app_data.load_ward_casualties()
+            with stage('filter', view = 'workday_population'):
+                selected = (gdf_plot['borough'] == area).to_numpy()
+                tolerance = boundary_lod.choose_tolerance(gdf_plot[selected].total_bounds)
+            gdf_plot = app_data.load_ward_casualties(tolerance)[selected]
+        if filtered:
+            with stage('aggregate', view = 'workday_population'):
+                rates = app_data.load_casualty_cube().per_capita('borough' if area == 'Greater London' else 'ward',
+                                                                 years = years, weekdays = weekdays, hours = hours)
+                gdf_plot = with_rates(gdf_plot, rates)
+        with stage('plot_build', view = 'workday_population'):
+            plot = casualties_plot(gdf_plot, severity, area)
+        with stage('draw', view = 'workday_population'):
+            return ggplot.draw(plot)
+
+    key = ('workday_population', area, None, severity, version)
+    if filtered:
+        key += (years, weekdays, hours)
+    return figure_cache.get_image(key, render)
+
+def _london_bins(buffer, codes, level = LONDON_BIN_LEVEL):
+    points = buffer[np.isin(buffer['severity'], codes)]
+    size = density_bins.cell_size(level)
+    columns, rows = density_bins.cells(*density_bins.project(points['lon'], points['lat']), size)
+    counts = pd.DataFrame({'column': columns, 'row': rows}).value_counts().rename('count').reset_index()
+    lon, lat = density_bins.unproject(*density_bins.cell_centres(counts['column'], counts['row'], size))
+    return pd.DataFrame({'lon': lon.round(5), 'lat': lat.round(5), 'count': counts['count'].to_numpy()})
+
+@lru_cache(maxsize = 32)
+def _london_deck(severities, layer_type, version):
+    buffer = app_data.load_points_buffer()
+    layers = []
+    if layer_type == 'Hexagons':
+        # Hexagons add up the counts of the bins within them, as they would the accidents
+        codes = [points_store.BUFFER_SEVERITIES.index(severity) for severity in severities]
+        layers.append(pdk.Layer(
+            'HexagonLayer',
+            data = _london_bins(buffer, codes),
+            get_position = '[lon, lat]',
+            get_elevation_weight = 'count',
+            get_color_weight = 'count',
+            elevation_aggregation = 'SUM',
+            color_aggregation = 'SUM',
+            radius = 250,
+            elevation_scale = 4,
+            extruded = True,
+            pickable = True,
+            ))
+    else:
+        # One layer per severity, drawn from least to most severe so the most severe are on top
+        for code, severity in enumerate(points_store.BUFFER_SEVERITIES):
+            if severity not in severities:
+                continue
+            bins = _london_bins(buffer, [code])
+            # A bin covers the same area as its accidents' circles would
+            bins['radius'] = (SEVERITY_RADII[severity] * np.sqrt(bins['count'])).round(1)
+            layers.append(pdk.Layer(
+                'ScatterplotLayer',
+                data = bins,
+                get_position = '[lon, lat]',
+                get_fill_color = SEVERITY_COLOURS[severity],
+                get_radius = 'radius',
+                radius_min_pixels = 1,
+                radius_max_pixels = 12,
+                opacity = 0.6,
+                ))
+    return pdk.Deck(layers = layers, initial_view_state = LONDON_VIEW)
+
+def london_deck(severities = ('Fatal', 'Serious', 'Slight'), layer_type = 'Points'):
+    """
+    Makes an interactive WebGL map of every accident in London.
+
+    Accidents are counted in density bins of LONDON_BIN_LEVEL before they are sent, so
+    the map holds tens of thousands of bins rather than hundreds of thousands of points.
+    Decks are cached, so a rerun sends Streamlit an identical chart, which browsers that
+    have already received it are not sent again.
+
+    Args:
+        severities (iterable, default = ('Fatal', 'Serious', 'Slight')): Severities to show.
+        layer_type (str, default = 'Points'): 'Points' to draw a circle for each bin's
+                                              accidents, with the area of theirs together, or
+                                              'Hexagons' to draw counts of accidents in hexagons.
+
+    Returns:
+        (pydeck.Deck): Map for st.pydeck_chart.
+    """
+    severities = tuple(severity for severity in points_store.BUFFER_SEVERITIES if severity in severities)
+    return _london_deck(severities, layer_type, figure_cache.data_version(app_data.POINTS_BUFFER_PATH))
+
+def prewarm():
+    """
+    Renders every ward, borough and choropleth view into the on-disk figure cache.
+
+    Returns:
+        (int): Number of views rendered or already cached.
+    """
+    views = 0
+    gdf_ward_boundaries = app_data.load_ward_boundaries()
+    for borough in gdf_ward_boundaries['borough'].drop_duplicates().sort_values():
+        accident_locations_image(borough)
+        views += 1
+        if borough == "City of London": # City of London's ward can't be selected in the applications
+            continue
+        for ward in gdf_ward_boundaries[gdf_ward_boundaries['borough'] == borough]['ward']:
+            accident_locations_image(borough, ward)
+            views += 1
+
+    areas = ['Greater London'] + list(app_data.load_ward_casualties()['borough'].drop_duplicates())
+    for area in areas:
+        for severity in SEVERITIES:
+            casualties_image(area, severity)
+            views += 1
+    return views
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Render every application plot into the figure cache.")
+    parser.parse_args()
+    print(f"Cached {prewarm()} views in {figure_cache.FIGURE_CACHE_FOLDER}")
@@ -0,0 +1,175 @@
+'''
+This module downloads zip archives to an on-disk cache and extracts members from them.
+
+Downloads are streamed to a partial file that is resumed if interrupted, and a cached
+archive is only downloaded again if the server reports it has changed (by ETag or
+modification date). Members are extracted concurrently from a single open archive,
+checked against their CRCs, and skipped if an identical file is already in place.
+'''
+
+import os
+import json
+import zlib
+import threading
+from hashlib import sha1, sha256
+from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+ARCHIVE_CACHE_FOLDER = 'cache/archives'
+CHUNK_SIZE = 1 << 20
+MAX_WORKERS = 4
+
+def archive_path(url, folder = ARCHIVE_CACHE_FOLDER):
+    """
+    Gets where the archive at a URL is cached.
+
+    Args:
+        url (str): URL of the archive.
+        folder (str, default = ARCHIVE_CACHE_FOLDER): Folder of cached archives.
+
+    Returns:
+        (str): Path of the cached archive. Its metadata is saved next to it with '.json' appended.
+    """
+    return os.path.join(folder, sha1(url.encode()).hexdigest()[:16] + '.zip')
+
+def file_sha256(path):
+    """
+    Hashes a file without reading it into memory at once.
+
+    Args:
+        path (str): Path of the file.
+
+    Returns:
+        (str): SHA-256 of the file's contents.
+    """
+    digest = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _read_metadata(path):
+    if not os.path.exists(path + '.json'):
+        return {}
+    with open(path + '.json') as f:
+        return json.load(f)
+
+def fetch_archive(url, folder = ARCHIVE_CACHE_FOLDER, session = None, expected_sha256 = None):
+    """
+    Downloads an archive into the cache, unless the cached copy is still current.
+
+    Args:
+        url (str): URL of the archive.
+        folder (str, default = ARCHIVE_CACHE_FOLDER): Folder of cached archives.
+        session (requests.Session, default = None): Session to download with. If None then
+                                                    a new one is used.
+        expected_sha256 (str, default = None): SHA-256 the archive must have. If given and the
+                                               cached archive has it, the server isn't contacted,
+                                               and if it doesn't, the archive is downloaded again
+                                               even if the server reports it unchanged.
+
+    Returns:
+        (str): Path of the cached archive.
+    """
+    session = session or requests.Session()
+    os.makedirs(folder, exist_ok = True)
+    path = archive_path(url, folder)
+    partial_path = path + '.part'
+    metadata = _read_metadata(path)
+
+    response = None
+    if os.path.exists(path):
+        if expected_sha256 != None and metadata.get('sha256') == expected_sha256:
+            return path
+        headers = {}
+        if metadata.get('etag') != None:
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified') != None:
+            headers['If-Modified-Since'] = metadata['last_modified']
+        if len(headers) > 0:
+            response = session.get(url, headers = headers, stream = True)
+            if response.status_code == 304:
+                response.close()
+                # An unchanged archive that isn't the expected one is downloaded again to be checked
+                if expected_sha256 == None:
+                    return path
+                response = None
+
+    # A changed archive's body comes with the revalidation, otherwise resume a partial download,
+    # as long as it is of the same version of the archive
+    if response == None:
+        headers = {}
+        partial_size = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        if partial_size > 0 and metadata.get('partial_etag') != None:
+            headers['Range'] = f'bytes={partial_size}-'
+            headers['If-Range'] = metadata['partial_etag']
+        response = session.get(url, headers = headers, stream = True)
+
+    with response:
+        response.raise_for_status()
+        etag = response.headers.get('ETag')
+        resumed = response.status_code == 206
+        metadata['partial_etag'] = etag
+        with open(path + '.json', 'w') as f:
+            json.dump(metadata, f)
+        with open(partial_path, 'ab' if resumed else 'wb') as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+        last_modified = response.headers.get('Last-Modified')
+
+    digest = file_sha256(partial_path)
+    if expected_sha256 != None and digest != expected_sha256:
+        os.remove(partial_path)
+        raise ValueError(f"Archive from {url} has SHA-256 {digest} but {expected_sha256} was expected")
+    os.replace(partial_path, path)
+    with open(path + '.json', 'w') as f:
+        json.dump({'url': url, 'etag': etag, 'last_modified': last_modified, 'sha256': digest}, f)
+    return path
+
+def _file_crc(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+def _extract_member(zip_file, member, output_path):
+    info = zip_file.getinfo(member)
+    if os.path.exists(output_path) and os.path.getsize(output_path) == info.file_size and \
+            _file_crc(output_path) == info.CRC:
+        return False
+
+    folder = os.path.dirname(output_path)
+    if folder != '':
+        os.makedirs(folder, exist_ok = True)
+    # Reading a member to the end checks its CRC, and raises BadZipFile if it doesn't match
+    temporary_path = f"{output_path}.{threading.get_ident()}.tmp"
+    with zip_file.open(info) as source, open(temporary_path, 'wb') as destination:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            destination.write(chunk)
+    os.replace(temporary_path, output_path)
+    return True
+
+def extract_members(path, members, max_workers = MAX_WORKERS):
+    """
+    Extracts members of an archive straight to their output paths.
+
+    Args:
+        path (str): Path of the archive.
+        members (dict):
+            keys (str): Paths of members within the archive.
+            values (str): Paths to save them to.
+        max_workers (int, default = MAX_WORKERS): Number of members extracted at once.
+
+    Returns:
+        (list): Output paths that were written, leaving out those already identical to their member.
+    """
+    # Threads share the one open archive, which reads through a lock, and decompress in parallel
+    with ZipFile(path) as zip_file:
+        missing = [member for member in members if member not in zip_file.NameToInfo]
+        if len(missing) > 0:
+            raise KeyError(f"{missing} not found in {path}")
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            written = executor.map(lambda member: _extract_member(zip_file, member, members[member]), members)
+            return [members[member] for member, was_written in zip(members, list(written)) if was_written]
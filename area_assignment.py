@@ -0,0 +1,207 @@
+'''
+This module keeps a persistent record of which ward and borough each accident falls in,
+keyed by TfL's accident id, so that spatial joins are only performed for new accidents.
+
+Each accident is stored with the ward and borough it lies within (missing if it lies
+outside every ward) and the nearest ward and borough, which is the fallback used for the
+points in data/gdf_points.
+
+The spatial index of the ward boundaries is kept in memory for each version of the
+boundaries rather than saved, since a shapely STRtree is pickled as its geometries and
+rebuilt when loaded, which costs as much as building it from the boundaries.
+'''
+
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from shapely import STRtree
+
+ASSIGNMENT_PATH = 'data/accident_areas.parquet'
+ASSIGNMENT_COLUMNS = ['ward', 'borough', 'nearest_ward', 'nearest_borough']
+
+_trees = {} # Trees built by tree_for, by boundaries_version
+
+def boundaries_version(gdf_ward_boundaries):
+    """
+    Makes an identifier of a set of ward boundaries, so a stored assignment made against
+    different boundaries can be detected.
+
+    Args:
+        gdf_ward_boundaries (GeoDataFrame): Boundaries of London wards with 'ward' and 'borough' columns.
+
+    Returns:
+        (str): Hash of the wards' names and geometries.
+    """
+    hashes = pd.util.hash_pandas_object(gdf_ward_boundaries[['ward', 'borough']], index = False)
+    geometry_hashes = pd.util.hash_array(shapely.to_wkb(np.asarray(gdf_ward_boundaries.geometry)))
+    return f"{int(hashes.sum()) ^ int(geometry_hashes.sum()):x}"
+
+def build_tree(gdf_ward_boundaries):
+    """
+    Builds a spatial index of ward boundaries.
+
+    Args:
+        gdf_ward_boundaries (GeoDataFrame): Boundaries of London wards.
+
+    Returns:
+        (shapely.STRtree): Tree of the ward polygons, in the order of gdf_ward_boundaries.
+    """
+    return STRtree(np.asarray(gdf_ward_boundaries.geometry))
+
+def tree_for(gdf_ward_boundaries, version = None):
+    """
+    Gets the spatial index of ward boundaries, building it once per process for each
+    version of the boundaries.
+
+    Args:
+        gdf_ward_boundaries (GeoDataFrame): Boundaries of London wards.
+        version (str, default = None): boundaries_version of the boundaries. If None then
+                                       it is worked out.
+
+    Returns:
+        (shapely.STRtree): Output of build_tree.
+    """
+    if version == None:
+        version = boundaries_version(gdf_ward_boundaries)
+    if version not in _trees:
+        _trees[version] = build_tree(gdf_ward_boundaries)
+    return _trees[version]
+
+def assign_areas(accidents, gdf_ward_boundaries, tree = None):
+    """
+    Finds the ward and borough each accident lies within, and its nearest ward and borough.
+
+    Args:
+        accidents (DataFrame): Accidents with 'id', 'lat' and 'lon' columns, as in TfL's API.
+        gdf_ward_boundaries (GeoDataFrame): Boundaries of London wards with 'ward' and 'borough'
+                                            columns, in EPSG:4326.
+        tree (shapely.STRtree, default = None): Tree from build_tree(gdf_ward_boundaries).
+                                                If None then it is built.
+
+    Returns:
+        (DataFrame): ASSIGNMENT_COLUMNS indexed by accident id. Accidents without a usable
+                     location have no nearest ward or borough either.
+    """
+    if tree is None:
+        tree = build_tree(gdf_ward_boundaries)
+    points = shapely.points(accidents['lon'].to_numpy(dtype = float), accidents['lat'].to_numpy(dtype = float))
+    wards = gdf_ward_boundaries['ward'].to_numpy()
+    boroughs = gdf_ward_boundaries['borough'].to_numpy()
+
+    # Wards don't overlap, but if slivers in the boundaries make a point match more than
+    # one ward, keep its first match so every accident is counted once
+    point_index, ward_index = tree.query(points, predicate = 'within')
+    point_index, first = np.unique(point_index, return_index = True)
+    within = np.full(len(points), -1)
+    within[point_index] = ward_index[first]
+
+    # Empty or NaN points aren't returned by either query, so they keep -1 and get no ward
+    point_index, ward_index = tree.query_nearest(points)
+    point_index, first = np.unique(point_index, return_index = True)
+    nearest = np.full(len(points), -1)
+    nearest[point_index] = ward_index[first]
+
+    assignment = pd.DataFrame({
+        'ward': np.where(within >= 0, wards[within], None),
+        'borough': np.where(within >= 0, boroughs[within], None),
+        'nearest_ward': np.where(nearest >= 0, wards[nearest], None),
+        'nearest_borough': np.where(nearest >= 0, boroughs[nearest], None),
+        }, index = pd.Index(accidents['id'].to_numpy(), name = 'id'))
+    return assignment
+
+def read_assignment(path = ASSIGNMENT_PATH):
+    """
+    Reads a stored assignment.
+
+    Args:
+        path (str, default = ASSIGNMENT_PATH): Parquet file written by write_assignment.
+
+    Returns:
+        (DataFrame): ASSIGNMENT_COLUMNS indexed by accident id.
+        (str): Version of the ward boundaries the assignment was made against.
+    """
+    table = pq.read_table(path)
+    version = (table.schema.metadata or {}).get(b'boundaries_version', b'').decode()
+    return table.to_pandas(), version
+
+def write_assignment(assignment, version, path = ASSIGNMENT_PATH):
+    """
+    Saves an assignment along with the version of the ward boundaries it was made against.
+
+    Args:
+        assignment (DataFrame): ASSIGNMENT_COLUMNS indexed by accident id.
+        version (str): boundaries_version of the ward boundaries.
+        path (str, default = ASSIGNMENT_PATH): Output Parquet file.
+
+    Returns: None.
+    """
+    assignment = assignment.sort_index()
+    for column in ASSIGNMENT_COLUMNS:
+        assignment[column] = assignment[column].astype('category')
+    table = pa.Table.from_pandas(assignment)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           b'boundaries_version': version.encode()})
+    pq.write_table(table, path)
+
+def update_assignment(accidents, gdf_ward_boundaries, path = ASSIGNMENT_PATH):
+    """
+    Adds any accidents that aren't yet in the stored assignment, and saves it.
+
+    Only accidents whose ids are not already stored are spatially joined, unless the ward
+    boundaries have changed since the assignment was stored, in which case every accident
+    is joined again.
+
+    Args:
+        accidents (DataFrame): Accidents with 'id', 'lat' and 'lon' columns, as in TfL's API.
+        gdf_ward_boundaries (GeoDataFrame): Boundaries of London wards with 'ward' and 'borough'
+                                            columns, in EPSG:4326.
+        path (str, default = ASSIGNMENT_PATH): Parquet file of the stored assignment.
+
+    Returns:
+        (DataFrame): ASSIGNMENT_COLUMNS indexed by accident id, for every stored accident.
+    """
+    version = boundaries_version(gdf_ward_boundaries)
+    if os.path.exists(path):
+        assignment, stored_version = read_assignment(path)
+        if stored_version != version:
+            assignment = assignment.iloc[:0]
+    else:
+        assignment = pd.DataFrame(columns = ASSIGNMENT_COLUMNS, index = pd.Index([], name = 'id'))
+
+    new_accidents = accidents[~accidents['id'].isin(assignment.index)].drop_duplicates('id')
+    if len(new_accidents) == 0:
+        return assignment
+
+    new_assignment = assign_areas(new_accidents, gdf_ward_boundaries, tree_for(gdf_ward_boundaries, version))
+    if len(assignment) > 0:
+        assignment = pd.concat([assignment.astype(object), new_assignment])
+    else:
+        assignment = new_assignment
+    write_assignment(assignment, version, path)
+    return assignment
+
+def assignment_for(assignment, accident_ids, nearest = False):
+    """
+    Lines up a stored assignment with a set of accidents, for get_area_casualties.
+
+    Args:
+        assignment (DataFrame): ASSIGNMENT_COLUMNS indexed by accident id.
+        accident_ids (Series): Accident ids, indexed like the accidents they belong to.
+        nearest (bool, default = False): True if accidents should be assigned to their
+                                         nearest ward rather than the ward they lie within.
+
+    Returns:
+        (DataFrame): 'ward' and 'borough' columns indexed like accident_ids, without the
+                     accidents that aren't in any ward.
+    """
+    if nearest:
+        columns = {'nearest_ward': 'ward', 'nearest_borough': 'borough'}
+    else:
+        columns = {'ward': 'ward', 'borough': 'borough'}
+    areas = assignment[list(columns)].rename(columns = columns).astype(object)
+    areas = areas.reindex(accident_ids.to_numpy())
+    areas.index = accident_ids.index
+    return areas.dropna()
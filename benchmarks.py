@@ -0,0 +1,418 @@
+'''
+This module benchmarks the hot paths of the Streamlit applications and the build pipeline
+against the checked-in data, and saves the results of each commit so regressions show up
+when two commits are compared.
+
+Each benchmark has an untimed setup, which loads its inputs, and a timed body that is run
+a number of times. Results are saved to benchmark_results/<commit>.json, with '-dirty'
+appended to the commit if the working tree has uncommitted changes.
+
+Run in command line (in main project directory):
+python benchmarks.py
+python benchmarks.py points maps --repeats 10
+python benchmarks.py --compare <commit>
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+RESULTS_FOLDER = 'benchmark_results'
+REPEATS = 5
+REGRESSION_RATIO = 1.2 # Slowdown of the median that counts as a regression
+SAMPLE_BOROUGH = 'Camden'
+SAMPLE_WARDS = 20 # Number of wards read by the per-ward point benchmarks
+APP_TIMEOUT = 120 # Seconds an AppTest run may take, including a cold start
+
+BENCHMARKS = {}
+
+class SkipBenchmark(Exception):
+    """
+    Raised by a benchmark's setup when the data or dependencies it needs aren't available.
+    """
+
+def benchmark(name, setup = None, repeats = None):
+    """
+    Registers a benchmark.
+
+    Args:
+        name (str): Name of the benchmark, e.g. 'points.read_ward_shapefiles'. The part before
+                    the first '.' is its group.
+        setup (function, default = None): Takes no arguments and returns the input of the
+                                          benchmark. Not timed. If None then the benchmark
+                                          takes no input.
+        repeats (int, default = None): Number of timed runs. If None then the number given to
+                                       run_benchmarks is used.
+
+    Returns:
+        (function): Decorator of a function that takes the output of setup. If it returns a
+                    number, that is taken as its duration in seconds instead of its wall time.
+    """
+    def decorator(function):
+        BENCHMARKS[name] = {'setup': setup, 'run': function, 'repeats': repeats}
+        return function
+    return decorator
+
+# Setups
+
+def _ward_boundaries():
+    import app_data
+    return app_data.read_boundaries(app_data.WARD_BOUNDARIES_PATH)
+
+def _ward_point_paths():
+    import points_store
+    paths = []
+    for borough in sorted(os.listdir(points_store.POINTS_TREE)):
+        folder = os.path.join(points_store.POINTS_TREE, borough)
+        if borough == 'boroughs' or not os.path.isdir(folder):
+            continue
+        paths += [(borough, filename[:-len('.shp')]) for filename in sorted(os.listdir(folder)) if filename.endswith('.shp')]
+    return paths[::max(1, len(paths) // SAMPLE_WARDS)][:SAMPLE_WARDS]
+
+def _area_casualties_inputs():
+    import pandas as pd
+    import points_store
+    from accident_severity import SEVERITIES, WEIGHTS
+    from build_pipeline import WARD_POPULATION_PATH
+
+    gdf_points = points_store.read_points_tree()
+    casualties = gdf_points[['geometry']].copy()
+    for severity in SEVERITIES:
+        casualties[severity.lower()] = (gdf_points['Severity'] == severity).astype(int)
+    casualties['total'] = 1
+    casualties['weighted_total'] = sum(casualties[column] * weight for column, weight in WEIGHTS.items())
+
+    boundaries = _ward_boundaries()
+    if os.path.exists(WARD_POPULATION_PATH):
+        workday_population = pd.read_csv(WARD_POPULATION_PATH)
+    else: # Populations only scale the rates, so any will do for timing
+        workday_population = boundaries[['ward', 'borough']].assign(workday_population = 1000)
+        workday_population['combined_name'] = workday_population['ward'] + ', ' + workday_population['borough']
+    if casualties.crs != boundaries.crs:
+        casualties = casualties.to_crs(boundaries.crs)
+    return boundaries, casualties, workday_population
+
+def _make_map_inputs():
+    import xyzservices.providers as xyz
+    import app_data
+    from accident_analysis_util.spatial import get_area_casualties
+
+    # Maps are only built here, not loaded from Mapbox, so any key will do
+    os.environ.setdefault('MAPBOX_API_KEY', 'benchmark')
+    gdf_area_casualties = get_area_casualties(*_area_casualties_inputs())
+    return gdf_area_casualties, app_data.load_borough_logos(), xyz.MapBox
+
+def _weather():
+    from weather_data import FATAL_WEATHER_PATH, read_weather_data
+    if not os.path.exists(FATAL_WEATHER_PATH):
+        raise SkipBenchmark(f"{FATAL_WEATHER_PATH} not found")
+    return read_weather_data(FATAL_WEATHER_PATH)
+
+def _app_test(script, timeout = APP_TIMEOUT):
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        raise SkipBenchmark("streamlit.testing is not available")
+    app = AppTest.from_file(script, default_timeout = timeout)
+    app.run() # Cold start, so the timed runs measure interactions with a warm app
+    _check_app(app)
+    return app
+
+def _check_app(app):
+    # AppTest catches a page's exceptions and shows them on the page, so a failing page would otherwise time as a fast one
+    if len(app.exception) > 0:
+        raise RuntimeError(f"The page raised {app.exception[0].value}")
+
+# Boundaries
+
+@benchmark('boundaries.read_shapefile_reproject')
+def read_shapefile_reproject(_):
+    import geopandas as gpd
+    import app_data
+    for shapefile in [app_data.WARD_BOUNDARIES_PATH, app_data.BOROUGH_BOUNDARIES_PATH]:
+        gpd.read_file(shapefile).set_crs(epsg = 27700).to_crs(epsg = 4326)
+
+@benchmark('boundaries.read_sidecar', setup = _ward_boundaries)
+def read_sidecar(_):
+    import app_data
+    app_data.read_boundaries(app_data.WARD_BOUNDARIES_PATH)
+
+# Points
+
+@benchmark('points.read_ward_shapefiles', setup = _ward_point_paths)
+def read_ward_shapefiles(wards):
+    import geopandas as gpd
+    import points_store
+    for borough, ward in wards:
+        gpd.read_file(f"{points_store.POINTS_TREE}/{borough}/{ward}.shp")
+
+def _points_store_wards():
+    import points_store
+    if not os.path.exists(points_store.POINTS_PATH):
+        raise SkipBenchmark(f"{points_store.POINTS_PATH} not found, run points_store.py")
+    return _ward_point_paths()
+
+@benchmark('points.read_ward_parquet', setup = _points_store_wards)
+def read_ward_parquet(wards):
+    import points_store
+    for borough, ward in wards:
+        points_store.read_points(borough = borough, ward = ward)
+
+# Aggregation
+
+@benchmark('spatial.get_area_casualties', setup = _area_casualties_inputs)
+def area_casualties(inputs):
+    from accident_analysis_util.spatial import get_area_casualties
+    get_area_casualties(*inputs)
+
+@benchmark('weather.groupby', setup = _weather)
+def weather_groupby(df_weather):
+    # As Fatal_accident_weather.py used to group the accidents on every rerun
+    from weather_data import WEATHER_PARAMETERS
+    for parameter in WEATHER_PARAMETERS:
+        df_weather.groupby(['borough', parameter], observed = True).size()
+
+@benchmark('weather.build_histograms', setup = _weather)
+def weather_build_histograms(df_weather):
+    from weather_histograms import build_histograms
+    build_histograms(df_weather)
+
+# Maps and plots
+
+@benchmark('maps.make_map_all_severities', setup = _make_map_inputs, repeats = 2)
+def make_map_all_severities(inputs):
+    from accident_analysis_util.ingest import SEVERITY_COLUMNS
+    from accident_analysis_util.maps import make_map
+    gdf_area_casualties, borough_logos, tile_provider = inputs
+    for severity in SEVERITY_COLUMNS:
+        # Rendering the HTML includes serialising the GeoJSON, as saving the map does
+        make_map(severity, gdf_area_casualties, borough_logos, tile_provider).get_root().render()
+
+def _render(plot):
+    from plotnine import ggplot
+    import figure_cache
+    return figure_cache.encode_figure(ggplot.draw(plot))
+
+def _ward_plot_inputs():
+    import app_data
+    gdf_ward_boundaries = app_data.load_ward_boundaries()
+    ward = gdf_ward_boundaries[gdf_ward_boundaries['borough'] == SAMPLE_BOROUGH]['ward'].iloc[0]
+    return (gdf_ward_boundaries[(gdf_ward_boundaries['borough'] == SAMPLE_BOROUGH) & (gdf_ward_boundaries['ward'] == ward)],
+            app_data.load_ward_points(SAMPLE_BOROUGH, ward))
+
+@benchmark('plots.ward_render', setup = _ward_plot_inputs)
+def ward_render(inputs):
+    from app_plots import ward_plot
+    _render(ward_plot(*inputs))
+
+def _borough_plot_inputs():
+    import app_data
+    gdf_ward_boundaries = app_data.load_ward_boundaries()
+    return (gdf_ward_boundaries[gdf_ward_boundaries['borough'] == SAMPLE_BOROUGH],
+            app_data.load_borough_points(SAMPLE_BOROUGH))
+
+@benchmark('plots.borough_render', setup = _borough_plot_inputs)
+def borough_render(inputs):
+    from app_plots import borough_plot
+    _render(borough_plot(*inputs))
+
+def _casualties_plot_inputs():
+    import app_data
+    return app_data.load_borough_casualties()
+
+@benchmark('plots.casualties_render', setup = _casualties_plot_inputs)
+def casualties_render(gdf_plot):
+    from app_plots import casualties_plot
+    _render(casualties_plot(gdf_plot, 'Total', 'Greater London'))
+
+# Imports
+
+@benchmark('imports.accident_analysis_util')
+def import_accident_analysis_util(_):
+    from import_benchmark import time_import
+    seconds, _ = time_import(repeats = 1)
+    return seconds
+
+# Streamlit pages, driven headlessly. Each run is one interaction with a warm app.
+
+def _interaction(app, widget, values):
+    # Switch to whichever value isn't selected, so each run changes the widget
+    widget.set_value([value for value in values if value != widget.value][0]).run()
+    _check_app(app)
+
+@benchmark('app.accident_locations_borough', setup = lambda: _app_test('streamlit_applications/accident_locations.py'))
+def app_accident_locations_borough(app):
+    _interaction(app, app.selectbox[0], [SAMPLE_BOROUGH, 'Hackney'])
+
+@benchmark('app.workday_population_severity', setup = lambda: _app_test('streamlit_applications/workday_population.py'))
+def app_workday_population_severity(app):
+    _interaction(app, app.radio[0], ['Fatal', 'Slight'])
+
+@benchmark('app.fatal_accident_weather_parameter', setup = lambda: _app_test('streamlit_applications/Fatal_accident_weather.py'))
+def app_fatal_accident_weather_parameter(app):
+    _interaction(app, app.selectbox[0], app.selectbox[0].options[:2])
+
+# Running and saving
+
+def run_benchmarks(names = None, repeats = REPEATS):
+    """
+    Runs benchmarks.
+
+    Args:
+        names (list, default = None): Benchmarks or groups of benchmarks to run. If None then
+                                      every benchmark is run.
+        repeats (int, default = REPEATS): Number of timed runs of each benchmark that doesn't
+                                          set its own.
+
+    Returns:
+        (dict):
+            keys (str): Benchmarks.
+            values (dict): 'median', 'min', 'mean' and 'stdev' seconds and the number of
+                           'repeats', or 'skipped' or 'error' with the reason.
+    """
+    results = {}
+    for name, spec in BENCHMARKS.items():
+        if names != None and name not in names and name.split('.')[0] not in names:
+            continue
+        try:
+            state = spec['setup']() if spec['setup'] != None else None
+            times = []
+            for _ in range(spec['repeats'] or repeats):
+                start = time.perf_counter()
+                duration = spec['run'](state)
+                times.append(duration if isinstance(duration, (int, float)) else time.perf_counter() - start)
+        except SkipBenchmark as reason:
+            results[name] = {'skipped': str(reason)}
+        except Exception as error:
+            results[name] = {'error': f"{type(error).__name__}: {error}"}
+        else:
+            results[name] = {'median': statistics.median(times), 'min': min(times), 'mean': statistics.mean(times),
+                             'stdev': statistics.stdev(times) if len(times) > 1 else 0.0, 'repeats': len(times)}
+        print(_format(name, results[name]), flush = True)
+    return results
+
+def current_commit():
+    """
+    Gets the commit the working tree is at.
+
+    Returns:
+        (str): Short commit hash, with '-dirty' appended if there are uncommitted changes,
+               or 'unknown' outside of a git repository.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True,
+                                check = True).stdout.strip()
+        changes = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output = True,
+                                 text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + '-dirty' if changes != '' else commit
+
+def save_results(results, commit = None, folder = RESULTS_FOLDER):
+    """
+    Saves benchmark results, merged into any saved earlier for the same commit.
+
+    Args:
+        results (dict): Output of run_benchmarks.
+        commit (str, default = None): Commit the results are for. If None then current_commit().
+        folder (str, default = RESULTS_FOLDER): Folder of results.
+
+    Returns:
+        (str): Path of the results file.
+    """
+    commit = commit or current_commit()
+    path = os.path.join(folder, f"{commit}.json")
+    saved = load_results(commit, folder) or {'benchmarks': {}}
+    saved.update({
+        'commit': commit,
+        'time': datetime.now(timezone.utc).isoformat(timespec = 'seconds'),
+        'python': platform.python_version(),
+        'machine': f"{platform.system()} {platform.machine()} ({os.cpu_count()} CPUs)",
+        })
+    saved['benchmarks'].update(results)
+    os.makedirs(folder, exist_ok = True)
+    with open(path, 'w') as f:
+        json.dump(saved, f, indent = 2, sort_keys = True)
+    return path
+
+def load_results(commit, folder = RESULTS_FOLDER):
+    """
+    Loads the saved benchmark results of a commit.
+
+    Args:
+        commit (str): Commit, as in the filename of its results.
+        folder (str, default = RESULTS_FOLDER): Folder of results.
+
+    Returns:
+        (dict): Saved results, or None if there are none.
+    """
+    path = os.path.join(folder, f"{commit}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def compare(baseline, results, ratio = REGRESSION_RATIO):
+    """
+    Finds benchmarks that have slowed down since a baseline.
+
+    Args:
+        baseline (dict): Benchmarks of the baseline, as in the 'benchmarks' of saved results.
+        results (dict): Benchmarks to compare with it.
+        ratio (float, default = REGRESSION_RATIO): Slowdown of the median that counts as a regression.
+
+    Returns:
+        (dict):
+            keys (str): Benchmarks run in both.
+            values (float): Median of results divided by median of baseline.
+        (list): Benchmarks that have regressed.
+    """
+    ratios = {name: results[name]['median'] / baseline[name]['median'] for name in results
+              if 'median' in results[name] and 'median' in baseline.get(name, {}) and baseline[name]['median'] > 0}
+    return ratios, [name for name, slowdown in ratios.items() if slowdown > ratio]
+
+def _format(name, result):
+    if 'skipped' in result:
+        return f"{name:45} skipped: {result['skipped']}"
+    if 'error' in result:
+        return f"{name:45} error: {result['error']}"
+    return f"{name:45} {result['median'] * 1000:10.1f} ms (min {result['min'] * 1000:.1f} ms, {result['repeats']} runs)"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Benchmark the applications' and pipeline's hot paths.")
+    parser.add_argument('names', nargs = '*', help = "Benchmarks or groups to run. Defaults to all.")
+    parser.add_argument('--repeats', type = int, default = REPEATS)
+    parser.add_argument('--compare', metavar = 'COMMIT', help = "Compare the results with a commit's saved results.")
+    parser.add_argument('--ratio', type = float, default = REGRESSION_RATIO,
+                        help = "Slowdown that counts as a regression when comparing.")
+    parser.add_argument('--list', action = 'store_true', help = "List the benchmarks.")
+    parser.add_argument('--no-save', action = 'store_true', help = "Don't save the results.")
+    args = parser.parse_args()
+
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        sys.exit()
+
+    results = run_benchmarks(args.names or None, args.repeats)
+    if not args.no_save:
+        print(f"Saved results to {save_results(results)}")
+
+    if args.compare != None:
+        baseline = load_results(args.compare)
+        if baseline == None:
+            sys.exit(f"No saved results for {args.compare} in {RESULTS_FOLDER}")
+        ratios, regressions = compare(baseline['benchmarks'], results, args.ratio)
+        for name, slowdown in ratios.items():
+            print(f"{name:45} {slowdown:6.2f}x{'  REGRESSION' if name in regressions else ''}")
+        if len(regressions) > 0:
+            sys.exit(1)
+
+    errors = [name for name, result in results.items() if 'error' in result]
+    if len(errors) > 0:
+        sys.exit(f"{len(errors)} benchmarks failed: {', '.join(errors)}")
@@ -0,0 +1,151 @@
+'''
+This module makes simplified levels of detail (LODs) of ward and borough boundaries for
+maps drawn at sizes where the full-resolution boundaries can't be seen.
+
+Boundaries are simplified through their shared arcs: every stretch of boundary between
+two neighbouring areas is simplified once and used by both, so simplified neighbours
+never gap or overlap.
+
+Run in command line (in main project directory) to save every LOD:
+python boundary_lod.py
+'''
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+LOD_FOLDER = 'boundaries/lod'
+TOLERANCES = (2, 5, 10, 20, 50) # Metres
+RENDER_WIDTH_PIXELS = 1280 # Width of a 6.4 inch plotnine figure rendered at 200 dpi
+SIMPLIFY_CRS = 27700 # British National Grid, so tolerances are in metres
+
+def shared_arcs(geometries):
+    """
+    Splits polygon boundaries into arcs that each run between two junctions.
+
+    Args:
+        geometries (array): Polygons or MultiPolygons.
+
+    Returns:
+        (array): LineStrings, each shared by at most two polygons.
+    """
+    # union_all nodes the boundaries where they meet and dissolves edges two polygons share,
+    # then line_merge joins the pieces back together between junctions
+    noded = shapely.union_all(shapely.boundary(geometries))
+    return shapely.get_parts(shapely.line_merge(noded))
+
+def simplify_coverage(gdf, tolerance):
+    """
+    Simplifies polygons that tile an area without gaps or overlaps between neighbours.
+
+    Args:
+        gdf (GeoDataFrame): Polygons, e.g. ward or borough boundaries.
+        tolerance (float): Maximum distance in metres a simplified boundary moves from the original.
+
+    Returns:
+        (GeoDataFrame): Copy of gdf with simplified geometry in the original CRS.
+    """
+    if tolerance <= 0:
+        return gdf.copy()
+    projected = gdf.to_crs(epsg = SIMPLIFY_CRS)
+    geometries = np.asarray(projected.geometry)
+
+    # Simplified arcs keep their end points, so neighbours still meet at every junction
+    arcs = shapely.simplify(shared_arcs(geometries), tolerance, preserve_topology = True)
+    faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(shapely.union_all(arcs))))
+
+    # Give each face to the area it lies within, or the nearest one for slivers
+    tree = STRtree(geometries)
+    points = shapely.point_on_surface(faces)
+    face_index, area_index = tree.query(points, predicate = 'within')
+    face_index, first = np.unique(face_index, return_index = True)
+    owners = np.full(len(faces), -1)
+    owners[face_index] = area_index[first]
+    unowned = np.flatnonzero(owners < 0)
+    if len(unowned) > 0:
+        nearest_faces, nearest_areas = tree.query_nearest(points[unowned])
+        nearest_faces, first = np.unique(nearest_faces, return_index = True)
+        owners[unowned[nearest_faces]] = nearest_areas[first]
+
+    simplified = pd.Series(list(faces)).groupby(owners).agg(lambda parts: shapely.union_all(list(parts)))
+    geometries = geometries.copy()
+    for area, geometry in simplified.items():
+        geometries[area] = geometry
+    # Areas too small to keep a face of their own are simplified on their own instead
+    lost = np.setdiff1d(np.arange(len(geometries)), simplified.index.to_numpy())
+    geometries[lost] = shapely.simplify(geometries[lost], tolerance, preserve_topology = True)
+
+    projected = projected.copy()
+    projected['geometry'] = geometries
+    return projected.to_crs(gdf.crs)
+
+def lod_path(source, tolerance, folder = LOD_FOLDER):
+    """
+    Gets where an LOD of a boundaries file is saved.
+
+    Args:
+        source (str): Path of the full-resolution shapefile.
+        tolerance (float): Simplification tolerance in metres.
+        folder (str, default = LOD_FOLDER): Folder of saved LODs.
+
+    Returns:
+        (str): Path of the GeoParquet file.
+    """
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(folder, f'{stem}_{tolerance}m.parquet')
+
+def choose_tolerance(bounds, width_pixels = RENDER_WIDTH_PIXELS, tolerances = TOLERANCES):
+    """
+    Picks the coarsest LOD that is visually lossless for a map of some bounds.
+
+    An LOD is visually lossless if no boundary moves by more than half a pixel.
+
+    Args:
+        bounds (array-like): minx, miny, maxx, maxy of the map in degrees.
+        width_pixels (int, default = RENDER_WIDTH_PIXELS): Width the map is rendered at.
+        tolerances (tuple, default = TOLERANCES): Available tolerances in metres.
+
+    Returns:
+        (float): Tolerance in metres, or 0 if only full resolution is lossless.
+    """
+    minx, miny, maxx, maxy = bounds
+    metres_per_degree = 111320 * np.cos(np.radians((miny + maxy) / 2))
+    width_metres = max((maxx - minx) * metres_per_degree, (maxy - miny) * 111320)
+    half_pixel = width_metres / width_pixels / 2
+    lossless = [tolerance for tolerance in tolerances if tolerance <= half_pixel]
+    if len(lossless) == 0:
+        return 0
+    return max(lossless)
+
+def build_lods(gdf, source, tolerances = TOLERANCES, folder = LOD_FOLDER):
+    """
+    Saves every LOD of some boundaries.
+
+    Args:
+        gdf (GeoDataFrame): Full-resolution boundaries.
+        source (str): Path of the shapefile gdf was read from, which names the LOD files.
+        tolerances (tuple, default = TOLERANCES): Tolerances in metres.
+        folder (str, default = LOD_FOLDER): Output folder.
+
+    Returns:
+        (list): Paths of the saved LODs.
+    """
+    os.makedirs(folder, exist_ok = True)
+    paths = []
+    for tolerance in tolerances:
+        path = lod_path(source, tolerance, folder)
+        simplify_coverage(gdf, tolerance).to_parquet(path)
+        paths.append(path)
+    return paths
+
+if __name__ == '__main__':
+    import app_data
+
+    parser = argparse.ArgumentParser(description = "Save simplified levels of detail of the boundaries.")
+    parser.parse_args()
+    for source, loader in app_data.LOD_SOURCES.items():
+        for path in build_lods(loader(), source):
+            print(f"Saved {path}")
@@ -0,0 +1,513 @@
+'''
+This module builds every derived data file of the project (the steps of
+accident_analysis.ipynb and accident-weather.ipynb) as stages of a dependency graph.
+
+Each stage names the files it reads and writes. A stage depends on the stages that write
+the files it reads, and it is only run again when the content hash of its inputs or of its
+outputs has changed since it last ran, so changing one input only rebuilds what depends on
+it. Stages whose dependencies are up to date run in parallel.
+
+Stages need requirements-pipeline.txt installed, on top of the applications' requirements.txt.
+
+Run in command line (in main project directory):
+python build_pipeline.py                  # Build everything
+python build_pipeline.py figures --jobs 2 # Build the figure cache and what it depends on
+python build_pipeline.py --list           # Show the stages and whether they are up to date
+'''
+
+import os
+import json
+import argparse
+import threading
+from hashlib import sha256
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import instrumentation
+
+MANIFEST_PATH = 'cache/build/manifest.json'
+MAX_WORKERS = 4
+YEARS = range(2010, 2020) # Years of accidents used throughout accident_analysis.ipynb
+
+BOUNDARIES_URL = "https://data.london.gov.uk/download/statistical-gis-boundary-files-london/"\
+    "9ba8c833-6370-4b11-abdc-314aa020d5e0/statistical-gis-boundaries-london.zip"
+WORKDAY_POPULATION_URL = "https://data.london.gov.uk/download/workday-population-by-sex-and-age--borough-and-ward/"\
+    "ea37a9f4-3204-45b3-978a-47816a9df337/workday-population-sex-age-borough-ward.xlsx"
+BOROUGH_LOGOS_URL = 'https://londonist.com/london/opinion/every-single-london-borough-logo-critiqued'
+
+WARD_SHAPEFILE = ['boundaries/wards_2004_to_14.shp', 'boundaries/wards_2004_to_14.shx',
+                  'boundaries/wards_2004_to_14.dbf']
+BOROUGH_SHAPEFILE = ['boundaries/boroughs_1996_to_present.shp', 'boundaries/boroughs_1996_to_present.shx',
+                     'boundaries/boroughs_1996_to_present.dbf']
+WARD_POPULATION_PATH = 'data/workday_population/ward_workday_population.csv'
+BOROUGH_POPULATION_PATH = 'data/workday_population/borough_workday_population.csv'
+WARD_CASUALTIES_PATH = 'data/ward_casualties.parquet'
+BOROUGH_CASUALTIES_PATH = 'data/borough_casualties.parquet'
+PLOT_CASUALTIES = ['data/workday_population/gdf_plot_ward_casualties.shp',
+                   'data/workday_population/gdf_plot_ward_casualties.dbf',
+                   'data/workday_population/gdf_plot_borough_casualties.shp',
+                   'data/workday_population/gdf_plot_borough_casualties.dbf']
+MAPS_FOLDER = 'casualties_by_workday_populations_maps'
+
+class Stage:
+    """
+    A step of the build.
+
+    Args:
+        name (str): Name of the stage.
+        run (function): Takes no arguments and writes the outputs.
+        inputs (list): Files and folders the stage reads, including its own source code.
+        outputs (list): Files and folders the stage writes.
+        params (dict, default = None): Settings that change the outputs, such as URLs.
+    """
+    def __init__(self, name, run, inputs, outputs, params = None):
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params or {}
+
+def _files(path):
+    # Every file under a folder, or just the path if it is a file
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(folder, filename) for folder, _, filenames in os.walk(path)
+                  for filename in filenames)
+
+class Hasher:
+    """
+    Hashes the contents of files, remembering each file's hash for as long as its
+    modification time and size are unchanged.
+
+    Args:
+        known (dict, default = None): Hashes remembered from a previous build.
+    """
+    def __init__(self, known = None):
+        self.known = known or {}
+        self.lock = threading.Lock()
+
+    def file(self, path):
+        """
+        Hashes the contents of a file.
+
+        Args:
+            path (str): Path of the file.
+
+        Returns:
+            (str): SHA-256 of the contents, or None if the file doesn't exist.
+        """
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        with self.lock:
+            known = self.known.get(path)
+        if known != None and known['mtime'] == stat.st_mtime and known['size'] == stat.st_size:
+            return known['hash']
+        digest = sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        with self.lock:
+            self.known[path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'hash': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def paths(self, paths):
+        """
+        Hashes files and folders together.
+
+        Args:
+            paths (list): Files and folders.
+
+        Returns:
+            (dict):
+                keys (str): Each file, including those within folders.
+                values (str): Its hash, or None if it doesn't exist.
+        """
+        return {filename: self.file(filename) for path in paths for filename in _files(path)}
+
+def stage_key(stage, hasher):
+    """
+    Makes an identifier of everything a stage's outputs are built from.
+
+    Args:
+        stage (Stage): Stage to identify.
+        hasher (Hasher): Hasher of input files.
+
+    Returns:
+        (str): Hash of the stage's name, parameters and input contents.
+    """
+    description = {'name': stage.name, 'params': stage.params, 'inputs': hasher.paths(stage.inputs)}
+    return sha256(json.dumps(description, sort_keys = True, default = str).encode()).hexdigest()
+
+def dependencies(stages):
+    """
+    Finds which stages write the files each stage reads.
+
+    Args:
+        stages (dict): Stages by name.
+
+    Returns:
+        (dict):
+            keys (str): Stage names.
+            values (set): Names of the stages it depends on.
+    """
+    def within(path, output):
+        return path == output or path.startswith(output.rstrip('/') + '/')
+
+    return {name: {other.name for other in stages.values() if other.name != name and
+                   any(within(path, output) for path in stage.inputs for output in other.outputs)}
+            for name, stage in stages.items()}
+
+def read_manifest(path = MANIFEST_PATH):
+    """
+    Reads what was built by the previous build.
+
+    Args:
+        path (str, default = MANIFEST_PATH): JSON file written by write_manifest.
+
+    Returns:
+        (dict): 'stages' (the key and output hashes of each stage) and 'hashes' (remembered file hashes).
+    """
+    if not os.path.exists(path):
+        return {'stages': {}, 'hashes': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def write_manifest(manifest, path = MANIFEST_PATH):
+    """
+    Saves what has been built, replacing the previous manifest atomically.
+
+    Args:
+        manifest (dict): Output of read_manifest, updated by build.
+        path (str, default = MANIFEST_PATH): Output JSON file.
+
+    Returns: None.
+    """
+    if os.path.dirname(path) != '':
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent = 1, sort_keys = True)
+    os.replace(path + '.tmp', path)
+
+def up_to_date(stage, manifest, hasher):
+    """
+    Checks whether a stage's outputs were built from its current inputs and haven't changed since.
+
+    Args:
+        stage (Stage): Stage to check.
+        manifest (dict): Output of read_manifest.
+        hasher (Hasher): Hasher of files.
+
+    Returns:
+        (bool): True if the stage doesn't need to run.
+    """
+    built = manifest['stages'].get(stage.name)
+    if built == None or built['key'] != stage_key(stage, hasher):
+        return False
+    outputs = hasher.paths(stage.outputs)
+    return None not in outputs.values() and outputs == built['outputs']
+
+def build(stages, targets = None, max_workers = MAX_WORKERS, force = False, manifest_path = MANIFEST_PATH):
+    """
+    Runs the stages that are out of date, in dependency order and in parallel where possible.
+
+    Args:
+        stages (dict): Stages by name, e.g. STAGES.
+        targets (list, default = None): Stages to build, along with everything they depend on.
+                                        If None then every stage is built.
+        max_workers (int, default = MAX_WORKERS): Number of stages run at once.
+        force (bool, default = False): True if the targets should run even if they are up to date.
+        manifest_path (str, default = MANIFEST_PATH): Manifest of the previous build.
+
+    Returns:
+        (dict):
+            keys (str): Stage names.
+            values (str): 'built' or 'up to date'.
+    """
+    graph = dependencies(stages)
+    selected = set()
+    pending = list(targets or stages)
+    while len(pending) > 0:
+        name = pending.pop()
+        if name not in stages:
+            raise ValueError(f"Unknown stage {name}, expected one of {sorted(stages)}")
+        if name not in selected:
+            selected.add(name)
+            pending.extend(graph[name])
+
+    manifest = read_manifest(manifest_path)
+    hasher = Hasher(manifest['hashes'])
+    statuses = {}
+    running = {}
+
+    def run(stage):
+        # Inputs are checked once dependencies have finished, so a dependency that rebuilt
+        # identical outputs doesn't cause this stage to run again
+        if not (force and (targets == None or stage.name in targets)) and up_to_date(stage, manifest, hasher):
+            return 'up to date', None
+        with instrumentation.stage(f'pipeline.{stage.name}'):
+            stage.run()
+        return 'built', {'key': stage_key(stage, hasher), 'outputs': hasher.paths(stage.outputs)}
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        while len(statuses) < len(selected):
+            for name in sorted(selected):
+                if name not in statuses and name not in running and graph[name] & selected <= set(statuses):
+                    running[name] = executor.submit(run, stages[name])
+            if len(running) == 0:
+                raise ValueError(f"Stages {sorted(selected - set(statuses))} depend on each other")
+            done, _ = wait(running.values(), return_when = FIRST_COMPLETED)
+            for name, future in list(running.items()):
+                if future in done:
+                    del running[name]
+                    # Only this thread changes the manifest, so it is saved after every stage
+                    statuses[name], built = future.result()
+                    if built != None:
+                        manifest['stages'][name] = built
+                    with hasher.lock:
+                        manifest['hashes'] = dict(hasher.known)
+                    write_manifest(manifest, manifest_path)
+                    print(f"{name}: {statuses[name]}")
+    return statuses
+
+# Stages, each of which imports what it needs when it runs so listing stages stays fast
+
+def download_boundaries():
+    from accident_analysis_util.ingest import save_files_from_zip
+    file_formats = ['.shp', '.shx', '.dbf']
+    save_files_from_zip(BOUNDARIES_URL,
+                        {'London_Ward_CityMerged': file_formats, 'London_Borough_Excluding_MHW': file_formats},
+                        output_filenames = {'wards_2004_to_14': file_formats, 'boroughs_1996_to_present': file_formats},
+                        zip_folders = ['statistical-gis-boundaries-london', 'ESRI'], output_folders = ['boundaries'])
+
+def download_workday_population():
+    from io import BytesIO
+    import pandas as pd
+    import requests
+    from accident_analysis_util.ingest import normalise_saint
+
+    response = requests.get(WORKDAY_POPULATION_URL)
+    response.raise_for_status()
+    df_areas = pd.read_excel(BytesIO(response.content), sheet_name = 'Persons')\
+        .rename(columns = {'Borough': 'borough', 'All categories: Age': 'workday_population'})
+    df_areas = df_areas[['Area', 'Area type', 'borough', 'workday_population']]
+    df_boroughs = df_areas[df_areas['Area type'] == 'Local Authority'][['Area', 'workday_population']]\
+        .rename(columns = {'Area': 'borough'})
+
+    # As in accident_analysis.ipynb, the City of London is a single ward of its own "borough"
+    df_wards = df_areas[(df_areas['Area type'] == 'Ward') & (df_areas['borough'] != 'City of London')]\
+        [['borough', 'Area', 'workday_population']].rename(columns = {'Area': 'ward'})
+    city = df_boroughs[df_boroughs['borough'] == 'City of London']
+    df_wards = pd.concat([df_wards, city.assign(ward = 'City of London')[['borough', 'ward', 'workday_population']]],
+                         ignore_index = True)
+    df_wards['ward'] = df_wards['ward'].apply(normalise_saint)
+
+    os.makedirs(os.path.dirname(WARD_POPULATION_PATH), exist_ok = True)
+    df_wards.to_csv(WARD_POPULATION_PATH, index = False)
+    df_boroughs.to_csv(BOROUGH_POPULATION_PATH, index = False)
+
+def scrape_borough_logos():
+    from pickle import dump
+    import pandas as pd
+    import requests
+    from scrapy import Selector
+
+    boroughs = list(pd.read_csv(BOROUGH_POPULATION_PATH)['borough'])
+    boroughs.remove('City of London') # City of London's logo is not found in the londonist.com article
+    borough_logos = {'City of London': 'https://upload.wikimedia.org/wikipedia/commons/c/c1/City_of_London_logo.svg'}
+    response = requests.get(BOROUGH_LOGOS_URL, headers = {'User-Agent': 'Mozilla/5.0'})
+    response.raise_for_status()
+    logo_urls = Selector(text = response.text).css('#body-block img::attr(src)').extract()
+    borough_logos.update(zip(boroughs, logo_urls))
+    with open('data/borough_logos.pkl', 'wb') as f:
+        dump(borough_logos, f)
+
+def ingest_accidents():
+    import tfl_ingest
+    tfl_ingest.ingest(YEARS)
+
+def assign_areas():
+    import area_assignment
+    import tfl_ingest
+    from app_data import read_boundaries, WARD_BOUNDARIES_PATH
+    area_assignment.update_assignment(tfl_ingest.load_tables(YEARS)['accidents'], read_boundaries(WARD_BOUNDARIES_PATH))
+
+def _casualties():
+    # Each accident's casualties by severity, as gdf_casualties in accident_analysis.ipynb
+    import geopandas as gpd
+    import tfl_ingest
+    from accident_severity import casualty_counts
+    tables = tfl_ingest.load_tables(YEARS)
+    accidents = tables['accidents']
+    counts = casualty_counts(tables['casualties'], accidents['id'])
+    return gpd.GeoDataFrame(counts.reset_index(drop = True).set_index(accidents.index),
+                            geometry = gpd.points_from_xy(accidents['lon'], accidents['lat']),
+                            crs = 4326), accidents['id']
+
+def aggregate_areas():
+    import pandas as pd
+    import area_assignment
+    from accident_analysis_util.ingest import SEVERITY_COLUMNS
+    from accident_analysis_util.spatial import get_area_casualties
+    from accident_analysis_util.plotting import spaces_to_breaks
+    from app_data import read_boundaries, WARD_BOUNDARIES_PATH, BOROUGH_BOUNDARIES_PATH
+
+    gdf_casualties, accident_ids = _casualties()
+    assignment, _ = area_assignment.read_assignment()
+    areas = area_assignment.assignment_for(assignment, accident_ids)
+    df_wards = pd.read_csv(WARD_POPULATION_PATH)
+    df_wards['combined_name'] = df_wards['ward'] + ', ' + df_wards['borough']
+    gdf_ward_casualties = get_area_casualties(read_boundaries(WARD_BOUNDARIES_PATH), gdf_casualties, df_wards,
+                                              assignment = areas)
+    gdf_borough_casualties = get_area_casualties(read_boundaries(BOROUGH_BOUNDARIES_PATH), gdf_casualties,
+                                                 pd.read_csv(BOROUGH_POPULATION_PATH), assignment = areas)
+    gdf_ward_casualties.to_parquet(WARD_CASUALTIES_PATH)
+    gdf_borough_casualties.to_parquet(BOROUGH_CASUALTIES_PATH)
+
+    # Casualties per 10,000 people per year over the 10 years, as plotted by the applications
+    per_capita_columns = [f'{column}_per_capita' for column in SEVERITY_COLUMNS]
+    for gdf_area_casualties, path in [(gdf_ward_casualties, PLOT_CASUALTIES[0]), (gdf_borough_casualties, PLOT_CASUALTIES[2])]:
+        gdf_plot = gdf_area_casualties.drop(columns = SEVERITY_COLUMNS + ['workday_population'])
+        gdf_plot[SEVERITY_COLUMNS] = gdf_plot[per_capita_columns].to_numpy() * 10000 / len(YEARS)
+        gdf_plot = gdf_plot.drop(columns = per_capita_columns).rename(columns = {'weighted_total': 'weighted'})
+        if 'ward' in gdf_plot:
+            gdf_plot['ward'] = gdf_plot['ward'].apply(spaces_to_breaks)
+        gdf_plot.to_file(path)
+
+def write_points():
+    import area_assignment
+    import points_store
+    from accident_severity import classify
+
+    gdf_casualties, accident_ids = _casualties()
+    assignment, _ = area_assignment.read_assignment()
+    # Points outside every ward belong to their nearest ward, as with sjoin_nearest in accident_analysis.ipynb
+    areas = area_assignment.assignment_for(assignment, accident_ids, nearest = True)
+    gdf_points = classify(gdf_casualties)[['Severity', 'size', 'geometry']].join(areas, how = 'inner')
+    gdf_points['Severity'] = gdf_points['Severity'].astype(str)
+    points_store.write_points(gdf_points)
+    points_store.write_points_buffer(gdf_points)
+
+def build_casualty_cube():
+    import pandas as pd
+    import area_assignment
+    import tfl_ingest
+    from casualty_cube import CasualtyCube
+    tables = tfl_ingest.load_tables(YEARS)
+    assignment, _ = area_assignment.read_assignment()
+    CasualtyCube.build(tables['accidents'], tables['casualties'], assignment,
+                       workday_population = pd.read_csv(WARD_POPULATION_PATH))
+
+def build_density_bins():
+    import density_bins
+    import tfl_ingest
+    density_bins.write_pyramid(density_bins.build_pyramid(tfl_ingest.load_tables(YEARS)['accidents']))
+
+def enrich_weather():
+    import tfl_ingest
+    import weather_enrichment
+    from weather_store import WeatherStore
+    weather_enrichment.enrich(tfl_ingest.load_tables(YEARS)['accidents'], progress = False)
+    WeatherStore.from_checkpoints()
+
+def build_daily_weather():
+    import regression_engine
+    regression_engine.write_daily_weather(YEARS)
+
+def build_boundary_lods():
+    import app_data
+    import boundary_lod
+    for source, loader in app_data.LOD_SOURCES.items():
+        boundary_lod.build_lods(loader(), source)
+
+def render_maps():
+    from pickle import load
+    import geopandas as gpd
+    import xyzservices.providers as xyz
+    from accident_analysis_util.ingest import SEVERITY_COLUMNS
+    from accident_analysis_util.maps import make_map, mapbox_api_key
+
+    with open('data/borough_logos.pkl', 'rb') as f:
+        borough_logos = load(f)
+    tile_provider = xyz.MapBox
+    tile_provider['accessToken'] = mapbox_api_key()
+    tile_provider['url'] = 'https://api.mapbox.com/styles/v1/logandaniels/clv713vet031j01pk77ujfjfz/tiles/'\
+        '{z}/{x}/{y}{r}?access_token=' + mapbox_api_key()
+    tile_provider['min_zoom'] = 10
+
+    os.makedirs(MAPS_FOLDER, exist_ok = True)
+    for area, path in [('ward', WARD_CASUALTIES_PATH), ('borough', BOROUGH_CASUALTIES_PATH)]:
+        gdf_area_casualties = gpd.read_parquet(path)
+        for severity in SEVERITY_COLUMNS:
+            make_map(severity, gdf_area_casualties, borough_logos, tile_provider)\
+                .save(f"{MAPS_FOLDER}/{severity}_casualties_by_{area}.html")
+
+def build_vector_tiles():
+    import vector_tiles
+    vector_tiles.build_mbtiles()
+
+def render_figures():
+    import app_plots
+    app_plots.prewarm()
+
+STAGES = {stage.name: stage for stage in [
+    # Downloads are keyed by their URLs rather than by this file, so editing other stages doesn't fetch them again
+    Stage('boundaries', download_boundaries, ['accident_analysis_util/ingest.py', 'archives.py'],
+          WARD_SHAPEFILE + BOROUGH_SHAPEFILE, {'url': BOUNDARIES_URL}),
+    Stage('workday_population', download_workday_population, ['accident_analysis_util/ingest.py'],
+          [WARD_POPULATION_PATH, BOROUGH_POPULATION_PATH], {'url': WORKDAY_POPULATION_URL}),
+    Stage('borough_logos', scrape_borough_logos, ['build_pipeline.py', BOROUGH_POPULATION_PATH],
+          ['data/borough_logos.pkl'], {'url': BOROUGH_LOGOS_URL}),
+    Stage('accidents', ingest_accidents, ['tfl_ingest.py', 'accident_severity.py'], ['data/tfl'], {'years': list(YEARS)}),
+    Stage('assignment', assign_areas, ['area_assignment.py', 'tfl_ingest.py', 'app_data.py', 'data/tfl'] + WARD_SHAPEFILE,
+          ['data/accident_areas.parquet'], {'years': list(YEARS)}),
+    Stage('area_casualties', aggregate_areas,
+          ['build_pipeline.py', 'accident_severity.py', 'area_assignment.py', 'tfl_ingest.py', 'app_data.py',
+           'accident_analysis_util/spatial.py', 'accident_analysis_util/ingest.py', 'accident_analysis_util/plotting.py',
+           'data/tfl', 'data/accident_areas.parquet', WARD_POPULATION_PATH, BOROUGH_POPULATION_PATH]
+          + WARD_SHAPEFILE + BOROUGH_SHAPEFILE,
+          [WARD_CASUALTIES_PATH, BOROUGH_CASUALTIES_PATH] + PLOT_CASUALTIES, {'years': list(YEARS)}),
+    Stage('points', write_points,
+          ['build_pipeline.py', 'points_store.py', 'accident_severity.py', 'area_assignment.py', 'tfl_ingest.py',
+           'data/tfl', 'data/accident_areas.parquet'],
+          ['data/accident_points.parquet', 'data/accident_points.bin'], {'years': list(YEARS)}),
+    Stage('casualty_cube', build_casualty_cube,
+          ['casualty_cube.py', 'accident_severity.py', 'area_assignment.py', 'tfl_ingest.py',
+           'data/tfl', 'data/accident_areas.parquet', WARD_POPULATION_PATH],
+          ['data/casualty_cube'], {'years': list(YEARS)}),
+    Stage('density_bins', build_density_bins, ['density_bins.py', 'accident_severity.py', 'tfl_ingest.py', 'data/tfl'],
+          ['data/density_bins.parquet'], {'years': list(YEARS)}),
+    Stage('weather', enrich_weather, ['weather_enrichment.py', 'weather_store.py', 'tfl_ingest.py', 'data/tfl'],
+          ['data/weather_store'], {'years': list(YEARS)}),
+    Stage('daily_weather', build_daily_weather, ['regression_engine.py', 'weather_enrichment.py'],
+          ['data/daily_weather.parquet'], {'years': list(YEARS)}),
+    Stage('boundary_lods', build_boundary_lods,
+          ['boundary_lod.py', 'app_data.py'] + WARD_SHAPEFILE + BOROUGH_SHAPEFILE + PLOT_CASUALTIES,
+          ['boundaries/lod']),
+    Stage('maps', render_maps,
+          ['build_pipeline.py', 'accident_analysis_util/maps.py', 'accident_analysis_util/ingest.py', 'boundary_lod.py',
+           WARD_CASUALTIES_PATH, BOROUGH_CASUALTIES_PATH, 'data/borough_logos.pkl'], [MAPS_FOLDER]),
+    Stage('vector_tiles', build_vector_tiles,
+          ['vector_tiles.py', 'density_bins.py', 'points_store.py', 'app_data.py', 'accident_severity.py',
+           'data/accident_points.parquet'] + PLOT_CASUALTIES,
+          ['data/london.mbtiles']),
+    Stage('figures', render_figures,
+          ['app_plots.py', 'figure_cache.py', 'app_data.py', 'boundary_lod.py', 'points_store.py',
+           'boundaries/lod', 'data/accident_points.parquet'] + WARD_SHAPEFILE + PLOT_CASUALTIES, ['cache/figures']),
+    ]}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Build the project's derived data files.")
+    parser.add_argument('targets', nargs = '*', help = f"Stages to build, from: {', '.join(STAGES)}")
+    parser.add_argument('--jobs', type = int, default = MAX_WORKERS, help = "Number of stages run at once")
+    parser.add_argument('--force', action = 'store_true', help = "Run the targets even if they are up to date")
+    parser.add_argument('--list', action = 'store_true', help = "Show the stages without running them")
+    args = parser.parse_args()
+
+    if args.list:
+        manifest = read_manifest()
+        hasher = Hasher(manifest['hashes'])
+        graph = dependencies(STAGES)
+        for name, stage in STAGES.items():
+            status = 'up to date' if up_to_date(stage, manifest, hasher) else 'out of date'
+            print(f"{name} ({status}) <- {', '.join(sorted(graph[name])) or 'nothing'}")
+    else:
+        build(STAGES, args.targets or None, args.jobs, args.force)
@@ -0,0 +1,200 @@
+'''
+This module contains counts of casualties by ward, year, month, weekday, hour and severity,
+held as a memory-mapped NumPy array so totals for any time filter are array sums instead
+of spatial joins and groupbys.
+
+Run in command line (in main project directory), after tfl_ingest.py:
+python casualty_cube.py --population data/ward_workday_population.csv
+where the CSV has the 'borough', 'ward' and 'workday_population' columns of df_wards in
+accident_analysis.ipynb.
+'''
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from accident_severity import SEVERITIES, SEVERITY_TYPE, WEIGHTS
+import area_assignment
+import tfl_ingest
+
+CASUALTY_CUBE_FOLDER = 'data/casualty_cube'
+TIMEZONE = 'Europe/London' # Times of day are local, as the applications show them
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+COLUMNS = ['slight', 'serious', 'fatal', 'total', 'weighted_total']
+
+def _selection(values, size, offset = 0):
+    # A contiguous selection is a slice, which indexes the memory map without copying it
+    if values is None:
+        return slice(None)
+    positions = np.unique(np.asarray(list(values), dtype = np.int64) - offset)
+    positions = positions[(positions >= 0) & (positions < size)]
+    if len(positions) > 0 and positions[-1] - positions[0] + 1 == len(positions):
+        return slice(int(positions[0]), int(positions[-1]) + 1)
+    return positions
+
+class CasualtyCube:
+    """
+    Casualty counts read from a folder written by CasualtyCube.build.
+
+    The array has shape (wards, years, months, weekdays, hours, severities), with wards
+    sorted by borough, and is memory mapped so only the parts that are summed are read.
+
+    Args:
+        folder (str, default = CASUALTY_CUBE_FOLDER): Folder containing counts.npy and metadata.json.
+    """
+    def __init__(self, folder = CASUALTY_CUBE_FOLDER):
+        with open(os.path.join(folder, 'metadata.json')) as f:
+            metadata = json.load(f)
+        self.first_year = metadata['first_year']
+        self.areas = pd.DataFrame(metadata['areas'], columns = ['borough', 'ward', 'workday_population'])\
+            .astype({'workday_population': float})
+        self.counts = np.load(os.path.join(folder, 'counts.npy'), mmap_mode = 'r')
+        self.years = list(range(self.first_year, self.first_year + self.counts.shape[1]))
+
+    @staticmethod
+    def build(accidents, casualties, assignment, folder = CASUALTY_CUBE_FOLDER, workday_population = None):
+        """
+        Counts casualties and saves them as a cube.
+
+        Args:
+            accidents (DataFrame): Accidents with 'id' and 'date' columns, as in the accidents
+                                   table from tfl_ingest.flatten.
+            casualties (DataFrame): Casualties with 'accident_id' and 'severity' columns, as in
+                                    the casualties table from tfl_ingest.flatten.
+            assignment (DataFrame): 'ward' and 'borough' of each accident indexed by accident id,
+                                    as returned by area_assignment.update_assignment. Accidents
+                                    without a ward aren't counted.
+            folder (str, default = CASUALTY_CUBE_FOLDER): Output folder.
+            workday_population (DataFrame, default = None): 'borough', 'ward' and 'workday_population'
+                                                            columns. If None then per capita rates
+                                                            can't be calculated from the cube.
+
+        Returns:
+            (CasualtyCube): The saved cube.
+        """
+        os.makedirs(folder, exist_ok = True)
+        if workday_population is None:
+            areas = assignment[['borough', 'ward']].dropna().drop_duplicates()
+            areas['workday_population'] = np.nan
+        else:
+            areas = workday_population[['borough', 'ward', 'workday_population']]
+        areas = areas.sort_values(['borough', 'ward']).reset_index(drop = True)
+
+        # Everything each casualty is counted by comes from its accident
+        accident_positions = pd.Index(accidents['id']).get_indexer(casualties['accident_id'])
+        dates = pd.DatetimeIndex(pd.to_datetime(accidents['date'], utc = True)).tz_convert(TIMEZONE)
+        wards = pd.MultiIndex.from_frame(areas[['borough', 'ward']]).get_indexer(
+            pd.MultiIndex.from_frame(assignment.reindex(accidents['id'].to_numpy())[['borough', 'ward']]))
+        first_year = int(dates.year.min())
+        severities = pd.Categorical(casualties['severity'], dtype = SEVERITY_TYPE).codes
+
+        counted = (accident_positions >= 0) & (severities >= 0)
+        counted[counted] = wards[accident_positions[counted]] >= 0
+        positions = accident_positions[counted]
+        shape = (len(areas), int(dates.year.max()) - first_year + 1, 12, len(WEEKDAYS), 24, len(SEVERITIES))
+        cells = np.ravel_multi_index((wards[positions],
+                                      dates.year.to_numpy()[positions] - first_year,
+                                      dates.month.to_numpy()[positions] - 1,
+                                      dates.dayofweek.to_numpy()[positions],
+                                      dates.hour.to_numpy()[positions],
+                                      severities[counted]), shape)
+        cells, cell_counts = np.unique(cells, return_counts = True)
+
+        dtype = np.uint16 if cell_counts.max(initial = 0) <= np.iinfo(np.uint16).max else np.uint32
+        counts = np.lib.format.open_memmap(os.path.join(folder, 'counts.npy'), mode = 'w+',
+                                           dtype = dtype, shape = shape)
+        counts[:] = 0
+        counts.reshape(-1)[cells] = cell_counts
+        counts.flush()
+        del counts
+
+        metadata = {
+            'first_year': first_year,
+            'areas': [[borough, ward, None if pd.isna(population) else float(population)]
+                      for borough, ward, population in areas.itertuples(index = False)],
+        }
+        with open(os.path.join(folder, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+        return CasualtyCube(folder)
+
+    def totals(self, area = 'ward', years = None, months = None, weekdays = None, hours = None):
+        """
+        Totals casualties by severity for each ward or borough, within a time filter.
+
+        Args:
+            area (str, default = 'ward'): 'ward' or 'borough'.
+            years (iterable, default = None): Years to count. If None then every year is counted.
+            months (iterable, default = None): Months (1-12) to count. If None then every month is counted.
+            weekdays (iterable, default = None): Weekdays (0 is Monday) to count. If None then
+                                                 every weekday is counted.
+            hours (iterable, default = None): Hours (0-23) to count. If None then every hour is counted.
+
+        Returns:
+            (DataFrame): 'borough' (and 'ward' if area is 'ward') and COLUMNS.
+        """
+        # Select and sum away the year, month, weekday and hour axes in turn, each of which is
+        # axis 1 once the axes before it are summed, leaving the ward and severity axes
+        counts = self.counts
+        for values, offset in [(years, self.first_year), (months, 1), (weekdays, 0), (hours, 0)]:
+            selection = _selection(values, counts.shape[1], offset)
+            counts = counts[:, selection].sum(axis = 1, dtype = np.int64)
+
+        areas = self.areas
+        if area == 'borough':
+            starts = np.flatnonzero(np.r_[True, areas['borough'].to_numpy()[1:] != areas['borough'].to_numpy()[:-1]])
+            counts = np.add.reduceat(counts, starts, axis = 0)
+            areas = areas.iloc[starts][['borough']].reset_index(drop = True)
+            areas['workday_population'] = self.areas.groupby('borough', sort = False)['workday_population']\
+                .sum(min_count = 1).to_numpy()
+        elif area != 'ward':
+            raise ValueError(f"area must equal 'ward' or 'borough', got {area}")
+
+        df_totals = areas.drop(columns = 'workday_population')
+        df_totals[['slight', 'serious', 'fatal']] = counts
+        df_totals['total'] = counts.sum(axis = 1)
+        df_totals['weighted_total'] = counts @ np.array([WEIGHTS['slight'], WEIGHTS['serious'], WEIGHTS['fatal']])
+        df_totals.attrs['workday_population'] = areas['workday_population'].to_numpy(dtype = float)
+        return df_totals
+
+    def per_capita(self, area = 'ward', years = None, months = None, weekdays = None, hours = None, per = 10000):
+        """
+        Gets casualties per workday population per year, within a time filter.
+
+        Args:
+            area (str, default = 'ward'): 'ward' or 'borough'.
+            years (iterable, default = None): Years to count. If None then every year is counted.
+            months (iterable, default = None): Months (1-12) to count. If None then every month is counted.
+            weekdays (iterable, default = None): Weekdays (0 is Monday) to count. If None then
+                                                 every weekday is counted.
+            hours (iterable, default = None): Hours (0-23) to count. If None then every hour is counted.
+            per (int, default = 10000): Number of people the rates are per.
+
+        Returns:
+            (DataFrame): 'borough' (and 'ward' if area is 'ward') and COLUMNS as rates.
+        """
+        df_totals = self.totals(area, years, months, weekdays, hours)
+        population = df_totals.attrs['workday_population']
+        if np.isnan(population).any():
+            raise ValueError("The cube was built without workday_population, so rates can't be calculated")
+        if years is None:
+            years_counted = len(self.years)
+        else:
+            years_counted = len(set(years) & set(self.years))
+        rates = df_totals[COLUMNS].to_numpy(dtype = float) / population[:, None] * per / max(years_counted, 1)
+        df_totals[COLUMNS] = rates
+        return df_totals
+
+if __name__ == '__main__':
+    from app_data import read_boundaries, WARD_BOUNDARIES_PATH
+
+    parser = argparse.ArgumentParser(description = "Count casualties by ward, year, month, weekday, hour and severity.")
+    parser.add_argument('--population', help = "CSV with 'borough', 'ward' and 'workday_population' columns")
+    parser.add_argument('--output', default = CASUALTY_CUBE_FOLDER)
+    args = parser.parse_args()
+
+    tables = tfl_ingest.load_tables()
+    assignment = area_assignment.update_assignment(tables['accidents'], read_boundaries(WARD_BOUNDARIES_PATH))
+    workday_population = None if args.population == None else pd.read_csv(args.population)
+    cube = CasualtyCube.build(tables['accidents'], tables['casualties'], assignment, args.output, workday_population)
+    print(f"Saved casualties of {cube.counts.shape[0]} wards over {len(cube.years)} years to {args.output}")
@@ -0,0 +1,252 @@
+'''
+This module counts accidents in hexagonal or square grid cells at several resolutions,
+by severity, year and hour, so dense areas can be drawn as a bounded number of bins
+instead of thousands of overlapping points.
+
+The counts for every resolution (a pyramid) are built once and saved, then queried by
+bounding box and zoom level.
+
+Run in command line (in main project directory), after tfl_ingest.py:
+python density_bins.py
+'''
+
+import argparse
+import numpy as np
+import pandas as pd
+from accident_severity import SEVERITIES
+import tfl_ingest
+
+DENSITY_BINS_PATH = 'data/density_bins.parquet'
+LEVELS = range(9, 17) # Web map zoom levels with their own bins
+CELLS_PER_TILE = 32 # Bins across a 256 pixel tile, so each bin is 8 pixels wide on screen
+SHAPES = ('hex', 'square')
+TIMEZONE = 'Europe/London' # Hours are local, as in casualty_cube.py and the applications
+
+HALF_WORLD = 20037508.342789244 # Half the width of the world in Web Mercator metres
+
+def project(lon, lat):
+    """
+    Converts longitudes and latitudes to Web Mercator.
+
+    Args:
+        lon (array-like): Longitudes in degrees.
+        lat (array-like): Latitudes in degrees.
+
+    Returns:
+        (tuple): Arrays of x and y in metres.
+    """
+    x = np.radians(np.asarray(lon, dtype = float)) * 6378137
+    y = np.log(np.tan(np.pi / 4 + np.radians(np.asarray(lat, dtype = float)) / 2)) * 6378137
+    return x, y
+
+def unproject(x, y):
+    """
+    Converts Web Mercator to longitudes and latitudes.
+
+    Args:
+        x (array-like): x in metres.
+        y (array-like): y in metres.
+
+    Returns:
+        (tuple): Arrays of longitudes and latitudes in degrees.
+    """
+    lon = np.degrees(np.asarray(x, dtype = float) / 6378137)
+    lat = np.degrees(2 * np.arctan(np.exp(np.asarray(y, dtype = float) / 6378137)) - np.pi / 2)
+    return lon, lat
+
+def cell_size(level):
+    """
+    Gets the width of the bins of a level.
+
+    Args:
+        level (int): Zoom level.
+
+    Returns:
+        (float): Width of a square bin, or distance between hexagon centres, in metres.
+    """
+    return 2 * HALF_WORLD / 2 ** level / CELLS_PER_TILE
+
+def cells(x, y, size, shape = 'hex'):
+    """
+    Finds the bin each point falls in.
+
+    Hexagons are pointy-topped, with columns q and rows r in axial coordinates.
+
+    Args:
+        x (array): Web Mercator x in metres.
+        y (array): Web Mercator y in metres.
+        size (float): Bin width from cell_size.
+        shape (str, default = 'hex'): 'hex' or 'square'.
+
+    Returns:
+        (tuple): Integer arrays of bin columns and rows.
+    """
+    if shape == 'square':
+        return np.floor(x / size).astype(np.int64), np.floor(y / size).astype(np.int64)
+    if shape != 'hex':
+        raise ValueError(f"shape must equal 'hex' or 'square', got {shape}")
+
+    # Convert to fractional cube coordinates and round to the nearest hexagon centre
+    radius = size / np.sqrt(3)
+    q = (np.sqrt(3) / 3 * x - y / 3) / radius
+    r = (2 / 3 * y) / radius
+    s = -q - r
+    rounded_q, rounded_r, rounded_s = np.round(q), np.round(r), np.round(s)
+    q_error, r_error, s_error = np.abs(rounded_q - q), np.abs(rounded_r - r), np.abs(rounded_s - s)
+    fix_q = (q_error > r_error) & (q_error > s_error)
+    fix_r = ~fix_q & (r_error > s_error)
+    rounded_q = np.where(fix_q, -rounded_r - rounded_s, rounded_q)
+    rounded_r = np.where(fix_r, -rounded_q - rounded_s, rounded_r)
+    return rounded_q.astype(np.int64), rounded_r.astype(np.int64)
+
+def cell_centres(columns, rows, size, shape = 'hex'):
+    """
+    Gets the centres of bins.
+
+    Args:
+        columns (array): Bin columns from cells.
+        rows (array): Bin rows from cells.
+        size (float): Bin width from cell_size.
+        shape (str, default = 'hex'): 'hex' or 'square'.
+
+    Returns:
+        (tuple): Arrays of Web Mercator x and y in metres.
+    """
+    columns = np.asarray(columns, dtype = float)
+    rows = np.asarray(rows, dtype = float)
+    if shape == 'square':
+        return (columns + 0.5) * size, (rows + 0.5) * size
+    radius = size / np.sqrt(3)
+    return radius * np.sqrt(3) * (columns + rows / 2), radius * 1.5 * rows
+
+def build_pyramid(accidents, levels = LEVELS, shape = 'hex'):
+    """
+    Counts accidents in the bins of every level, by severity, year and hour.
+
+    Args:
+        accidents (DataFrame): Accidents with 'lat', 'lon', 'date' and 'severity' columns, as
+                               in the accidents table from tfl_ingest.
+        levels (iterable, default = LEVELS): Zoom levels to count at.
+        shape (str, default = 'hex'): 'hex' or 'square'.
+
+    Returns:
+        (DataFrame): 'level', 'column', 'row', 'year', 'hour', 'severity' and 'count' columns,
+                     with one row for each combination that has accidents. Years and hours
+                     are in London time.
+    """
+    x, y = project(accidents['lon'], accidents['lat'])
+    dates = pd.to_datetime(accidents['date'], utc = True).dt.tz_convert(TIMEZONE)
+    base = pd.DataFrame({
+        'year': dates.dt.year.to_numpy().astype(np.int16),
+        'hour': dates.dt.hour.to_numpy().astype(np.int8),
+        'severity': pd.Categorical(accidents['severity'], categories = SEVERITIES).codes,
+    })
+
+    frames = []
+    for level in levels:
+        level_bins = base.copy()
+        level_bins['column'], level_bins['row'] = cells(x, y, cell_size(level), shape)
+        counts = level_bins.groupby(['column', 'row', 'year', 'hour', 'severity']).size()\
+            .rename('count').reset_index()
+        counts.insert(0, 'level', np.int8(level))
+        frames.append(counts)
+    pyramid = pd.concat(frames, ignore_index = True)
+    pyramid['count'] = pyramid['count'].astype(np.int32)
+    pyramid.attrs['shape'] = shape
+    return pyramid
+
+def write_pyramid(pyramid, path = DENSITY_BINS_PATH):
+    """
+    Saves a pyramid from build_pyramid.
+
+    Args:
+        pyramid (DataFrame): Output of build_pyramid.
+        path (str, default = DENSITY_BINS_PATH): Output Parquet file.
+
+    Returns: None.
+    """
+    pyramid.assign(shape = pyramid.attrs.get('shape', 'hex')).astype({'shape': 'category'})\
+        .to_parquet(path, index = False)
+
+class DensityPyramid:
+    """
+    Saved bin counts, queried by bounding box and zoom level.
+
+    Args:
+        path (str, default = DENSITY_BINS_PATH): Parquet file written by write_pyramid.
+    """
+    def __init__(self, path = DENSITY_BINS_PATH):
+        pyramid = pd.read_parquet(path)
+        self.shape = str(pyramid['shape'].iloc[0])
+        pyramid = pyramid.drop(columns = 'shape')
+        self.levels = {int(level): counts.reset_index(drop = True)
+                       for level, counts in pyramid.groupby('level')}
+
+    def level_for_zoom(self, zoom):
+        """
+        Gets the saved level closest to a zoom level.
+
+        Args:
+            zoom (float): Zoom level of the map.
+
+        Returns:
+            (int): Saved level.
+        """
+        return min(self.levels, key = lambda level: abs(level - round(zoom)))
+
+    def query(self, bounds, zoom, years = None, hours = None, severities = None):
+        """
+        Gets the bins within a bounding box at a zoom level.
+
+        Args:
+            bounds (tuple): west, south, east, north in degrees.
+            zoom (float): Zoom level of the map.
+            years (iterable, default = None): Years to count. If None then every year is counted.
+            hours (iterable, default = None): Hours (0-23, London time) to count. If None then every
+                                              hour is counted.
+            severities (iterable, default = None): 'Slight', 'Serious' and/or 'Fatal'. If None then
+                                                   every severity is counted.
+
+        Returns:
+            (DataFrame): 'lon' and 'lat' of each bin's centre with 'slight', 'serious', 'fatal'
+                         and 'total' counts, for bins with at least one accident.
+        """
+        level = self.level_for_zoom(zoom)
+        size = cell_size(level)
+        counts = self.levels[level]
+
+        west, south, east, north = bounds
+        (min_x, max_x), (min_y, max_y) = project([west, east], [south, north])
+        x, y = cell_centres(counts['column'].to_numpy(), counts['row'].to_numpy(), size, self.shape)
+        mask = (x >= min_x - size) & (x <= max_x + size) & (y >= min_y - size) & (y <= max_y + size)
+        if years != None:
+            mask &= counts['year'].isin(list(years)).to_numpy()
+        if hours != None:
+            mask &= counts['hour'].isin(list(hours)).to_numpy()
+        if severities != None:
+            mask &= counts['severity'].isin([SEVERITIES.index(severity) for severity in severities]).to_numpy()
+
+        columns = ['lon', 'lat'] + [severity.lower() for severity in SEVERITIES] + ['total']
+        if not mask.any():
+            return pd.DataFrame(columns = columns)
+
+        by_severity = counts[mask].pivot_table(index = ['column', 'row'], columns = 'severity',
+                                               values = 'count', aggfunc = 'sum', fill_value = 0)
+        by_severity = by_severity.reindex(columns = range(len(SEVERITIES)), fill_value = 0)
+        by_severity.columns = [severity.lower() for severity in SEVERITIES]
+        by_severity['total'] = by_severity.sum(axis = 1)
+        by_severity = by_severity.reset_index()
+
+        x, y = cell_centres(by_severity['column'].to_numpy(), by_severity['row'].to_numpy(), size, self.shape)
+        by_severity.insert(0, 'lon', unproject(x, y)[0])
+        by_severity.insert(1, 'lat', unproject(x, y)[1])
+        return by_severity.drop(columns = ['column', 'row'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Count accidents in grid cells at every zoom level.")
+    parser.add_argument('--shape', choices = SHAPES, default = 'hex')
+    parser.add_argument('--output', default = DENSITY_BINS_PATH)
+    args = parser.parse_args()
+    pyramid = build_pyramid(tfl_ingest.load_tables()['accidents'], shape = args.shape)
+    write_pyramid(pyramid, args.output)
+    print(f"Saved {len(pyramid)} bin counts to {args.output}")
@@ -0,0 +1,125 @@
+'''
+This module contains a cache of rendered plots as PNG bytes, held in a bounded in-memory
+LRU and backed by files on disk, so that a plot is only drawn once per data version.
+'''
+
+import os
+import threading
+from io import BytesIO
+from hashlib import sha1
+from collections import OrderedDict
+import matplotlib.pyplot as plt
+from instrumentation import stage
+
+FIGURE_CACHE_FOLDER = 'cache/figures'
+MAX_MEMORY_IMAGES = 256
+
+# The same settings Streamlit's st.pyplot uses, so cached images look the same as before
+SAVEFIG_KWARGS = {'format': 'png', 'dpi': 200, 'bbox_inches': 'tight'}
+
+_images = OrderedDict()
+_lock = threading.Lock()
+
+def data_version(*paths):
+    """
+    Makes a short identifier that changes whenever any of the given files changes.
+
+    Args:
+        *paths (str): Files the cached plot is drawn from. Paths that don't exist are skipped.
+
+    Returns:
+        (str): Hash of the paths, modification times and sizes of the files.
+    """
+    digest = sha1()
+    for path in paths:
+        if os.path.exists(path):
+            digest.update(f"{path}:{os.path.getmtime(path)}:{os.path.getsize(path)};".encode())
+    return digest.hexdigest()[:12]
+
+def key_filename(key, folder = FIGURE_CACHE_FOLDER):
+    """
+    Gets the on-disk location of a cached image.
+
+    Args:
+        key (tuple): Cache key, e.g. (view, borough, ward, severity, data version).
+        folder (str, default = FIGURE_CACHE_FOLDER): Folder of cached images.
+
+    Returns:
+        (str): Path of the PNG file for the key.
+    """
+    return os.path.join(folder, sha1(repr(key).encode()).hexdigest() + '.png')
+
+def encode_figure(figure):
+    """
+    Renders a matplotlib figure as PNG bytes and closes it.
+
+    Args:
+        figure (matplotlib.figure.Figure): Figure to render.
+
+    Returns:
+        (bytes): PNG image.
+    """
+    buffer = BytesIO()
+    figure.savefig(buffer, **SAVEFIG_KWARGS)
+    plt.close(figure)
+    return buffer.getvalue()
+
+def _remember(key, image):
+    with _lock:
+        _images[key] = image
+        _images.move_to_end(key)
+        while len(_images) > MAX_MEMORY_IMAGES:
+            _images.popitem(last = False)
+
+def get_image(key, render, folder = FIGURE_CACHE_FOLDER):
+    """
+    Gets the PNG bytes for a key, rendering and storing them if they aren't cached.
+
+    Args:
+        key (tuple): Cache key, which should include the data version of the plot's inputs.
+        render (function): Takes no arguments and returns a matplotlib figure.
+        folder (str, default = FIGURE_CACHE_FOLDER): Folder of cached images.
+
+    Returns:
+        (bytes): PNG image.
+    """
+    with _lock:
+        if key in _images:
+            _images.move_to_end(key)
+            return _images[key]
+
+    filename = key_filename(key, folder)
+    if os.path.exists(filename):
+        with open(filename, 'rb') as f:
+            image = f.read()
+    else:
+        with stage('render', view = key[0]):
+            figure = render()
+        with stage('encode', view = key[0]):
+            image = encode_figure(figure)
+        # Write to a temporary file first so other processes never read a partial image
+        os.makedirs(folder, exist_ok = True)
+        temporary_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_filename, 'wb') as f:
+            f.write(image)
+        os.replace(temporary_filename, filename)
+
+    _remember(key, image)
+    return image
+
+def clear(folder = None):
+    """
+    Empties the in-memory cache, and optionally the on-disk cache too.
+
+    Args:
+        folder (str, default = None): Folder of cached images to empty. If None then only
+                                      the in-memory cache is emptied.
+
+    Returns: None.
+    """
+    with _lock:
+        _images.clear()
+    if folder != None and os.path.exists(folder):
+        for filename in os.listdir(folder):
+            if filename.endswith('.png'):
+                os.remove(os.path.join(folder, filename))
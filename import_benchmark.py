@@ -0,0 +1,64 @@
+'''
+This module benchmarks how long importing accident_analysis_util and using its lightest
+functions takes, and checks that doing so loads none of the heavy dependencies, so a
+module-level import added to the package is caught before it slows down every batch worker.
+
+Each run imports the package in a fresh interpreter, since a module is only imported once
+per process.
+
+Run in command line (in main project directory):
+python import_benchmark.py
+'''
+
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Modules that importing accident_analysis_util for normalise_saint should never load
+HEAVY_MODULES = ['scrapy', 'folium', 'branca', 'xyzservices', 'plotnine', 'geopandas', 'shapely', 'tqdm',
+                 'pandas', 'numpy', 'requests']
+BUDGET_SECONDS = 0.05
+REPEATS = 5
+
+_CHILD = '''
+import sys, json, time
+start = time.perf_counter()
+from accident_analysis_util import normalise_saint
+normalise_saint('St Paul')
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'modules': sorted({name.split('.')[0] for name in sys.modules})}))
+'''
+
+def time_import(repeats = REPEATS):
+    """
+    Times importing accident_analysis_util in fresh interpreters.
+
+    Args:
+        repeats (int, default = REPEATS): Number of interpreters to time.
+
+    Returns:
+        (float): Median seconds taken to import the package and call normalise_saint.
+        (list): Heavy modules loaded by doing so.
+    """
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', _CHILD], capture_output = True, text = True, check = True)
+        result = json.loads(output.stdout)
+        times.append(result['seconds'])
+    return statistics.median(times), [module for module in HEAVY_MODULES if module in result['modules']]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Check that importing accident_analysis_util stays fast.")
+    parser.add_argument('--budget', type = float, default = BUDGET_SECONDS,
+                        help = "Most seconds the import may take.")
+    parser.add_argument('--repeats', type = int, default = REPEATS)
+    args = parser.parse_args()
+
+    seconds, loaded = time_import(args.repeats)
+    print(f"Imported accident_analysis_util in {seconds * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms)")
+    if len(loaded) > 0:
+        print(f"Heavy modules loaded on import: {', '.join(loaded)}")
+    if seconds > args.budget or len(loaded) > 0:
+        sys.exit(1)
@@ -0,0 +1,299 @@
+'''
+This module times the stages of the Streamlit applications and the build pipeline, such
+as loading, filtering, aggregating, building plots, rendering and encoding.
+
+Each stage records its wall time, CPU time and peak resident memory, along with the
+Streamlit session it ran in. Records are kept in memory for the diagnostics page, can be
+appended to a JSON-lines log, and can be served as Prometheus text for scraping.
+
+Instrumentation is configured with environment variables:
+    INSTRUMENTATION: '0' to turn it off.
+    INSTRUMENTATION_LOG: Path of the JSON-lines log, e.g. cache/instrumentation/stages.jsonl.
+                         There is no log if it isn't set. The log is rotated once it
+                         reaches LOG_MAX_BYTES, keeping LOG_BACKUPS old logs.
+    INSTRUMENTATION_PROMETHEUS_PORT: Port to serve Prometheus text on, if any.
+
+Run in command line (in main project directory) to summarise the log:
+python instrumentation.py cache/instrumentation/stages.jsonl
+'''
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+ENABLED = os.environ.get('INSTRUMENTATION', '1') != '0'
+LOG_PATH = os.environ.get('INSTRUMENTATION_LOG', '')
+PROMETHEUS_PORT = os.environ.get('INSTRUMENTATION_PROMETHEUS_PORT')
+MAX_RECORDS = 2000 # Records kept in memory for the diagnostics page
+LOG_MAX_BYTES = 50 * 2 ** 20
+LOG_BACKUPS = 3
+
+_lock = threading.Lock()
+_records = deque(maxlen = MAX_RECORDS)
+_totals = {} # Totals of each stage over the life of the process
+_parent = contextvars.ContextVar('stage_parent', default = None)
+_server = None
+_log = None
+
+def peak_rss():
+    """
+    Gets the most memory the process has had resident so far.
+
+    Returns:
+        (int): Bytes, or None if it can't be measured on this platform.
+    """
+    if resource == None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Linux reports kilobytes
+
+def session_id():
+    """
+    Gets the Streamlit session the current thread is running a script for.
+
+    Returns:
+        (str): Session ID, or None outside of a Streamlit script run.
+    """
+    # Only look for Streamlit if it has been imported, so the pipeline never loads it
+    if 'streamlit' not in sys.modules:
+        return None
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    context = get_script_run_ctx(suppress_warning = True)
+    return context.session_id if context != None else None
+
+def _accumulate(summary, entry):
+    values = summary.setdefault(entry['stage'], {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                 'peak_rss_bytes': 0})
+    values['calls'] += 1
+    values['wall_seconds'] += entry['wall_seconds']
+    values['cpu_seconds'] += entry['cpu_seconds']
+    values['peak_rss_bytes'] = max(values['peak_rss_bytes'], entry['peak_rss_bytes'] or 0)
+
+def _logger():
+    # One open, rotating file for the process, which serialises its own writes
+    global _log
+    with _lock:
+        if _log == None:
+            _log = logging.getLogger('instrumentation')
+            _log.setLevel(logging.INFO)
+            _log.propagate = False
+            try:
+                folder = os.path.dirname(LOG_PATH)
+                if folder != '':
+                    os.makedirs(folder, exist_ok = True)
+                handler = RotatingFileHandler(LOG_PATH, maxBytes = LOG_MAX_BYTES, backupCount = LOG_BACKUPS)
+            except OSError: # A read-only deployment still keeps records in memory
+                handler = logging.NullHandler()
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _log.addHandler(handler)
+    return _log
+
+def _record(entry):
+    with _lock:
+        _records.append(entry)
+        _accumulate(_totals, entry)
+    if LOG_PATH != '':
+        _logger().info(json.dumps(entry))
+
+@contextmanager
+def stage(name, **labels):
+    """
+    Records how long the code within the context takes.
+
+    CPU time is that of the current thread, since each Streamlit session and each pipeline
+    stage runs in its own thread. Peak RSS is the process's high-water mark when the stage
+    ends, and rss_growth_bytes is how much the stage raised it.
+
+    Args:
+        name (str): Stage, e.g. 'load.ward_boundaries' or 'render.casualties'.
+        **labels: Details saved with the record, e.g. borough = 'Camden'.
+    """
+    if not ENABLED:
+        yield
+        return
+    token = _parent.set(name)
+    start_peak = peak_rss()
+    start_cpu = time.thread_time()
+    start_wall = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as exception:
+        error = type(exception).__name__
+        raise
+    finally:
+        wall = time.perf_counter() - start_wall
+        cpu = time.thread_time() - start_cpu
+        peak = peak_rss()
+        _parent.reset(token)
+        _record({
+            'time': time.time(),
+            'stage': name,
+            'parent': _parent.get(),
+            'session': session_id(),
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'peak_rss_bytes': peak,
+            'rss_growth_bytes': peak - start_peak if peak != None else None,
+            'error': error,
+            **labels,
+            })
+
+def timed(name):
+    """
+    Decorates a function so each call is recorded as a stage.
+
+    Args:
+        name (str): Stage.
+
+    Returns:
+        (function): Decorator.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def records(session = None):
+    """
+    Gets the most recent records kept in memory.
+
+    Args:
+        session (str, default = None): Only return records of this Streamlit session. If None
+                                       then every record is returned.
+
+    Returns:
+        (list): Records as dicts, oldest first.
+    """
+    with _lock:
+        return [entry for entry in _records if session == None or entry['session'] == session]
+
+def totals():
+    """
+    Gets the totals of each stage since the process started.
+
+    Returns:
+        (dict):
+            keys (str): Stages.
+            values (dict): 'calls', 'wall_seconds', 'cpu_seconds' and 'peak_rss_bytes'.
+    """
+    with _lock:
+        return {name: dict(values) for name, values in _totals.items()}
+
+def summarise(entries):
+    """
+    Totals records by stage.
+
+    Args:
+        entries (iterable): Records, as returned by records or read from the log.
+
+    Returns:
+        (dict): Totals in the format returned by totals, sorted by wall time, longest first.
+    """
+    summary = {}
+    for entry in entries:
+        _accumulate(summary, entry)
+    return dict(sorted(summary.items(), key = lambda item: -item[1]['wall_seconds']))
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_text():
+    """
+    Formats the totals of each stage in the Prometheus text exposition format.
+
+    Returns:
+        (str): Metrics, labelled by stage.
+    """
+    metrics = [
+        ('stage_calls_total', 'counter', 'Number of times the stage has run.', 'calls'),
+        ('stage_wall_seconds_total', 'counter', 'Wall time spent in the stage.', 'wall_seconds'),
+        ('stage_cpu_seconds_total', 'counter', 'CPU time spent in the stage.', 'cpu_seconds'),
+        ('stage_peak_rss_bytes', 'gauge', 'Peak resident memory of the process after the stage.', 'peak_rss_bytes'),
+        ]
+    stage_totals = totals()
+    lines = []
+    for metric, kind, description, field in metrics:
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {kind}']
+        lines += [f'{metric}{{stage="{_escape(name)}"}} {values[field]}' for name, values in stage_totals.items()]
+    peak = peak_rss()
+    if peak != None:
+        lines += ['# HELP process_peak_rss_bytes Peak resident memory of the process.',
+                  '# TYPE process_peak_rss_bytes gauge', f'process_peak_rss_bytes {peak}']
+    return '\n'.join(lines) + '\n'
+
+def serve_prometheus(port = None):
+    """
+    Serves prometheus_text on /metrics from a background thread, once per process.
+
+    Args:
+        port (int, default = None): Port to serve on. If None then INSTRUMENTATION_PROMETHEUS_PORT
+                                    is used, and nothing is served if it isn't set.
+
+    Returns: None.
+    """
+    global _server
+    port = port or PROMETHEUS_PORT
+    if port == None:
+        return
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _lock:
+        if _server != None:
+            return
+        # Only serve locally, for a scraper on the same machine
+        _server = ThreadingHTTPServer(('127.0.0.1', int(port)), Handler)
+    threading.Thread(target = _server.serve_forever, daemon = True).start()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Summarise the instrumentation log by stage.")
+    parser.add_argument('log', nargs = '?', default = LOG_PATH or None,
+                        help = "JSON-lines log, which defaults to INSTRUMENTATION_LOG")
+    parser.add_argument('--session', help = "Only summarise this Streamlit session.")
+    args = parser.parse_args()
+    if args.log == None:
+        parser.error("no log given and INSTRUMENTATION_LOG isn't set")
+
+    with open(args.log) as f:
+        entries = [json.loads(line) for line in f if line.strip() != '']
+    if args.session != None:
+        entries = [entry for entry in entries if entry['session'] == args.session]
+    print(f"{'stage':40} {'calls':>7} {'wall s':>10} {'cpu s':>10} {'peak MB':>9}")
+    for name, values in summarise(entries).items():
+        print(f"{name:40} {values['calls']:>7} {values['wall_seconds']:>10.3f} {values['cpu_seconds']:>10.3f} "
+              f"{values['peak_rss_bytes'] / 2 ** 20:>9.1f}")
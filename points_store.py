@@ -0,0 +1,208 @@
+'''
+This module converts the per-ward accident point shapefiles in data/gdf_points into a
+single GeoParquet file and reads wards or boroughs back out of it.
+
+Run in command line (in main project directory): python points_store.py
+'''
+
+import os
+import argparse
+import threading
+from shutil import rmtree
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+POINTS_TREE = 'data/gdf_points'
+POINTS_PATH = 'data/accident_points.parquet'
+POINTS_BUFFER_PATH = 'data/accident_points.bin'
+
+# Compact copy of the points for the all-London map: 9 bytes per accident
+BUFFER_TYPE = np.dtype([('lon', '<f4'), ('lat', '<f4'), ('severity', 'u1')])
+BUFFER_SEVERITIES = ['Slight', 'Serious', 'Fatal'] # Severity codes in the buffer
+
+# Rows are sorted by borough then ward, so each row group's min/max statistics on those
+# columns act as an index that lets filtered reads skip every other row group.
+# The average ward has around 800 accidents, so a ward read touches one or two groups.
+ROW_GROUP_SIZE = 4096
+
+def read_points_tree(tree = POINTS_TREE):
+    """
+    Reads every ward's points from the data/gdf_points/<borough>/<ward>.shp tree.
+
+    The data/gdf_points/boroughs folder is skipped, since each borough's points are the
+    union of the points of its wards.
+
+    Args:
+        tree (str, default = POINTS_TREE): Folder containing a folder of ward shapefiles
+                                           for each borough.
+
+    Returns:
+        (GeoDataFrame): Accident points with 'borough' and 'ward' columns.
+    """
+    frames = []
+    for borough in sorted(os.listdir(tree)):
+        folder = os.path.join(tree, borough)
+        if borough == 'boroughs' or not os.path.isdir(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            if filename.endswith('.shp'):
+                gdf_ward = gpd.read_file(os.path.join(folder, filename))
+                gdf_ward['borough'] = borough
+                gdf_ward['ward'] = filename[:-len('.shp')]
+                frames.append(gdf_ward)
+    if len(frames) == 0:
+        raise FileNotFoundError(f"No ward shapefiles found in {tree}")
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index = True), crs = frames[0].crs)
+
+def write_points(gdf_points, path = POINTS_PATH):
+    """
+    Saves accident points as GeoParquet sorted by borough and ward.
+
+    Args:
+        gdf_points (GeoDataFrame): Accident points with 'borough' and 'ward' columns.
+        path (str, default = POINTS_PATH): Output GeoParquet file.
+
+    Returns: None.
+    """
+    gdf_points = gdf_points.sort_values(['borough', 'ward'], kind = 'stable').reset_index(drop = True)
+    gdf_points['borough'] = gdf_points['borough'].astype('category')
+    gdf_points['ward'] = gdf_points['ward'].astype('category')
+    gdf_points.to_parquet(path, index = False, row_group_size = ROW_GROUP_SIZE)
+
+def read_points(path = POINTS_PATH, borough = None, ward = None):
+    """
+    Reads accident points from the GeoParquet file, optionally only for one borough or ward.
+
+    Filters are pushed down to the Parquet reader, so only the row groups that can
+    contain the requested borough or ward are read.
+
+    Args:
+        path (str, default = POINTS_PATH): GeoParquet file written by write_points.
+        borough (str, default = None): Borough to read. If None then all points are read.
+        ward (str, default = None): Ward within borough to read.
+
+    Returns:
+        (GeoDataFrame): Accident points.
+    """
+    filters = []
+    if borough != None:
+        filters.append(('borough', '==', borough))
+    if ward != None:
+        if borough == None:
+            raise ValueError("ward requires borough, since ward names are not unique across boroughs")
+        filters.append(('ward', '==', ward))
+    if len(filters) == 0:
+        return gpd.read_parquet(path)
+    return gpd.read_parquet(path, filters = filters)
+
+def build_index(gdf_points):
+    """
+    Finds the rows of each ward and borough in points sorted by borough and ward.
+
+    Args:
+        gdf_points (GeoDataFrame): Accident points as returned by read_points.
+
+    Returns:
+        (dict):
+            keys (str): 'wards' and 'boroughs'.
+            values (dict): Maps (borough, ward) tuples or borough names to (start, stop)
+                           row positions, so a ward or borough is gdf_points.iloc[start:stop].
+    """
+    boroughs = gdf_points['borough'].to_numpy()
+    wards = gdf_points['ward'].to_numpy()
+    changes = np.flatnonzero((boroughs[1:] != boroughs[:-1]) | (wards[1:] != wards[:-1])) + 1
+    starts = np.concatenate([[0], changes])
+    stops = np.concatenate([changes, [len(gdf_points)]])
+
+    index = {'wards': {}, 'boroughs': {}}
+    for start, stop in zip(starts, stops):
+        if start == stop:
+            continue
+        index['wards'][(boroughs[start], wards[start])] = (start, stop)
+        borough_start, _ = index['boroughs'].get(boroughs[start], (start, stop))
+        index['boroughs'][boroughs[start]] = (borough_start, stop)
+    return index
+
+def points_buffer(gdf_points):
+    """
+    Packs accident points into an array of float32 coordinates and uint8 severity codes,
+    ordered from least to most severe so the most severe are drawn on top.
+
+    Args:
+        gdf_points (GeoDataFrame): Accident points with a 'Severity' column, in EPSG:4326.
+
+    Returns:
+        (ndarray): Structured array of BUFFER_TYPE, where severity indexes BUFFER_SEVERITIES.
+    """
+    codes = pd.Categorical(gdf_points['Severity'], categories = BUFFER_SEVERITIES).codes
+    if (codes < 0).any():
+        raise ValueError("Severity must equal 'Fatal', 'Serious', or 'Slight' for every point")
+    buffer = np.empty(len(gdf_points), dtype = BUFFER_TYPE)
+    buffer['lon'] = gdf_points.geometry.x.to_numpy()
+    buffer['lat'] = gdf_points.geometry.y.to_numpy()
+    buffer['severity'] = codes
+    return buffer[np.argsort(codes, kind = 'stable')]
+
+def write_points_buffer(gdf_points, path = POINTS_BUFFER_PATH):
+    """
+    Saves accident points as the flat binary array from points_buffer.
+
+    Args:
+        gdf_points (GeoDataFrame): Accident points with a 'Severity' column, in EPSG:4326.
+        path (str, default = POINTS_BUFFER_PATH): Output file.
+
+    Returns: None.
+    """
+    # Write to a temporary file first so readers never map a partial buffer
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    points_buffer(gdf_points).tofile(temporary_path)
+    os.replace(temporary_path, path)
+
+def read_points_buffer(path = POINTS_BUFFER_PATH):
+    """
+    Reads points saved by write_points_buffer without copying them into memory.
+
+    Args:
+        path (str, default = POINTS_BUFFER_PATH): File written by write_points_buffer.
+
+    Returns:
+        (numpy.memmap): Structured array with 'lon', 'lat' and 'severity' fields, where
+                        severity indexes BUFFER_SEVERITIES.
+    """
+    return np.memmap(path, dtype = BUFFER_TYPE, mode = 'r')
+
+def migrate(tree = POINTS_TREE, path = POINTS_PATH, remove_tree = False):
+    """
+    Converts the per-ward shapefile tree into a single GeoParquet file, and saves the
+    compact binary copy of the points next to it.
+
+    Args:
+        tree (str, default = POINTS_TREE): Folder containing the shapefile tree.
+        path (str, default = POINTS_PATH): Output GeoParquet file.
+        remove_tree (bool, default = False): True if the shapefile tree should be deleted
+                                             once the GeoParquet file has been checked.
+
+    Returns:
+        (int): Number of accident points written.
+    """
+    gdf_points = read_points_tree(tree)
+    write_points(gdf_points, path)
+
+    written = len(read_points(path))
+    if written != len(gdf_points):
+        raise ValueError(f"{len(gdf_points)} points read from {tree} but {written} written to {path}")
+    write_points_buffer(gdf_points, os.path.join(os.path.dirname(path), os.path.basename(POINTS_BUFFER_PATH)))
+    if remove_tree:
+        rmtree(tree)
+    return written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Convert data/gdf_points shapefiles into one GeoParquet file.")
+    parser.add_argument('--tree', default = POINTS_TREE)
+    parser.add_argument('--output', default = POINTS_PATH)
+    parser.add_argument('--remove-tree', action = 'store_true',
+                        help = "Delete the shapefile tree after a successful conversion")
+    args = parser.parse_args()
+    count = migrate(args.tree, args.output, remove_tree = args.remove_tree)
+    print(f"Saved {count} accident points to {args.output}")
@@ -0,0 +1,363 @@
+'''
+This module fits regressions of the number of accidents each day on the weather, for
+every weather parameter at once.
+
+Accidents are counted by local day, including the days without any, and each day's weather
+is the mean of central London's hourly weather from the Open-Meteo archive, so days are
+described the same whether or not they had an accident. The daily weather is downloaded
+once by build_pipeline.py's daily_weather stage and read from DAILY_WEATHER_PATH, so the app
+makes no network requests. Without that file each day's weather is the mean weather of its
+accidents from the merged CSV, which leaves out days without any. Simple linear and Poisson
+regressions of every parameter are solved together from shared arrays over the design
+matrix, rather than one statsmodels fit per parameter. Multivariate models and negative
+binomial models are fitted with statsmodels on the same matrix.
+
+Run in command line (in main project directory):
+python regression_engine.py 2010 2019
+'''
+
+import os
+import warnings
+import argparse
+import numpy as np
+import pandas as pd
+import streamlit as st
+import statsmodels.api as sm
+from statsmodels.tools.sm_exceptions import ConvergenceWarning, HessianInversionWarning
+from scipy import stats
+from weather_data import FATAL_WEATHER_PATH, WEATHER_PARAMETERS, load_weather_data
+from instrumentation import timed
+
+MODELS = ('Linear', 'Poisson', 'Negative binomial')
+TIMEZONE = 'Europe/London' # Accidents are counted by local day
+WEATHER_LOCATION = (51.5074, -0.1278) # Central London, whose weather stands in for the city's
+MAX_ITERATIONS = 100
+DAILY_WEATHER_PATH = 'data/daily_weather.parquet'
+
+def daily_weather(days, parameters, url = None):
+    """
+    Downloads central London's hourly weather and takes its mean on each local day.
+
+    Args:
+        days (DatetimeIndex): Days, at midnight.
+        parameters (list): Weather columns.
+        url (str, default = None): Open-Meteo archive endpoint. If None then
+                                   weather_enrichment.ARCHIVE_URL is used.
+
+    Returns:
+        (DataFrame): Mean of each parameter each day, indexed by days. Days the archive
+                     has no weather for are NaN.
+    """
+    # Only the pipeline downloads weather, so the app doesn't need weather_enrichment's dependencies
+    from weather_enrichment import ARCHIVE_URL, fetch_area
+
+    # Local days start an hour before UTC ones in summer, so fetch a day either side
+    start_date = (days.min() - pd.Timedelta(days = 1)).strftime('%Y-%m-%d')
+    end_date = (days.max() + pd.Timedelta(days = 1)).strftime('%Y-%m-%d')
+    df_hourly = fetch_area(*WEATHER_LOCATION, start_date, end_date, url = url or ARCHIVE_URL)
+    local_days = df_hourly['date_hour'].dt.tz_convert(TIMEZONE).dt.tz_localize(None).dt.normalize()
+    return df_hourly[list(parameters)].astype(float).groupby(local_days.to_numpy()).mean().reindex(days)
+
+def write_daily_weather(years, path = DAILY_WEATHER_PATH, url = None):
+    """
+    Downloads and saves the mean of central London's weather on every day of some years.
+
+    Args:
+        years (iterable): Years to save.
+        path (str, default = DAILY_WEATHER_PATH): Output Parquet file.
+        url (str, default = None): Open-Meteo archive endpoint. If None then
+                                   weather_enrichment.ARCHIVE_URL is used.
+
+    Returns: None.
+    """
+    years = list(years)
+    days = pd.date_range(f'{min(years)}-01-01', f'{max(years)}-12-31', freq = 'D')
+    df_daily_weather = daily_weather(days, list(WEATHER_PARAMETERS), url).rename_axis('day')
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    df_daily_weather.to_parquet(path)
+
+def read_daily_weather(path = DAILY_WEATHER_PATH):
+    """
+    Reads the daily weather saved by write_daily_weather.
+
+    Args:
+        path (str, default = DAILY_WEATHER_PATH): Parquet file of daily weather.
+
+    Returns:
+        (DataFrame): Mean of each parameter each day, indexed by day, or None if it hasn't
+                     been built.
+    """
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+def _accident_weather(df_accidents, days, parameters):
+    # Days without accidents have no weather here, so they drop out of the design
+    return df_accidents[list(parameters)].astype(float).groupby(days.to_numpy()).mean()
+
+def daily_design(df_weather, parameters, df_daily_weather = None):
+    """
+    Counts accidents on every day of the years they cover, alongside the day's mean weather.
+
+    Args:
+        df_weather (DataFrame): Accidents with 'date' and weather columns, as returned by
+                                weather_data.load_weather_data.
+        parameters (list): Weather columns to include.
+        df_daily_weather (DataFrame, default = None): Mean of each parameter each day, indexed
+                                                      by day, as read by read_daily_weather. If
+                                                      None then each day's weather is the mean
+                                                      weather of its accidents.
+
+    Returns:
+        (Series): Number of accidents each day, which is 0 on days without any.
+        (DataFrame): Mean of each parameter each day, indexed like the counts. Days without
+                     weather are left out of both.
+    """
+    # The same accident can appear more than once under different ids
+    df_accidents = df_weather.drop_duplicates([column for column in df_weather if column != 'id'])
+    days = df_accidents['date'].dt.tz_convert(TIMEZONE).dt.tz_localize(None).dt.normalize()
+    all_days = pd.date_range(f'{days.min().year}-01-01', f'{days.max().year}-12-31', freq = 'D')
+    y = days.value_counts().reindex(all_days, fill_value = 0).rename('accidents')
+
+    if df_daily_weather is None:
+        df_daily_weather = _accident_weather(df_accidents, days, parameters)
+    X = df_daily_weather[list(parameters)].reindex(all_days).astype(float).dropna()
+    return y.reindex(X.index), X
+
+def fit_simple(y, X):
+    """
+    Fits y = intercept + coefficient * x for every column x of X at once.
+
+    Args:
+        y (Series): Response.
+        X (DataFrame): A column for each predictor.
+
+    Returns:
+        (DataFrame): 'intercept', 'coefficient', 'std_error', 't', 'p_value', 'r_squared'
+                     and 'n' for each column of X.
+    """
+    values = X.to_numpy(dtype = float)
+    response = y.to_numpy(dtype = float)
+    n = len(response)
+
+    # Every fit comes from the same centred sums
+    centred = values - values.mean(axis = 0)
+    centred_response = response - response.mean()
+    sxx = (centred ** 2).sum(axis = 0)
+    sxy = centred.T @ centred_response
+    syy = centred_response @ centred_response
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        coefficients = sxy / sxx
+        residual_variance = (syy - coefficients * sxy) / (n - 2)
+        std_errors = np.sqrt(residual_variance / sxx)
+        t = coefficients / std_errors
+        r_squared = coefficients * sxy / syy
+    return pd.DataFrame({
+        'intercept': response.mean() - coefficients * values.mean(axis = 0),
+        'coefficient': coefficients,
+        'std_error': std_errors,
+        't': t,
+        'p_value': 2 * stats.t.sf(np.abs(t), n - 2),
+        'r_squared': r_squared,
+        'n': n,
+        }, index = X.columns)
+
+def fit_poisson_simple(y, X, max_iterations = MAX_ITERATIONS, tolerance = 1e-8):
+    """
+    Fits log E[y] = intercept + coefficient * x for every column x of X at once, by Newton's
+    method on every fit together.
+
+    Args:
+        y (Series): Counts.
+        X (DataFrame): A column for each predictor.
+        max_iterations (int, default = MAX_ITERATIONS): Most Newton steps to take.
+        tolerance (float, default = 1e-8): Largest step at which a fit has converged.
+
+    Returns:
+        (DataFrame): 'coefficient' (on the log scale), 'std_error', 'z', 'p_value' and
+                     'converged' for each column of X.
+    """
+    values = X.to_numpy(dtype = float)
+    response = y.to_numpy(dtype = float)[:, None]
+    # Centring keeps exp() in range and the Hessians well conditioned
+    centred = values - values.mean(axis = 0)
+    intercepts = np.full(values.shape[1], np.log(response.mean()))
+    coefficients = np.zeros(values.shape[1])
+    converged = np.zeros(values.shape[1], dtype = bool)
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore', over = 'ignore'):
+        for _ in range(max_iterations):
+            mu = np.exp(intercepts + coefficients * centred)
+            residuals = response - mu
+            # Gradient and 2 x 2 Hessian of each fit's log likelihood
+            g0, g1 = residuals.sum(axis = 0), (centred * residuals).sum(axis = 0)
+            h00, h01, h11 = mu.sum(axis = 0), (mu * centred).sum(axis = 0), (mu * centred ** 2).sum(axis = 0)
+            determinants = h00 * h11 - h01 ** 2
+            step0 = (h11 * g0 - h01 * g1) / determinants
+            step1 = (h00 * g1 - h01 * g0) / determinants
+            active = ~converged & np.isfinite(step0) & np.isfinite(step1)
+            intercepts[active] += step0[active]
+            coefficients[active] += step1[active]
+            converged |= active & (np.maximum(np.abs(step0), np.abs(step1)) < tolerance)
+            if (converged | ~active).all():
+                break
+
+        mu = np.exp(intercepts + coefficients * centred)
+        h00, h01, h11 = mu.sum(axis = 0), (mu * centred).sum(axis = 0), (mu * centred ** 2).sum(axis = 0)
+        std_errors = np.sqrt(h00 / (h00 * h11 - h01 ** 2))
+        z = coefficients / std_errors
+    return pd.DataFrame({
+        'coefficient': coefficients,
+        'std_error': std_errors,
+        'z': z,
+        'p_value': 2 * stats.norm.sf(np.abs(z)),
+        'converged': converged,
+        }, index = X.columns)
+
+def fit_multiple(y, X):
+    """
+    Fits y on every column of X together, by least squares.
+
+    Args:
+        y (Series): Response.
+        X (DataFrame): A column for each predictor.
+
+    Returns:
+        (DataFrame): 'coefficient', 'std_error', 't' and 'p_value' for 'const' and each
+                     column of X, with the model's R squared in attrs['r_squared'].
+    """
+    design = sm.add_constant(X.astype(float), has_constant = 'add')
+    values = design.to_numpy()
+    response = y.to_numpy(dtype = float)
+    coefficients, _, rank, _ = np.linalg.lstsq(values, response, rcond = None)
+    residuals = response - values @ coefficients
+    degrees_of_freedom = len(response) - rank
+    covariance = residuals @ residuals / degrees_of_freedom * np.linalg.pinv(values.T @ values)
+    std_errors = np.sqrt(np.diag(covariance))
+    t = coefficients / std_errors
+
+    df_fit = pd.DataFrame({'coefficient': coefficients, 'std_error': std_errors, 't': t,
+                           'p_value': 2 * stats.t.sf(np.abs(t), degrees_of_freedom)}, index = design.columns)
+    centred_response = response - response.mean()
+    df_fit.attrs['r_squared'] = 1 - residuals @ residuals / (centred_response @ centred_response)
+    return df_fit
+
+def fit_count(y, X, model = 'Poisson'):
+    """
+    Fits a count model of y on every column of X together.
+
+    Args:
+        y (Series): Counts.
+        X (DataFrame): A column for each predictor.
+        model (str, default = 'Poisson'): 'Poisson' or 'Negative binomial'.
+
+    Returns:
+        (DataFrame): 'coefficient' (on the log scale), 'std_error', 'z', 'p_value' and
+                     'converged' for 'const' and each column of X. A fit that didn't converge,
+                     or whose standard errors couldn't be estimated, has converged False.
+    """
+    if model not in ('Poisson', 'Negative binomial'):
+        raise ValueError(f"model must equal 'Poisson' or 'Negative binomial', got {model}")
+    design = sm.add_constant(X.astype(float), has_constant = 'add')
+    # Convergence and Hessian warnings are reported in the converged column instead
+    with warnings.catch_warnings(record = True) as caught:
+        warnings.simplefilter('always')
+        try:
+            if model == 'Poisson':
+                results = sm.GLM(y.astype(float), design, family = sm.families.Poisson()).fit(maxiter = MAX_ITERATIONS)
+                converged = results.converged
+            else:
+                results = sm.NegativeBinomial(y.astype(float), design).fit(maxiter = MAX_ITERATIONS, disp = False)
+                converged = results.mle_retvals['converged']
+        except np.linalg.LinAlgError: # Predictors that are collinear
+            return pd.DataFrame({'coefficient': np.nan, 'std_error': np.nan, 'z': np.nan, 'p_value': np.nan,
+                                 'converged': False}, index = design.columns)
+    problems = (ConvergenceWarning, HessianInversionWarning, RuntimeWarning)
+    converged = bool(converged) and not any(issubclass(warning.category, problems) for warning in caught)
+    return pd.DataFrame({'coefficient': results.params[design.columns], 'std_error': results.bse[design.columns],
+                         'z': results.tvalues[design.columns], 'p_value': results.pvalues[design.columns],
+                         'converged': converged & np.isfinite(results.bse[design.columns])})
+
+@timed('aggregate.regression')
+def fit(df_weather, parameters, model = 'Linear', multivariate = False, df_daily_weather = None):
+    """
+    Fits a regression of daily accidents on each weather parameter, or on all of them together.
+
+    Args:
+        df_weather (DataFrame): Accidents with 'date' and weather columns.
+        parameters (list): Weather columns.
+        model (str, default = 'Linear'): One of MODELS.
+        multivariate (bool, default = False): True if the parameters should be fitted together
+                                              rather than one at a time.
+        df_daily_weather (DataFrame, default = None): Daily weather, as passed to daily_design.
+
+    Returns:
+        (DataFrame): Output of fit_simple, fit_multiple, fit_poisson_simple or fit_count.
+                     Negative binomial models fitted one parameter at a time have a row for
+                     each parameter's coefficient.
+    """
+    y, X = daily_design(df_weather, parameters, df_daily_weather)
+    if model == 'Linear':
+        return fit_multiple(y, X) if multivariate else fit_simple(y, X)
+    if multivariate:
+        return fit_count(y, X, model)
+    if model == 'Poisson':
+        return fit_poisson_simple(y, X)
+    # Each negative binomial fit also estimates its own dispersion, so they are fitted one at a time
+    return pd.concat([fit_count(y, X[[parameter]], model).loc[[parameter]] for parameter in parameters])
+
+def _mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+@st.cache_data(show_spinner = False)
+def _cached_fit(csv, mtime, daily_weather_path, daily_weather_mtime, parameters, model, multivariate):
+    return fit(load_weather_data(csv), list(parameters), model, multivariate, read_daily_weather(daily_weather_path))
+
+def cached_fit(parameters, model = 'Linear', multivariate = False, csv = FATAL_WEATHER_PATH,
+               daily_weather_path = DAILY_WEATHER_PATH):
+    """
+    Gets a fit from fit, cached by the version of the data and the parameters.
+
+    Args:
+        parameters (list): Weather columns.
+        model (str, default = 'Linear'): One of MODELS.
+        multivariate (bool, default = False): True if the parameters should be fitted together.
+        csv (str, default = FATAL_WEATHER_PATH): Path to a merged accidents and weather CSV.
+        daily_weather_path (str, default = DAILY_WEATHER_PATH): Path to the daily weather, which
+                                                                is used when it has been built.
+
+    Returns:
+        (DataFrame): Output of fit.
+    """
+    return _cached_fit(csv, os.path.getmtime(csv), daily_weather_path, _mtime(daily_weather_path),
+                       tuple(parameters), model, multivariate)
+
+@st.cache_data(show_spinner = False)
+def _cached_daily_design(csv, mtime, daily_weather_path, daily_weather_mtime, parameters):
+    return daily_design(load_weather_data(csv), list(parameters), read_daily_weather(daily_weather_path))
+
+def cached_daily_design(parameters, csv = FATAL_WEATHER_PATH, daily_weather_path = DAILY_WEATHER_PATH):
+    """
+    Gets the output of daily_design, cached by the version of the data and the parameters.
+
+    Args:
+        parameters (list): Weather columns.
+        csv (str, default = FATAL_WEATHER_PATH): Path to a merged accidents and weather CSV.
+        daily_weather_path (str, default = DAILY_WEATHER_PATH): Path to the daily weather, which
+                                                                is used when it has been built.
+
+    Returns:
+        (Series): Number of accidents each day.
+        (DataFrame): Mean of each parameter each day.
+    """
+    return _cached_daily_design(csv, os.path.getmtime(csv), daily_weather_path, _mtime(daily_weather_path),
+                                tuple(parameters))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Download and save central London's daily weather.")
+    parser.add_argument('first_year', type = int)
+    parser.add_argument('last_year', type = int)
+    parser.add_argument('--output', default = DAILY_WEATHER_PATH)
+    args = parser.parse_args()
+    write_daily_weather(range(args.first_year, args.last_year + 1), args.output)
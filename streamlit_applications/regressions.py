@@ -1,41 +1,57 @@
 #run : streamlit run streamlit_applications/regressions.py
 import pandas as pd
 import streamlit as st
-import statsmodels.api as sm
+import plotly.express as px
+import os
+import sys
 
-# Load your merged data
-data = pd.read_csv('merged_fatal_accidents_weather.csv')
+# Streamlit only puts this script's folder on the path, so add the main project directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from weather_data import WEATHER_PARAMETERS
+from regression_engine import DAILY_WEATHER_PATH, MODELS, cached_daily_design, cached_fit
 
 # List of weather parameters
-weather_parameters = ['temperature_2m', 'relative_humidity_2m', 'precipitation', 'rain', 'snowfall', 'cloud_cover', 'wind_speed_10m']
+weather_parameters = list(WEATHER_PARAMETERS)
 
 # Streamlit app
 st.title('Relationship between Weather Parameters and Accidents')
+st.write("Each point is a day, with the number of fatal accidents that day and the day's mean weather in central London.")
+if not os.path.exists(DAILY_WEATHER_PATH):
+    st.caption("Central London's daily weather hasn't been built (python build_pipeline.py daily_weather), "
+               "so each day's weather is the mean weather of its accidents and days without any are left out.")
 
-# Iterate over each weather parameter
-for parameter in weather_parameters:
-    st.header(f'Analysis for {parameter}')
-    
-    # Scatter plot of weather parameter vs. number of accidents
-    st.write(f'Scatter plot of {parameter} vs. Number of Accidents')
-    st.write(st.pyplot(sm.graphics.abline_plot(model_results=model, 
-                                                xlabel=parameter, 
-                                                ylabel='Number of Accidents', 
-                                                color='blue')))
-    
-    # Fit the regression model
-    X = sm.add_constant(data[parameter])
-    y = data['fatal_accidents']
-    model = sm.OLS(y, X).fit()
-    
-    # Get the summary of the regression model
-    st.write(model.summary())
-    
-    # Check if the coefficient of the weather parameter is statistically significant
-    if model.pvalues[parameter] < 0.05:
-        st.write(f'The coefficient of {parameter} is statistically significant, indicating a relationship with the number of accidents.')
-    else:
-        st.write(f'The coefficient of {parameter} is not statistically significant, indicating no significant relationship with the number of accidents.')
+selected_parameters = st.multiselect('Weather parameters', weather_parameters, default = weather_parameters,
+                                     format_func = lambda parameter: WEATHER_PARAMETERS[parameter])
+model_type = st.radio('Model', MODELS, horizontal = True)
+multivariate = st.checkbox('Fit all selected parameters together')
 
+if len(selected_parameters) > 0:
+    # Every selected parameter is fitted in one pass, and fits are cached by data version
+    results = cached_fit(selected_parameters, model_type, multivariate)
+    st.dataframe(results.rename(index = WEATHER_PARAMETERS))
+    if 'converged' in results and not results['converged'].all():
+        failed = [WEATHER_PARAMETERS.get(name, name) for name in results.index[~results['converged'].astype(bool)]]
+        st.warning(f"The fit did not converge for {', '.join(failed)}, so its estimates are unreliable.")
+    if model_type == 'Linear' and multivariate:
+        st.write(f"R squared: {results.attrs['r_squared']:.3f}")
 
+    y, X = cached_daily_design(selected_parameters)
 
+    # Iterate over each weather parameter
+    for parameter in selected_parameters:
+        st.header(f'Analysis for {WEATHER_PARAMETERS[parameter]}')
+
+        # Scatter plot of weather parameter vs. number of accidents
+        fig = px.scatter(x = X[parameter], y = y, opacity = 0.5,
+                         labels = {'x': WEATHER_PARAMETERS[parameter], 'y': 'Number of Accidents'})
+        if model_type == 'Linear' and not multivariate:
+            line = pd.Series([X[parameter].min(), X[parameter].max()])
+            fig.add_scatter(x = line, y = results.loc[parameter, 'intercept'] + results.loc[parameter, 'coefficient'] * line,
+                            mode = 'lines', line_color = 'blue', showlegend = False)
+        st.plotly_chart(fig)
+
+        # Check if the coefficient of the weather parameter is statistically significant
+        if results.loc[parameter, 'p_value'] < 0.05:
+            st.write(f'The coefficient of {parameter} is statistically significant, indicating a relationship with the number of accidents.')
+        else:
+            st.write(f'The coefficient of {parameter} is not statistically significant, indicating no significant relationship with the number of accidents.')
@@ -0,0 +1,420 @@
+'''
+This module generates synthetic accidents, in the shape of TfL's AccidentStats, and the
+weather at each of them, for testing how the spatial join, aggregation and rendering
+scale beyond the real 2010 to 2019 data without any network access.
+
+Accidents fall inside real ward boundaries, or inside a generated grid of wards and
+boroughs, with each ward's share of accidents and mix of severities taken from the real
+accident points when they are available. Times follow the weekly and daily pattern of
+London's traffic, each accident has casualties and vehicles, and the weather follows the
+seasons and time of day.
+
+Tables are saved in tfl_ingest.py's layout, so tfl_ingest.load_tables(folder = ...) reads
+them, or as AccidentStats JSON that tfl_ingest.py can ingest with --url. The weather is saved
+in the format of the merged accidents and weather CSVs. Accidents are generated in chunks,
+and each chunk is written out before the next is generated.
+
+Run in command line (in main project directory):
+python synthetic_data.py --scale 10
+python synthetic_data.py --scale 100 --grid 64 50 --format json
+'''
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from accident_severity import SEVERITIES, SEVERITY_TYPE
+from tfl_ingest import TABLE_TYPES, TABLES, table_filename
+from weather_data import WEATHER_PARAMETERS
+
+SYNTHETIC_FOLDER = 'data/synthetic'
+WEATHER_FILENAME = 'merged_synthetic_accidents_weather.csv'
+YEARS = range(2010, 2020)
+ACCIDENTS_PER_YEAR = 50000 # About as many as data/gdf_points has each year
+CHUNK_SIZE = 250000 # Accidents generated at once
+FIRST_ID = 10 ** 8 # Above every real accident id
+TIMEZONE = 'Europe/London'
+LONDON_BOUNDS = (-0.51, 51.29, 0.33, 51.69) # Bounds of the boundary grid
+
+# Used when there are no real accident points to take the mix from
+SEVERITY_MIX = {'Slight': 0.87, 'Serious': 0.125, 'Fatal': 0.005}
+
+# Relative number of accidents each hour (0-23) and each weekday (Monday first)
+HOUR_WEIGHTS = [1.5, 1.1, 0.9, 0.7, 0.6, 0.8, 1.7, 3.6, 5.6, 4.4, 4.0, 4.4,
+                4.9, 5.0, 5.2, 6.0, 6.6, 7.0, 6.2, 4.8, 3.7, 3.1, 2.6, 2.1]
+WEEKDAY_WEIGHTS = [1.0, 1.05, 1.05, 1.05, 1.1, 0.9, 0.75]
+
+EXTRA_CASUALTIES = 0.22 # Mean number of casualties beyond the first
+EXTRA_VEHICLES = 0.8 # Mean number of vehicles beyond the first
+CASUALTY_MODES = {'Car': 0.38, 'Pedestrian': 0.2, 'PedalCycle': 0.16, 'PoweredTwoWheeler': 0.16,
+                  'BusOrCoach': 0.05, 'Taxi': 0.03, 'GoodsVehicle': 0.02}
+VEHICLE_TYPES = {'Car': 0.66, 'PedalCycle': 0.1, 'Motorcycle_125cc_Under': 0.06, 'Motorcycle_500cc_Over': 0.04,
+                 'BusOrCoach': 0.05, 'Taxi': 0.04, 'GoodsVehicle_3_5_Tonne_Under': 0.04,
+                 'GoodsVehicle_7_5_Tonne_Over': 0.01}
+ROADS = ['A1', 'A10', 'A102', 'A13', 'A2', 'A20', 'A205', 'A23', 'A24', 'A3', 'A316', 'A4', 'A40', 'A406',
+         'A41', 'A5', 'High Street', 'Church Road', 'Station Road', 'London Road', 'Park Road', 'Victoria Road',
+         'Green Lane', 'Manor Road', 'Kings Road', 'Queens Road', 'Mill Lane', 'School Lane', 'The Broadway']
+
+def area_weights(gdf_wards, gdf_points = None):
+    """
+    Gets each ward's share of accidents and mix of severities.
+
+    Args:
+        gdf_wards (GeoDataFrame): Wards with 'borough' and 'ward' columns.
+        gdf_points (GeoDataFrame, default = None): Real accident points with 'borough', 'ward'
+                                                   and 'Severity' columns. If None then
+                                                   accidents are spread by area with SEVERITY_MIX.
+
+    Returns:
+        (ndarray): Probability of an accident being in each ward, in the order of gdf_wards.
+        (ndarray): Probability of each of SEVERITIES in each ward, of shape (wards, 3).
+    """
+    mix = np.tile([SEVERITY_MIX[severity] for severity in SEVERITIES], (len(gdf_wards), 1))
+    if gdf_points is None:
+        weights = gdf_wards.to_crs(epsg = 27700).area.to_numpy()
+        return weights / weights.sum(), mix
+
+    # Ward names in the point tree are filenames, so wards are matched on names without line breaks
+    names = pd.MultiIndex.from_arrays([gdf_wards['borough'], gdf_wards['ward'].str.replace('\n', ' ')])
+    counts = pd.crosstab([gdf_points['borough'], gdf_points['ward']], gdf_points['Severity'])\
+        .reindex(index = names, columns = SEVERITIES, fill_value = 0).to_numpy(dtype = float)
+    totals = counts.sum(axis = 1)
+    # Wards without points get the median number of accidents and the overall mix
+    weights = np.where(totals > 0, totals, np.median(totals[totals > 0]))
+    overall = counts.sum(axis = 0) / counts.sum()
+    mix = np.where(totals[:, None] > 0, counts / np.maximum(totals, 1)[:, None], overall)
+    return weights / weights.sum(), mix
+
+def boundary_grid(boroughs = 33, wards_per_borough = 19, bounds = LONDON_BOUNDS):
+    """
+    Tiles a rectangle with a grid of boroughs, each split into a grid of wards.
+
+    Args:
+        boroughs (int, default = 33): Number of boroughs.
+        wards_per_borough (int, default = 19): Number of wards in each borough.
+        bounds (tuple, default = LONDON_BOUNDS): (min lon, min lat, max lon, max lat) of the grid.
+
+    Returns:
+        (GeoDataFrame): Wards with 'borough' and 'ward' columns, in EPSG:4326.
+        (GeoDataFrame): Boroughs with a 'borough' column, in EPSG:4326.
+    """
+    def cells(count, min_x, min_y, max_x, max_y):
+        columns = int(np.ceil(np.sqrt(count)))
+        rows = int(np.ceil(count / columns))
+        width, height = (max_x - min_x) / columns, (max_y - min_y) / rows
+        return [shapely.box(min_x + column * width, min_y + row * height,
+                            min_x + (column + 1) * width, min_y + (row + 1) * height)
+                for row in range(rows) for column in range(columns)][:count]
+
+    borough_cells = cells(boroughs, *bounds)
+    names = [f'Synthetic Borough {number + 1}' for number in range(boroughs)]
+    wards = []
+    for name, cell in zip(names, borough_cells):
+        wards += [{'borough': name, 'ward': f'{name} Ward {number + 1}', 'geometry': ward}
+                  for number, ward in enumerate(cells(wards_per_borough, *cell.bounds))]
+    gdf_wards = gpd.GeoDataFrame(wards, crs = 4326)
+    gdf_boroughs = gpd.GeoDataFrame({'borough': names, 'geometry': borough_cells}, crs = 4326)
+    return gdf_wards, gdf_boroughs
+
+def sample_points(geometries, counts, rng):
+    """
+    Samples points uniformly inside polygons.
+
+    Args:
+        geometries (array): Polygons or MultiPolygons in EPSG:4326.
+        counts (array): Number of points to sample in each polygon.
+        rng (numpy.random.Generator): Random number generator.
+
+    Returns:
+        (ndarray): Longitudes, grouped by polygon in order.
+        (ndarray): Latitudes.
+    """
+    lons, lats = [], []
+    for geometry, count in zip(geometries, counts):
+        if count == 0:
+            continue
+        min_x, min_y, max_x, max_y = geometry.bounds
+        shapely.prepare(geometry)
+        # Rejection sampling, drawing enough candidates each round for the polygon's share of its box
+        fill = max(geometry.area / ((max_x - min_x) * (max_y - min_y)), 0.05)
+        found_x, found_y, needed = [], [], count
+        while needed > 0:
+            size = int(needed / fill * 1.2) + 16
+            x = rng.uniform(min_x, max_x, size)
+            y = rng.uniform(min_y, max_y, size)
+            inside = shapely.contains_xy(geometry, x, y)
+            found_x.append(x[inside][:needed])
+            found_y.append(y[inside][:needed])
+            needed -= len(found_x[-1])
+        lons += found_x
+        lats += found_y
+    return np.concatenate(lons), np.concatenate(lats)
+
+def sample_dates(count, year, rng):
+    """
+    Samples accident times within a year, following WEEKDAY_WEIGHTS and HOUR_WEIGHTS.
+
+    Args:
+        count (int): Number of times.
+        year (int): Year of the times.
+        rng (numpy.random.Generator): Random number generator.
+
+    Returns:
+        (DatetimeIndex): UTC times, to the minute.
+    """
+    days = pd.date_range(f'{year}-01-01', f'{year}-12-31', freq = 'D')
+    day_weights = np.array(WEEKDAY_WEIGHTS)[days.weekday]
+    hour_weights = np.array(HOUR_WEIGHTS)
+    day = rng.choice(len(days), count, p = day_weights / day_weights.sum())
+    hour = rng.choice(24, count, p = hour_weights / hour_weights.sum())
+    minute = rng.integers(0, 60, count)
+    local = days[day] + pd.to_timedelta(hour * 60 + minute, unit = 'min')
+    return local.tz_localize(TIMEZONE, ambiguous = np.zeros(count, dtype = bool), nonexistent = 'shift_forward')\
+        .tz_convert('UTC')
+
+def _choice(options, count, rng):
+    return pd.Categorical.from_codes(rng.choice(len(options), count, p = list(options.values())),
+                                     categories = list(options))
+
+def generate_tables(count, year, gdf_wards, weights, mix, rng, first_id = FIRST_ID):
+    """
+    Generates a year's accidents, casualties and vehicles.
+
+    Args:
+        count (int): Number of accidents.
+        year (int): Year of the accidents.
+        gdf_wards (GeoDataFrame): Wards with 'borough' and 'ward' columns, in EPSG:4326.
+        weights (ndarray): Probability of an accident being in each ward, from area_weights.
+        mix (ndarray): Probability of each severity in each ward, from area_weights.
+        rng (numpy.random.Generator): Random number generator.
+        first_id (int, default = FIRST_ID): Id of the first accident.
+
+    Returns:
+        (dict):
+            keys (str): 'accidents', 'casualties' and 'vehicles'.
+            values (DataFrame): Tables typed as tfl_ingest.flatten types them.
+    """
+    ward_counts = rng.multinomial(count, weights)
+    ward = np.repeat(np.arange(len(gdf_wards)), ward_counts)
+    lon, lat = sample_points(np.asarray(gdf_wards.geometry), ward_counts, rng)
+
+    # An accident is as severe as its most severe casualty
+    cumulative = np.cumsum(mix, axis = 1)[ward]
+    severity = (rng.random(count)[:, None] > cumulative[:, :2]).sum(axis = 1)
+
+    roads = np.array(ROADS, dtype = object)
+    location = roads[rng.integers(0, len(ROADS), count)] + ' junction with ' + roads[rng.integers(0, len(ROADS), count)]
+    ids = np.arange(first_id, first_id + count)
+    df_accidents = pd.DataFrame({
+        'id': ids,
+        'lat': lat.round(6),
+        'lon': lon.round(6),
+        'location': location,
+        'date': sample_dates(count, year, rng),
+        'severity': pd.Categorical.from_codes(severity, dtype = SEVERITY_TYPE),
+        'borough': gdf_wards['borough'].to_numpy()[ward],
+        })
+    # Accidents are in ward order after sampling, so shuffle them into time order
+    df_accidents = df_accidents.sort_values('date', kind = 'stable').reset_index(drop = True)
+    df_accidents['id'] = ids
+    df_accidents = df_accidents.astype(TABLE_TYPES['accidents'])
+
+    # The first casualty has the accident's severity, and the rest are no more severe
+    casualties = 1 + rng.poisson(EXTRA_CASUALTIES, count)
+    accident = np.repeat(np.arange(count), casualties)
+    first = np.r_[True, accident[1:] != accident[:-1]]
+    accident_severity = df_accidents['severity'].cat.codes.to_numpy()[accident]
+    other_severity = rng.choice(3, len(accident), p = list(SEVERITY_MIX.values()))
+    casualty_severity = np.where(first, accident_severity, np.minimum(other_severity, accident_severity))
+    age = np.clip(rng.normal(37, 17, len(accident)), 1, 95).astype(int)
+    mode = _choice(CASUALTY_MODES, len(accident), rng)
+    casualty_class = np.where(mode == 'Pedestrian', 'Pedestrian', np.where(first, 'Driver', 'Passenger'))
+    df_casualties = pd.DataFrame({
+        'accident_id': ids[accident],
+        'age': age,
+        'class': casualty_class,
+        'severity': pd.Categorical.from_codes(casualty_severity, dtype = SEVERITY_TYPE),
+        'mode': mode,
+        'age_band': np.where(age < 16, 'Child', 'Adult'),
+        }).astype(TABLE_TYPES['casualties'])
+
+    vehicles = 1 + rng.poisson(EXTRA_VEHICLES, count)
+    df_vehicles = pd.DataFrame({
+        'accident_id': np.repeat(ids, vehicles),
+        'type': _choice(VEHICLE_TYPES, vehicles.sum(), rng),
+        }).astype(TABLE_TYPES['vehicles'])
+    return {'accidents': df_accidents, 'casualties': df_casualties, 'vehicles': df_vehicles}
+
+def generate_weather(df_accidents, rng):
+    """
+    Generates the weather at each accident, following the seasons and time of day.
+
+    Args:
+        df_accidents (DataFrame): Accidents with 'date' and 'lat' columns.
+        rng (numpy.random.Generator): Random number generator.
+
+    Returns:
+        (DataFrame): A column for each of weather_data.WEATHER_PARAMETERS, indexed like df_accidents.
+    """
+    local = df_accidents['date'].dt.tz_convert(TIMEZONE)
+    day = local.dt.dayofyear.to_numpy()
+    hour = local.dt.hour.to_numpy() + local.dt.minute.to_numpy() / 60
+    count = len(df_accidents)
+
+    temperature = 11.5 - 6.5 * np.cos(2 * np.pi * (day - 20) / 365) - 3.5 * np.cos(2 * np.pi * (hour - 3) / 24) \
+        + rng.normal(0, 2.5, count)
+    wet = rng.random(count) < 0.12
+    precipitation = np.where(wet, np.round(rng.gamma(0.7, 1.3, count), 1), 0.0)
+    snowing = wet & (temperature < 1)
+    humidity = np.clip(78 - 1.6 * (temperature - 11.5) + 12 * wet + rng.normal(0, 8, count), 20, 100)
+    cloud_cover = np.where(wet, rng.uniform(75, 100, count), np.round(rng.beta(1.1, 1.1, count) * 100))
+    return pd.DataFrame({
+        'temperature_2m': temperature,
+        'relative_humidity_2m': humidity,
+        'precipitation': precipitation,
+        'rain': np.where(snowing, 0.0, precipitation),
+        'snowfall': np.where(snowing, np.round(precipitation * 0.7, 2), 0.0), # 7 cm of snow is 10 mm of water
+        'cloud_cover': cloud_cover,
+        'wind_speed_10m': rng.gamma(3.0, 4.5, count),
+        }, index = df_accidents.index)[list(WEATHER_PARAMETERS)].astype('float32')
+
+def to_records(tables):
+    """
+    Formats tables as accidents are formatted in TfL's API, the inverse of tfl_ingest.flatten.
+
+    Args:
+        tables (dict): Output of generate_tables.
+
+    Yields:
+        (dict): Accidents with their 'casualties' and 'vehicles'.
+    """
+    df_accidents = tables['accidents']
+    df_casualties = tables['casualties']
+    df_vehicles = tables['vehicles']
+    # Casualties and vehicles are in accident order, so each accident's are a contiguous slice
+    casualty_stops = np.searchsorted(df_casualties['accident_id'].to_numpy(), df_accidents['id'].to_numpy(), 'right')
+    vehicle_stops = np.searchsorted(df_vehicles['accident_id'].to_numpy(), df_accidents['id'].to_numpy(), 'right')
+    casualties = df_casualties.rename(columns = {'age_band': 'ageBand'}).drop(columns = 'accident_id')\
+        .astype(object).to_dict('records')
+    vehicles = df_vehicles.drop(columns = 'accident_id').astype(object).to_dict('records')
+    dates = df_accidents['date'].dt.strftime('%Y-%m-%dT%H:%M:%SZ').to_numpy()
+
+    casualty_start = vehicle_start = 0
+    for row, accident in enumerate(df_accidents.drop(columns = 'date').astype(object).to_dict('records')):
+        accident['date'] = dates[row]
+        accident['casualties'] = casualties[casualty_start:casualty_stops[row]]
+        accident['vehicles'] = vehicles[vehicle_start:vehicle_stops[row]]
+        casualty_start, vehicle_start = casualty_stops[row], vehicle_stops[row]
+        yield accident
+
+def _real_points():
+    import points_store
+    if os.path.exists(points_store.POINTS_PATH):
+        return points_store.read_points()
+    if os.path.isdir(points_store.POINTS_TREE):
+        return points_store.read_points_tree()
+    return None
+
+def _write_chunk(writers, tables, year, folder):
+    # Each chunk is a row group of its year's files, which keeps the schema of the year's first chunk
+    for table in TABLES:
+        schema = writers[table].schema if table in writers else None
+        arrow_table = pa.Table.from_pandas(tables[table].astype(TABLE_TYPES[table]), schema = schema,
+                                           preserve_index = False)
+        if table not in writers:
+            filename = table_filename(table, year, folder)
+            os.makedirs(os.path.dirname(filename), exist_ok = True)
+            writers[table] = pq.ParquetWriter(filename, arrow_table.schema)
+        writers[table].write_table(arrow_table)
+
+def generate(years = YEARS, scale = 1, folder = SYNTHETIC_FOLDER, grid = None, output_format = 'parquet',
+             weather = True, seed = 0):
+    """
+    Generates and saves synthetic accidents and their weather.
+
+    Args:
+        years (iterable, default = YEARS): Years of accidents.
+        scale (float, default = 1): Accidents each year, as a multiple of ACCIDENTS_PER_YEAR.
+        folder (str, default = SYNTHETIC_FOLDER): Folder to save to.
+        grid (tuple, default = None): (boroughs, wards per borough) of a boundary grid to put the
+                                      accidents in, which is saved as wards.parquet and
+                                      boroughs.parquet. If None then the real wards are used.
+        output_format (str, default = 'parquet'): 'parquet' to save tables in tfl_ingest.py's
+                                                  layout, or 'json' to save AccidentStats JSON
+                                                  as accidents_<year>.json.
+        weather (bool, default = True): True if the weather at each accident should be saved
+                                        to WEATHER_FILENAME.
+        seed (int, default = 0): Seed of the random number generator.
+
+    Returns:
+        (int): Number of accidents generated.
+    """
+    if output_format not in ('parquet', 'json'):
+        raise ValueError(f"output_format must equal 'parquet' or 'json', got {output_format}")
+    import app_data
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok = True)
+    if grid != None:
+        gdf_wards, gdf_boroughs = boundary_grid(*grid)
+        gdf_wards.to_parquet(os.path.join(folder, 'wards.parquet'))
+        gdf_boroughs.to_parquet(os.path.join(folder, 'boroughs.parquet'))
+        weights, mix = area_weights(gdf_wards)
+    else:
+        gdf_wards = app_data.read_boundaries(app_data.WARD_BOUNDARIES_PATH)
+        weights, mix = area_weights(gdf_wards, _real_points())
+
+    weather_path = os.path.join(folder, WEATHER_FILENAME)
+    if weather and os.path.exists(weather_path):
+        os.remove(weather_path)
+    next_id = FIRST_ID
+    for year in years:
+        remaining = int(round(ACCIDENTS_PER_YEAR * scale))
+        writers = {}
+        json_file = open(os.path.join(folder, f'accidents_{year}.json'), 'w') if output_format == 'json' else None
+        separator = '['
+        try:
+            while remaining > 0:
+                count = min(CHUNK_SIZE, remaining)
+                tables = generate_tables(count, year, gdf_wards, weights, mix, rng, next_id)
+                next_id += count
+                remaining -= count
+                if weather:
+                    df_weather = pd.concat([tables['accidents'], generate_weather(tables['accidents'], rng)], axis = 1)
+                    df_weather.to_csv(weather_path, mode = 'a', header = not os.path.exists(weather_path), index = False)
+                if json_file != None:
+                    for record in to_records(tables):
+                        json_file.write(separator + json.dumps(record))
+                        separator = ','
+                else:
+                    _write_chunk(writers, tables, year, folder)
+            if json_file != None:
+                json_file.write(']' if separator == ',' else '[]')
+        finally:
+            if json_file != None:
+                json_file.close()
+            for writer in writers.values():
+                writer.close()
+    return next_id - FIRST_ID
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Generate synthetic accidents and weather for scale tests.")
+    parser.add_argument('--scale', type = float, default = 1,
+                        help = f"Accidents each year as a multiple of {ACCIDENTS_PER_YEAR}.")
+    parser.add_argument('--years', type = int, nargs = 2, default = [YEARS[0], YEARS[-1]],
+                        metavar = ('FIRST', 'LAST'))
+    parser.add_argument('--grid', type = int, nargs = 2, metavar = ('BOROUGHS', 'WARDS_PER_BOROUGH'),
+                        help = "Put accidents in a generated boundary grid instead of the real wards.")
+    parser.add_argument('--format', choices = ['parquet', 'json'], default = 'parquet')
+    parser.add_argument('--no-weather', action = 'store_true')
+    parser.add_argument('--output', default = SYNTHETIC_FOLDER)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+
+    count = generate(range(args.years[0], args.years[1] + 1), args.scale, args.output, args.grid,
+                     args.format, not args.no_weather, args.seed)
+    print(f"Generated {count} accidents in {args.output}")
@@ -0,0 +1,33 @@
+'''
+Tests of tfl_ingest.py against its synthetic fixture.
+
+Run in command line (in main project directory):
+python -m pytest tests
+'''
+
+import os
+import pandas as pd
+import tfl_ingest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_URL = os.path.join(ROOT, tfl_ingest.FIXTURE_URL)
+
+def test_ingest_fixture(tmp_path):
+    assert tfl_ingest.ingest([2019], url = FIXTURE_URL, folder = str(tmp_path)) == {2019: 200}
+    tables = tfl_ingest.load_tables(folder = str(tmp_path))
+
+    lengths = {table: len(df) for table, df in tables.items()}
+    assert lengths == {'accidents': 200, 'casualties': 246, 'vehicles': 373}
+    for table, types in tfl_ingest.TABLE_TYPES.items():
+        for column, dtype in types.items():
+            assert tables[table][column].dtype == dtype, (table, column)
+    assert tables['accidents']['date'].dtype == pd.DatetimeTZDtype(tz = 'UTC')
+    assert tables['accidents']['date'].dt.year.eq(2019).all()
+
+def test_every_casualty_and_vehicle_has_an_accident(tmp_path):
+    tfl_ingest.ingest_year(2019, url = FIXTURE_URL, folder = str(tmp_path))
+    tables = tfl_ingest.load_tables([2019], folder = str(tmp_path))
+
+    ids = set(tables['accidents']['id'])
+    assert set(tables['casualties']['accident_id']) <= ids
+    assert set(tables['vehicles']['accident_id']) <= ids
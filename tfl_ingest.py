@@ -0,0 +1,204 @@
+'''
+This module downloads TfL's AccidentStats and flattens them into three typed tables,
+accidents, casualties and vehicles, joined by accident id.
+
+Years are fetched concurrently and each response is parsed with ijson as it streams in,
+then saved as one Parquet file per table per year, so memory use depends on the size of a
+year rather than the whole period.
+
+FIXTURE_URL is a synthetic year of 200 accidents in the API's format, made by
+synthetic_data.py, that stands in for the API in tests and without network access. A
+real year can be recorded with record_fixture.
+
+Run in command line (in main project directory):
+python tfl_ingest.py 2010 2019
+python tfl_ingest.py 2019 2019 --url data/fixtures/synthetic_AccidentStats_{year}.json --output data/tfl_fixture
+'''
+
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import ijson
+import pandas as pd
+from requests import Session
+from accident_severity import SEVERITY_TYPE
+
+ACCIDENT_STATS_URL = 'https://api.tfl.gov.uk/AccidentStats/{year}'
+TFL_FOLDER = 'data/tfl'
+# Made for 2019 by synthetic_data.py (seed 0, real ward boundaries), not recorded from the API
+FIXTURE_URL = 'data/fixtures/synthetic_AccidentStats_{year}.json'
+TABLES = ('accidents', 'casualties', 'vehicles')
+MAX_WORKERS = 4
+
+# Types of the columns of each table, other than the accidents' 'date', which is UTC
+TABLE_TYPES = {
+    'accidents': {'id': 'int64', 'lat': 'float64', 'lon': 'float64', 'location': 'string',
+                  'severity': SEVERITY_TYPE, 'borough': 'category'},
+    'casualties': {'accident_id': 'int64', 'age': 'Int16', 'class': 'category', 'severity': SEVERITY_TYPE,
+                   'mode': 'category', 'age_band': 'category'},
+    'vehicles': {'accident_id': 'int64', 'type': 'category'},
+}
+
+def _accident_records(stream):
+    return ijson.items(stream, 'item', use_float = True)
+
+def flatten(records):
+    """
+    Flattens accidents as they are formatted in TfL's API into three tables.
+
+    Args:
+        records (iterable): Accidents as they are formatted in TfL's API.
+
+    Returns:
+        (dict):
+            keys (str): 'accidents', 'casualties' and 'vehicles'.
+            values (DataFrame): Typed tables, where casualties and vehicles have an
+                                'accident_id' column matching the 'id' column of accidents.
+    """
+    accidents = {'id': [], 'lat': [], 'lon': [], 'location': [], 'date': [], 'severity': [], 'borough': []}
+    casualties = {'accident_id': [], 'age': [], 'class': [], 'severity': [], 'mode': [], 'age_band': []}
+    vehicles = {'accident_id': [], 'type': []}
+
+    for accident in records:
+        accident_id = accident['id']
+        for column in accidents:
+            accidents[column].append(accident.get(column))
+        for casualty in accident.get('casualties', []):
+            casualties['accident_id'].append(accident_id)
+            casualties['age'].append(casualty.get('age'))
+            casualties['class'].append(casualty.get('class'))
+            casualties['severity'].append(casualty.get('severity'))
+            casualties['mode'].append(casualty.get('mode'))
+            casualties['age_band'].append(casualty.get('ageBand'))
+        for vehicle in accident.get('vehicles', []):
+            vehicles['accident_id'].append(accident_id)
+            vehicles['type'].append(vehicle.get('type'))
+
+    df_accidents = pd.DataFrame(accidents).astype(TABLE_TYPES['accidents'])
+    df_accidents['date'] = pd.to_datetime(df_accidents['date'], utc = True, format = 'ISO8601')
+    df_casualties = pd.DataFrame(casualties).astype(TABLE_TYPES['casualties'])
+    df_vehicles = pd.DataFrame(vehicles).astype(TABLE_TYPES['vehicles'])
+    return {'accidents': df_accidents, 'casualties': df_casualties, 'vehicles': df_vehicles}
+
+def table_filename(table, year, folder = TFL_FOLDER):
+    """
+    Gets where a table of a year is saved.
+
+    Args:
+        table (str): 'accidents', 'casualties' or 'vehicles'.
+        year (int): Year of the accidents.
+        folder (str, default = TFL_FOLDER): Folder of saved tables.
+
+    Returns:
+        (str): Path of the Parquet file.
+    """
+    return os.path.join(folder, table, f'{year}.parquet')
+
+def ingest_year(year, url = ACCIDENT_STATS_URL, folder = TFL_FOLDER, session = None):
+    """
+    Downloads, flattens and saves a year of accidents.
+
+    Args:
+        year (int): Year of accidents to ingest.
+        url (str, default = ACCIDENT_STATS_URL): URL with a {year} placeholder, or the path of
+                                                 a recorded JSON file with a {year} placeholder.
+        folder (str, default = TFL_FOLDER): Folder to save the tables to.
+        session (requests.Session, default = None): Session to download with. If None then
+                                                    a new session is used.
+
+    Returns:
+        (int): Number of accidents in the year.
+    """
+    source = url.format(year = year)
+    if source.startswith('http'):
+        session = session or Session()
+        with session.get(source, stream = True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            tables = flatten(_accident_records(response.raw))
+    else:
+        with open(source, 'rb') as f:
+            tables = flatten(_accident_records(f))
+
+    for table in TABLES:
+        filename = table_filename(table, year, folder)
+        os.makedirs(os.path.dirname(filename), exist_ok = True)
+        tables[table].to_parquet(filename, index = False)
+    return len(tables['accidents'])
+
+def ingest(years, url = ACCIDENT_STATS_URL, folder = TFL_FOLDER, max_workers = MAX_WORKERS):
+    """
+    Downloads, flattens and saves several years of accidents concurrently.
+
+    Args:
+        years (iterable): Years of accidents to ingest.
+        url (str, default = ACCIDENT_STATS_URL): URL or recorded file path with a {year} placeholder.
+        folder (str, default = TFL_FOLDER): Folder to save the tables to.
+        max_workers (int, default = MAX_WORKERS): Number of years downloaded at once.
+
+    Returns:
+        (dict):
+            keys (int): Years.
+            values (int): Number of accidents in the year.
+    """
+    years = list(years)
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        counts = executor.map(lambda year: ingest_year(year, url, folder), years)
+        return dict(zip(years, counts))
+
+def load_tables(years = None, folder = TFL_FOLDER):
+    """
+    Reads saved tables back, concatenated across years.
+
+    Args:
+        years (iterable, default = None): Years to read. If None then every saved year is read.
+        folder (str, default = TFL_FOLDER): Folder of saved tables.
+
+    Returns:
+        (dict):
+            keys (str): 'accidents', 'casualties' and 'vehicles'.
+            values (DataFrame): Tables for the requested years.
+    """
+    if years == None:
+        years = sorted(int(filename[:-len('.parquet')])
+                       for filename in os.listdir(os.path.join(folder, 'accidents'))
+                       if filename.endswith('.parquet'))
+    tables = {}
+    for table in TABLES:
+        frames = [pd.read_parquet(table_filename(table, year, folder)) for year in years]
+        tables[table] = pd.concat(frames, ignore_index = True)
+        # Categories can differ between years, so restore categorical columns after concatenating
+        for column, dtype in frames[0].dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype) and not dtype.ordered:
+                tables[table][column] = tables[table][column].astype('category')
+    return tables
+
+def record_fixture(year, path, limit = 200, url = ACCIDENT_STATS_URL):
+    """
+    Saves the first accidents of a year from TfL's API, to stand in for the API in tests.
+
+    Args:
+        year (int): Year of accidents to record.
+        path (str): Output JSON file, e.g. 'data/fixtures/AccidentStats_2019.json'.
+        limit (int, default = 200): Number of accidents to keep.
+        url (str, default = ACCIDENT_STATS_URL): URL with a {year} placeholder.
+
+    Returns: None.
+    """
+    response = Session().get(url.format(year = year))
+    response.raise_for_status()
+    with open(path, 'w') as f:
+        json.dump(response.json()[:limit], f)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Download and flatten TfL AccidentStats.")
+    parser.add_argument('first_year', type = int)
+    parser.add_argument('last_year', type = int)
+    parser.add_argument('--url', default = ACCIDENT_STATS_URL)
+    parser.add_argument('--output', default = TFL_FOLDER)
+    parser.add_argument('--workers', type = int, default = MAX_WORKERS)
+    args = parser.parse_args()
+    counts = ingest(range(args.first_year, args.last_year + 1), args.url, args.output, args.workers)
+    for year, count in counts.items():
+        print(f"{year}: {count} accidents")
@@ -0,0 +1,405 @@
+'''
+This module cuts the ward and borough casualty choropleths and the accident points into
+Mapbox vector tiles (MVT), stores them in an MBTiles (SQLite) file, and serves them over
+HTTP so map clients only download the tiles in view.
+
+Boundaries are simplified to about one pixel at each zoom level, so low zoom levels stay
+small however detailed the source shapefiles are. Below POINTS_MIN_ZOOM, accidents are
+tiled as the density bins of density_bins.py rather than as points, and any tile still
+larger than MAX_TILE_BYTES has its points thinned, keeping fatal and serious accidents first.
+
+Run in command line (in main project directory):
+python vector_tiles.py build
+python vector_tiles.py serve
+
+The tiles can then be drawn with, for example,
+pydeck.Layer('MVTLayer', data = 'http://127.0.0.1:8765/tiles/{z}/{x}/{y}.pbf')
+'''
+
+import os
+import re
+import gzip
+import json
+import sqlite3
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely import STRtree
+import mapbox_vector_tile
+from mapbox_vector_tile.encoder import on_invalid_geometry_make_valid
+import app_data
+import points_store
+import density_bins
+from accident_severity import SEVERITIES
+
+MBTILES_PATH = 'data/london.mbtiles'
+MIN_ZOOM = 9
+MAX_ZOOM = 14 # Clients scale the highest zoom level's tiles up beyond this
+EXTENT = 4096
+BUFFER = 64 # Tile units drawn beyond each tile's edge, so strokes don't get cut at the seams
+PORT = 8765
+POINTS_MIN_ZOOM = 13 # Lowest zoom level with accidents as points rather than density bins
+MAX_TILE_BYTES = 500 * 1024 # Largest uncompressed tile, as recommended by the MVT specification
+THINNED_LAYERS = ('accidents',) # Layers whose features may be dropped to fit MAX_TILE_BYTES
+
+HALF_WORLD = 20037508.342789244 # Half the width of the world in Web Mercator metres
+
+def tile_bounds(zoom, x, y):
+    """
+    Gets the Web Mercator bounds of a tile.
+
+    Args:
+        zoom (int): Zoom level.
+        x (int): Tile column, counted from the west.
+        y (int): Tile row, counted from the north.
+
+    Returns:
+        (tuple): minx, miny, maxx, maxy in metres.
+    """
+    size = 2 * HALF_WORLD / 2 ** zoom
+    minx = -HALF_WORLD + x * size
+    maxy = HALF_WORLD - y * size
+    return (minx, maxy - size, minx + size, maxy)
+
+def tile_range(bounds, zoom):
+    """
+    Gets the tiles that cover some Web Mercator bounds.
+
+    Args:
+        bounds (tuple): minx, miny, maxx, maxy in metres.
+        zoom (int): Zoom level.
+
+    Returns:
+        (tuple): Ranges of tile columns and tile rows.
+    """
+    size = 2 * HALF_WORLD / 2 ** zoom
+    minx, miny, maxx, maxy = bounds
+    columns = range(int((minx + HALF_WORLD) // size), int((maxx + HALF_WORLD) // size) + 1)
+    rows = range(int((HALF_WORLD - maxy) // size), int((HALF_WORLD - miny) // size) + 1)
+    return columns, rows
+
+def load_layers():
+    """
+    Loads the layers to tile, in Web Mercator.
+
+    Returns:
+        (dict):
+            keys (str): Layer names 'boroughs', 'wards' and 'accidents'.
+            values (GeoDataFrame): Features of the layer, whose other columns become tile attributes.
+    """
+    gdf_wards = gpd.read_file(app_data.WARD_CASUALTIES_PATH)
+    gdf_wards['ward'] = gdf_wards['ward'].str.replace('\n', ' ') # Undo spaces_to_breaks
+    gdf_boroughs = gpd.read_file(app_data.BOROUGH_CASUALTIES_PATH)
+    if os.path.exists(app_data.POINTS_PATH):
+        gdf_points = points_store.read_points(app_data.POINTS_PATH)
+    else:
+        gdf_points = points_store.read_points_tree()
+    gdf_points = gdf_points[['Severity', 'size', 'borough', 'ward', 'geometry']]
+    return {name: gdf.to_crs(epsg = 3857) for name, gdf in
+            [('boroughs', gdf_boroughs), ('wards', gdf_wards), ('accidents', gdf_points)]}
+
+def by_priority(gdf_points, seed = 0):
+    """
+    Orders accident points so the ones to keep when a tile is thinned come first.
+
+    Args:
+        gdf_points (GeoDataFrame): Accidents with a 'Severity' column.
+        seed (int, default = 0): Seed of the shuffle within each severity, so thinning keeps
+                                 points spread evenly and tiles are the same on every build.
+
+    Returns:
+        (GeoDataFrame): gdf_points, fatal accidents first, then serious and then slight.
+    """
+    shuffled = gdf_points.iloc[np.random.default_rng(seed).permutation(len(gdf_points))]
+    rank = pd.Categorical(shuffled['Severity'], categories = SEVERITIES[::-1]).codes
+    return shuffled.iloc[np.argsort(rank, kind = 'stable')]
+
+def accident_bins(gdf_points, zoom):
+    """
+    Counts accidents in the hexagonal density bins of a zoom level.
+
+    Args:
+        gdf_points (GeoDataFrame): Accidents with a 'Severity' column, in Web Mercator.
+        zoom (int): Zoom level.
+
+    Returns:
+        (GeoDataFrame): Centres of bins with accidents, in Web Mercator, with 'slight',
+                        'serious', 'fatal' and 'total' counts.
+    """
+    size = density_bins.cell_size(zoom)
+    columns, rows = density_bins.cells(gdf_points.geometry.x.to_numpy(), gdf_points.geometry.y.to_numpy(), size)
+    counts = pd.DataFrame({'column': columns, 'row': rows,
+                           'severity': pd.Categorical(gdf_points['Severity'], categories = SEVERITIES).codes})\
+        .groupby(['column', 'row', 'severity']).size().unstack(fill_value = 0)\
+        .reindex(columns = range(len(SEVERITIES)), fill_value = 0)
+    counts.columns = [severity.lower() for severity in SEVERITIES]
+    counts['total'] = counts.sum(axis = 1)
+    counts = counts.reset_index()
+    x, y = density_bins.cell_centres(counts['column'].to_numpy(), counts['row'].to_numpy(), size)
+    return gpd.GeoDataFrame(counts.drop(columns = ['column', 'row']), geometry = shapely.points(x, y), crs = 3857)
+
+def _properties(gdf):
+    columns = [column for column in gdf.columns if column != gdf.geometry.name]
+    records = gdf[columns].astype(object).where(gdf[columns].notna(), None).to_dict('records')
+    # MVT attributes can only be strings, numbers or booleans
+    return [{key: (value.item() if isinstance(value, np.generic) else value)
+             for key, value in record.items() if value != None} for record in records]
+
+def encode_tile(layers, zoom, x, y, max_bytes = MAX_TILE_BYTES):
+    """
+    Encodes the features of every layer that fall within a tile.
+
+    Args:
+        layers (dict):
+            keys (str): Layer names.
+            values (tuple): Simplified geometries for the zoom level, their attributes and an
+                            STRtree of the geometries. Geometries of THINNED_LAYERS are in
+                            the order they should be kept in.
+        zoom (int): Zoom level.
+        x (int): Tile column.
+        y (int): Tile row.
+        max_bytes (int, default = MAX_TILE_BYTES): Largest the encoded tile may be. Larger
+                                                   tiles keep halving the features of
+                                                   THINNED_LAYERS until they fit. If None
+                                                   then tiles aren't thinned.
+
+    Returns:
+        (bytes): Encoded tile, or None if no layer has features within it.
+    """
+    minx, miny, maxx, maxy = tile_bounds(zoom, x, y)
+    scale = EXTENT / (maxx - minx)
+    margin = BUFFER / scale
+    tile_layers = []
+    for name, (geometries, properties, tree) in layers.items():
+        hits = tree.query(shapely.box(minx - margin, miny - margin, maxx + margin, maxy + margin))
+        if len(hits) == 0:
+            continue
+        hits.sort()
+        clipped = shapely.clip_by_rect(geometries[hits], minx - margin, miny - margin, maxx + margin, maxy + margin)
+        # Tile coordinates run from the top left corner of the tile
+        clipped = shapely.transform(clipped, lambda c: np.column_stack([(c[:, 0] - minx) * scale,
+                                                                         (maxy - c[:, 1]) * scale]).round())
+        features = [{'geometry': geometry, 'properties': properties[hit]}
+                    for geometry, hit in zip(clipped, hits) if not geometry.is_empty]
+        if len(features) > 0:
+            tile_layers.append({'name': name, 'features': features})
+    if len(tile_layers) == 0:
+        return None
+    while True:
+        tile = mapbox_vector_tile.encode(tile_layers, default_options = {
+            'extents': EXTENT,
+            'y_coord_down': True,
+            'on_invalid_geometry': on_invalid_geometry_make_valid,
+            })
+        thinned = [layer for layer in tile_layers if layer['name'] in THINNED_LAYERS and len(layer['features']) > 1]
+        if max_bytes == None or len(tile) <= max_bytes or len(thinned) == 0:
+            return tile
+        for layer in thinned:
+            layer['features'] = layer['features'][:len(layer['features']) // 2]
+
+def build_mbtiles(path = MBTILES_PATH, min_zoom = MIN_ZOOM, max_zoom = MAX_ZOOM, layers = None):
+    """
+    Tiles every layer at every zoom level into an MBTiles file.
+
+    Accidents below POINTS_MIN_ZOOM are written as an 'accident_bins' layer of counts
+    instead of the 'accidents' layer.
+
+    Args:
+        path (str, default = MBTILES_PATH): Output MBTiles file, which is replaced if it exists.
+        min_zoom (int, default = MIN_ZOOM): Lowest zoom level.
+        max_zoom (int, default = MAX_ZOOM): Highest zoom level.
+        layers (dict, default = None): Layers as returned by load_layers. If None then load_layers is used.
+
+    Returns:
+        (int): Number of tiles written.
+    """
+    if layers == None:
+        layers = load_layers()
+    layers = dict(layers)
+    if 'accidents' in layers:
+        layers['accidents'] = by_priority(layers['accidents'])
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+    connection.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, "
+                       "tile_data BLOB, PRIMARY KEY (zoom_level, tile_column, tile_row))")
+
+    properties = {name: _properties(gdf) for name, gdf in layers.items()}
+    minx = min(gdf.total_bounds[0] for gdf in layers.values())
+    miny = min(gdf.total_bounds[1] for gdf in layers.values())
+    maxx = max(gdf.total_bounds[2] for gdf in layers.values())
+    maxy = max(gdf.total_bounds[3] for gdf in layers.values())
+
+    count = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        pixel = 2 * HALF_WORLD / 2 ** zoom / 256
+        zoom_layers = {}
+        for name, gdf in layers.items():
+            if name == 'accidents' and zoom < POINTS_MIN_ZOOM:
+                gdf_bins = accident_bins(gdf, zoom)
+                geometries = np.asarray(gdf_bins.geometry)
+                zoom_layers['accident_bins'] = (geometries, _properties(gdf_bins), STRtree(geometries))
+                continue
+            geometries = np.asarray(gdf.geometry)
+            if name != 'accidents':
+                geometries = shapely.simplify(geometries, pixel, preserve_topology = True)
+            zoom_layers[name] = (geometries, properties[name], STRtree(geometries))
+
+        columns, rows = tile_range((minx, miny, maxx, maxy), zoom)
+        for x in columns:
+            for y in rows:
+                tile = encode_tile(zoom_layers, zoom, x, y)
+                if tile == None:
+                    continue
+                # MBTiles counts rows from the south
+                connection.execute("INSERT INTO tiles VALUES (?, ?, ?, ?)",
+                                   (zoom, x, 2 ** zoom - 1 - y, gzip.compress(tile)))
+                count += 1
+        connection.commit()
+
+    lon_lat = gpd.GeoSeries(shapely.points([minx, maxx], [miny, maxy]), crs = 3857).to_crs(epsg = 4326)
+    west, south, east, north = lon_lat.x[0], lon_lat.y[0], lon_lat.x[1], lon_lat.y[1]
+    vector_layers = [{'id': name, 'fields': {column: 'Number' if gdf[column].dtype.kind in 'iuf' else 'String'
+                                             for column in gdf.columns if column != gdf.geometry.name}}
+                     for name, gdf in layers.items()]
+    if 'accidents' in layers and min_zoom < POINTS_MIN_ZOOM:
+        vector_layers.append({'id': 'accident_bins', 'maxzoom': POINTS_MIN_ZOOM - 1,
+                              'fields': {column: 'Number' for column in [severity.lower() for severity in SEVERITIES] + ['total']}})
+        vector_layers[list(layers).index('accidents')]['minzoom'] = POINTS_MIN_ZOOM
+    metadata = {
+        'name': 'London accidents',
+        'format': 'pbf',
+        'minzoom': str(min_zoom),
+        'maxzoom': str(max_zoom),
+        'bounds': f"{west},{south},{east},{north}",
+        'center': f"{(west + east) / 2},{(south + north) / 2},{min_zoom}",
+        'json': json.dumps({'vector_layers': vector_layers}),
+    }
+    connection.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+    connection.commit()
+    connection.close()
+    return count
+
+class _TileHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/tiles.json':
+            return self.send_tilejson()
+        match = re.fullmatch(r'/tiles/(\d+)/(\d+)/(\d+)\.pbf', path)
+        if match == None:
+            return self.send_error(404)
+        zoom, x, y = (int(group) for group in match.groups())
+        row = self.server.connection().execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, 2 ** zoom - 1 - y)).fetchone()
+        if row == None: # Nothing to draw in this tile
+            self.send_response(204)
+            self.send_cors_headers()
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.mapbox-vector-tile')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(row[0])))
+        self.send_header('Cache-Control', 'public, max-age=86400')
+        self.send_cors_headers()
+        self.end_headers()
+        self.wfile.write(row[0])
+
+    def send_tilejson(self):
+        metadata = dict(self.server.connection().execute("SELECT name, value FROM metadata").fetchall())
+        host = self.headers.get('Host', f"127.0.0.1:{self.server.server_address[1]}")
+        tilejson = {
+            'tilejson': '2.2.0',
+            'tiles': [f"http://{host}/tiles/{{z}}/{{x}}/{{y}}.pbf"],
+            'minzoom': int(metadata['minzoom']),
+            'maxzoom': int(metadata['maxzoom']),
+            'bounds': [float(value) for value in metadata['bounds'].split(',')],
+            **json.loads(metadata['json']),
+        }
+        body = json.dumps(tilejson).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_cors_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_cors_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+
+    def log_message(self, format, *args):
+        pass
+
+class TileServer(ThreadingHTTPServer):
+    """
+    HTTP server for the tiles of an MBTiles file, at /tiles/{z}/{x}/{y}.pbf, with a
+    TileJSON description at /tiles.json.
+
+    Args:
+        path (str, default = MBTILES_PATH): MBTiles file to serve.
+        port (int, default = PORT): Port to listen on. If 0 then a free port is chosen.
+    """
+    daemon_threads = True
+
+    def __init__(self, path = MBTILES_PATH, port = PORT):
+        super().__init__(('127.0.0.1', port), _TileHandler)
+        self.mbtiles_path = path
+        self.local = threading.local()
+
+    def connection(self):
+        """
+        Gets this thread's read-only connection to the MBTiles file.
+
+        Returns:
+            (sqlite3.Connection): Connection to the MBTiles file.
+        """
+        if not hasattr(self.local, 'connection'):
+            self.local.connection = sqlite3.connect(f"file:{self.mbtiles_path}?mode=ro", uri = True)
+        return self.local.connection
+
+    def url(self):
+        """
+        Gets the URL template of the tiles, for map clients.
+
+        Returns:
+            (str): URL with {z}, {x} and {y} placeholders.
+        """
+        return f"http://127.0.0.1:{self.server_address[1]}/tiles/{{z}}/{{x}}/{{y}}.pbf"
+
+def serve_in_background(path = MBTILES_PATH, port = PORT):
+    """
+    Starts a TileServer in a background thread, e.g. alongside a Streamlit application.
+
+    Args:
+        path (str, default = MBTILES_PATH): MBTiles file to serve.
+        port (int, default = PORT): Port to listen on. If 0 then a free port is chosen.
+
+    Returns:
+        (TileServer): Running server. server.shutdown() stops it.
+    """
+    server = TileServer(path, port)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Build or serve vector tiles of London accidents.")
+    parser.add_argument('command', choices = ['build', 'serve'])
+    parser.add_argument('--mbtiles', default = MBTILES_PATH)
+    parser.add_argument('--min-zoom', type = int, default = MIN_ZOOM)
+    parser.add_argument('--max-zoom', type = int, default = MAX_ZOOM)
+    parser.add_argument('--port', type = int, default = PORT)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print(f"Saved {build_mbtiles(args.mbtiles, args.min_zoom, args.max_zoom)} tiles to {args.mbtiles}")
+    else:
+        server = TileServer(args.mbtiles, args.port)
+        print(f"Serving {args.mbtiles} at {server.url()}")
+        server.serve_forever()
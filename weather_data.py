@@ -0,0 +1,110 @@
+'''
+This module contains the cached loader of the accidents merged with their weather, shared
+by the Streamlit applications.
+
+Each merged CSV is converted once into a typed Parquet copy next to it, which is read
+instead of the CSV for as long as it is newer than the CSV.
+
+Run in command line (in main project directory) to convert every merged CSV ahead of time:
+python weather_data.py
+'''
+
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import streamlit as st
+from accident_severity import SEVERITY_TYPE
+from instrumentation import timed
+
+FATAL_WEATHER_PATH = 'merged_fatal_accidents_weather.csv'
+FIRST_BATCH_WEATHER_PATH = 'merged_first_batch_accidents_weather.csv'
+
+# Names the applications show each weather variable by
+WEATHER_PARAMETERS = {
+    'temperature_2m': 'Temperature (°C)',
+    'relative_humidity_2m': 'Humidity (%)',
+    'precipitation': 'Precipitation (mm)',
+    'rain': 'Rain (mm)',
+    'snowfall': 'Snowfall (cm)',
+    'cloud_cover': 'Cloud Cover (%)',
+    'wind_speed_10m': 'Wind Speed (km/h)',
+}
+
+# Columns from TfL's API, and their types. Every other column is a weather variable.
+ACCIDENT_COLUMNS = {'id': 'int64', 'lat': 'float64', 'lon': 'float64', 'location': 'string',
+                    'severity': SEVERITY_TYPE, 'borough': 'category'}
+
+def sidecar_path(csv):
+    """
+    Gets the path of the typed Parquet copy of a merged CSV.
+
+    Args:
+        csv (str): Path to a merged accidents and weather CSV.
+
+    Returns:
+        (str): Path to the Parquet file next to the CSV.
+    """
+    return os.path.splitext(csv)[0] + '.parquet'
+
+@timed('load.weather')
+def read_weather_data(csv):
+    """
+    Reads accidents merged with their weather, with typed columns.
+
+    Boroughs are categorical, severities are ordered categorical, dates are UTC and
+    weather variables are float32.
+
+    Args:
+        csv (str): Path to a merged accidents and weather CSV.
+
+    Returns:
+        (DataFrame): Accidents and the weather at their time and place.
+    """
+    sidecar = sidecar_path(csv)
+    if os.path.exists(sidecar) and os.path.getmtime(sidecar) >= os.path.getmtime(csv):
+        return pd.read_parquet(sidecar)
+
+    df_weather = pd.read_csv(csv)
+    weather_columns = [column for column in df_weather if column not in ACCIDENT_COLUMNS and column != 'date']
+    df_weather = df_weather.astype({**{column: dtype for column, dtype in ACCIDENT_COLUMNS.items() if column in df_weather},
+                                    **{column: np.float32 for column in weather_columns}})
+    df_weather['date'] = pd.to_datetime(df_weather['date'], utc = True, format = 'ISO8601')
+
+    # A read-only deployment still works, it just parses the CSV on every cold start
+    try:
+        df_weather.to_parquet(sidecar, index = False)
+    except OSError:
+        pass
+    return df_weather
+
+@st.cache_data(show_spinner = False)
+def _cached_weather_data(csv, mtime):
+    # mtime is only part of the cache key, so editing the CSV invalidates the cache
+    return read_weather_data(csv)
+
+def load_weather_data(csv = FATAL_WEATHER_PATH, display_names = False):
+    """
+    Gets accidents merged with their weather.
+
+    Args:
+        csv (str, default = FATAL_WEATHER_PATH): Path to a merged accidents and weather CSV.
+        display_names (bool, default = False): True if weather variables should be renamed
+                                               to their names in WEATHER_PARAMETERS.
+
+    Returns:
+        (DataFrame): Accidents and the weather at their time and place, as returned by
+                     read_weather_data.
+    """
+    df_weather = _cached_weather_data(csv, os.path.getmtime(csv))
+    if display_names:
+        return df_weather.rename(columns = WEATHER_PARAMETERS)
+    return df_weather
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Convert the merged accidents and weather CSVs to typed Parquet.")
+    parser.add_argument('csvs', nargs = '*', default = [FATAL_WEATHER_PATH, FIRST_BATCH_WEATHER_PATH])
+    args = parser.parse_args()
+    for csv in args.csvs:
+        df_weather = read_weather_data(csv)
+        print(f"Saved {len(df_weather)} accidents to {sidecar_path(csv)}")
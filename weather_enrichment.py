@@ -0,0 +1,379 @@
+'''
+This module adds hourly Open-Meteo weather to accidents in bulk.
+
+Accidents are grouped by grid cell and year so a single archive request covers every
+accident in that cell that year, requests are issued concurrently under a rate limit,
+and each completed request is checkpointed so an interrupted run picks up where it left
+off.
+
+Run in command line (in main project directory):
+python weather_enrichment.py accidents.csv merged_all_accidents_weather.csv
+python weather_enrichment.py --check
+'''
+
+import os
+import json
+import time
+import tempfile
+import argparse
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+import requests
+from tqdm.auto import tqdm
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+HOURLY_VARIABLES = ["temperature_2m", "relative_humidity_2m", "precipitation", "rain", "snowfall", "cloud_cover", "wind_speed_10m"]
+
+# Open-Meteo's archive is built from reanalyses with cells of 0.1 degrees or larger,
+# so accidents within the same 0.1 degree cell get the same weather
+GRID_RESOLUTION = 0.1
+CHECKPOINT_FOLDER = 'cache/weather'
+MAX_WORKERS = 8
+REQUESTS_PER_MINUTE = 500 # Open-Meteo's free tier allows 600
+RETRIES = 5
+
+class RateLimiter:
+    """
+    Spaces out requests made from several threads so no more than a given number are
+    started per minute, and pauses every thread when the server reports a rate limit.
+
+    Args:
+        requests_per_minute (int): Maximum number of requests started per minute.
+    """
+    def __init__(self, requests_per_minute):
+        self.interval = 60 / requests_per_minute
+        self.next_request = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Blocks until the calling thread may start a request.
+
+        Returns: None.
+        """
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_request)
+            self.next_request = start + self.interval
+        time.sleep(max(0, start - now))
+
+    def pause(self, seconds):
+        """
+        Delays every later request by a number of seconds.
+
+        Args:
+            seconds (float): Length of the pause.
+
+        Returns: None.
+        """
+        with self.lock:
+            self.next_request = max(self.next_request, time.monotonic() + seconds)
+
+def grid_cells(accidents, resolution = GRID_RESOLUTION):
+    """
+    Adds the grid cell, year and hour of each accident.
+
+    Args:
+        accidents (DataFrame): Accidents with 'lat', 'lon' and 'date' columns.
+        resolution (float, default = GRID_RESOLUTION): Size of grid cells in degrees.
+
+    Returns:
+        (DataFrame): Copy of accidents with 'cell_lat', 'cell_lon', 'year' and 'date_hour' columns.
+    """
+    accidents = accidents.copy()
+    accidents['cell_lat'] = (np.round(accidents['lat'].to_numpy(dtype = float) / resolution) * resolution).round(4)
+    accidents['cell_lon'] = (np.round(accidents['lon'].to_numpy(dtype = float) / resolution) * resolution).round(4)
+    accidents['date_hour'] = pd.to_datetime(accidents['date'], utc = True, format = 'ISO8601').dt.floor('h')
+    accidents['year'] = accidents['date_hour'].dt.year
+    return accidents
+
+def plan_requests(accidents):
+    """
+    Makes one archive request for each grid cell and year that has accidents.
+
+    Args:
+        accidents (DataFrame): Output of grid_cells.
+
+    Returns:
+        (DataFrame): 'cell_lat', 'cell_lon', 'year', 'start_date' and 'end_date' of each request.
+    """
+    tasks = accidents.groupby(['cell_lat', 'cell_lon', 'year'])['date_hour'].agg(['min', 'max']).reset_index()
+    tasks['start_date'] = tasks['min'].dt.strftime('%Y-%m-%d')
+    tasks['end_date'] = tasks['max'].dt.strftime('%Y-%m-%d')
+    return tasks.drop(columns = ['min', 'max'])
+
+def checkpoint_filename(task, folder = CHECKPOINT_FOLDER):
+    """
+    Gets where the weather for a request is saved once fetched.
+
+    Args:
+        task (Series or dict): Row of plan_requests.
+        folder (str, default = CHECKPOINT_FOLDER): Folder of completed requests.
+
+    Returns:
+        (str): Path of the request's Parquet file.
+    """
+    return os.path.join(folder, f"{task['cell_lat']}_{task['cell_lon']}_{task['start_date']}_{task['end_date']}.parquet")
+
+_sessions = threading.local()
+
+def _session():
+    # requests.Session isn't thread-safe, so each worker thread gets its own
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+def _retry_after(value, default):
+    # Retry-After is either a number of seconds or an HTTP date
+    if value == None:
+        return default
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0)
+    except (TypeError, ValueError): # Not a date, or a date without a timezone
+        return default
+
+def fetch_cell(task, url = ARCHIVE_URL, limiter = None, retries = RETRIES):
+    """
+    Fetches the hourly weather of a grid cell for a date range.
+
+    Args:
+        task (Series or dict): Row of plan_requests.
+        url (str, default = ARCHIVE_URL): Open-Meteo archive endpoint.
+        limiter (RateLimiter, default = None): Shared rate limiter. If None then requests
+                                               aren't rate limited.
+        retries (int, default = RETRIES): Number of retries after rate limiting or server errors.
+
+    Returns:
+        (DataFrame): HOURLY_VARIABLES as float32 with 'cell_lat', 'cell_lon' and 'date_hour' columns.
+    """
+    params = {
+        'latitude': task['cell_lat'],
+        'longitude': task['cell_lon'],
+        'start_date': task['start_date'],
+        'end_date': task['end_date'],
+        'hourly': ','.join(HOURLY_VARIABLES),
+        'timeformat': 'unixtime',
+        'timezone': 'GMT',
+    }
+    for attempt in range(retries + 1):
+        if limiter != None:
+            limiter.wait()
+        try:
+            response = _session().get(url, params = params, timeout = 60)
+        except requests.exceptions.ConnectionError:
+            if attempt == retries:
+                raise
+            time.sleep(2 ** attempt)
+            continue
+        if response.status_code == 429 or response.status_code >= 500:
+            if attempt == retries:
+                response.raise_for_status()
+            wait = _retry_after(response.headers.get('Retry-After'), 2 ** attempt * 5)
+            if limiter != None:
+                limiter.pause(wait)
+            else:
+                time.sleep(wait)
+            continue
+        response.raise_for_status()
+        break
+
+    hourly = response.json()['hourly']
+    weather = pd.DataFrame({variable: np.asarray(hourly[variable], dtype = np.float32)
+                            for variable in HOURLY_VARIABLES})
+    weather['date_hour'] = pd.to_datetime(hourly['time'], unit = 's', utc = True)
+    weather['cell_lat'] = task['cell_lat']
+    weather['cell_lon'] = task['cell_lon']
+    return weather
+
+def _fetch_and_checkpoint(task, folder, url, limiter):
+    weather = fetch_cell(task, url = url, limiter = limiter)
+    filename = checkpoint_filename(task, folder)
+    weather.to_parquet(filename + '.tmp', index = False)
+    os.replace(filename + '.tmp', filename)
+    return filename
+
+def enrich(accidents, folder = CHECKPOINT_FOLDER, url = ARCHIVE_URL, max_workers = MAX_WORKERS,
+           requests_per_minute = REQUESTS_PER_MINUTE, resolution = GRID_RESOLUTION, progress = True):
+    """
+    Adds the weather at the hour and place of every accident.
+
+    Requests that were completed by an earlier call with the same folder are not repeated.
+
+    Args:
+        accidents (DataFrame): Accidents with 'lat', 'lon' and 'date' columns.
+        folder (str, default = CHECKPOINT_FOLDER): Folder to save completed requests to.
+        url (str, default = ARCHIVE_URL): Open-Meteo archive endpoint.
+        max_workers (int, default = MAX_WORKERS): Number of requests in flight at once.
+        requests_per_minute (int, default = REQUESTS_PER_MINUTE): Maximum requests started per minute.
+        resolution (float, default = GRID_RESOLUTION): Size of grid cells in degrees.
+        progress (bool, default = True): True if a progress bar should be shown.
+
+    Returns:
+        (DataFrame): accidents with a column for each of HOURLY_VARIABLES.
+    """
+    os.makedirs(folder, exist_ok = True)
+    gridded = grid_cells(accidents, resolution)
+    tasks = plan_requests(gridded)
+    filenames = [checkpoint_filename(task, folder) for _, task in tasks.iterrows()]
+    pending = [task for (_, task), filename in zip(tasks.iterrows(), filenames) if not os.path.exists(filename)]
+
+    limiter = RateLimiter(requests_per_minute)
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        futures = [executor.submit(_fetch_and_checkpoint, task, folder, url, limiter) for task in pending]
+        for future in tqdm(as_completed(futures), total = len(futures), desc = "Weather requests",
+                           unit = " Requests", disable = not progress):
+            future.result()
+
+    weather = pd.concat([pd.read_parquet(filename) for filename in filenames], ignore_index = True)\
+        .drop_duplicates(['cell_lat', 'cell_lon', 'date_hour'])
+    enriched = gridded.merge(weather, on = ['cell_lat', 'cell_lon', 'date_hour'], how = 'left')
+    enriched.index = accidents.index
+    return enriched.drop(columns = ['cell_lat', 'cell_lon', 'year', 'date_hour'])
+
+def fetch_area(latitude, longitude, start_date, end_date, folder = CHECKPOINT_FOLDER, url = ARCHIVE_URL,
+               resolution = GRID_RESOLUTION):
+    """
+    Fetches the hourly weather of the grid cell around a place for a date range, saving it
+    so later calls for the same cell and dates don't repeat the request.
+
+    Args:
+        latitude (float): Latitude in degrees.
+        longitude (float): Longitude in degrees.
+        start_date (str): First day, as YYYY-MM-DD.
+        end_date (str): Last day, as YYYY-MM-DD.
+        folder (str, default = CHECKPOINT_FOLDER): Folder to save completed requests to.
+        url (str, default = ARCHIVE_URL): Open-Meteo archive endpoint.
+        resolution (float, default = GRID_RESOLUTION): Size of grid cells in degrees.
+
+    Returns:
+        (DataFrame): Output of fetch_cell.
+    """
+    task = {'cell_lat': round(round(latitude / resolution) * resolution, 4),
+            'cell_lon': round(round(longitude / resolution) * resolution, 4),
+            'start_date': start_date, 'end_date': end_date}
+    filename = checkpoint_filename(task, folder)
+    if not os.path.exists(filename):
+        os.makedirs(folder, exist_ok = True)
+        _fetch_and_checkpoint(task, folder, url, None)
+    return pd.read_parquet(filename)
+
+class _MockArchiveHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        latitude = float(query['latitude'][0])
+        longitude = float(query['longitude'][0])
+        start = pd.Timestamp(query['start_date'][0], tz = 'UTC')
+        end = pd.Timestamp(query['end_date'][0], tz = 'UTC') + pd.Timedelta(days = 1)
+        times = pd.date_range(start, end, freq = 'h', inclusive = 'left')
+        seconds = times.asi8 // 10**9
+
+        # Deterministic values that vary with place and time, so tests can check lookups
+        hourly = {'time': seconds.tolist()}
+        for i, variable in enumerate(query['hourly'][0].split(',')):
+            hourly[variable] = (np.sin(seconds / 3600 / 24 + i) * 10 + latitude + longitude).round(2).tolist()
+
+        body = json.dumps({'latitude': latitude, 'longitude': longitude, 'hourly': hourly}).encode()
+        self.server.requests_served += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_mock_archive(port = 0):
+    """
+    Starts a local stand-in for the Open-Meteo archive API in a background thread.
+
+    Args:
+        port (int, default = 0): Port to listen on. If 0 then a free port is chosen.
+
+    Returns:
+        (ThreadingHTTPServer): Running server. Its requests_served attribute counts requests,
+                               and server.shutdown() stops it.
+        (str): URL to pass to enrich or fetch_cell as url.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), _MockArchiveHandler)
+    server.requests_served = 0
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/archive"
+
+def check_against_mock(count = 1000, seed = 0):
+    """
+    Enriches random accidents from a mock archive, checking that every accident gets the
+    weather of its cell and hour and that running again reuses the saved requests.
+
+    Args:
+        count (int, default = 1000): Number of accidents.
+        seed (int, default = 0): Seed of the random accidents.
+
+    Returns:
+        (list): Descriptions of the problems found, which is empty if there are none.
+    """
+    rng = np.random.default_rng(seed)
+    accidents = pd.DataFrame({
+        'lat': rng.uniform(51.3, 51.7, count),
+        'lon': rng.uniform(-0.5, 0.3, count),
+        'date': pd.Timestamp('2015-01-01', tz = 'UTC') + pd.to_timedelta(rng.integers(0, 3 * 365 * 24 * 60, count), unit = 'min'),
+        })
+    server, url = serve_mock_archive()
+    problems = []
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            enriched = enrich(accidents, folder = folder, url = url, progress = False)
+            requests_made = server.requests_served
+            if requests_made != len(plan_requests(grid_cells(accidents))):
+                problems.append(f"made {requests_made} requests rather than one per grid cell and year")
+
+            # The mock's weather at each accident's cell and hour
+            gridded = grid_cells(accidents)
+            seconds = gridded['date_hour'].dt.tz_localize(None).to_numpy().astype('datetime64[s]').astype(np.int64)
+            for i, variable in enumerate(HOURLY_VARIABLES):
+                expected = (np.sin(seconds / 3600 / 24 + i) * 10 + gridded['cell_lat'] + gridded['cell_lon']).round(2)
+                if not np.allclose(enriched[variable].to_numpy(dtype = float), expected, atol = 1e-3):
+                    problems.append(f"{variable} differs from the weather of the accidents' cells and hours")
+
+            enrich(accidents, folder = folder, url = url, progress = False)
+            if server.requests_served != requests_made:
+                problems.append(f"repeated {server.requests_served - requests_made} saved requests")
+    finally:
+        server.shutdown()
+    return problems
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Add hourly weather to a CSV of accidents.")
+    parser.add_argument('accidents', nargs = '?', help = "CSV with 'lat', 'lon' and 'date' columns")
+    parser.add_argument('output', nargs = '?')
+    parser.add_argument('--check', action = 'store_true', help = "Check enrichment against a mock archive instead.")
+    parser.add_argument('--checkpoints', default = CHECKPOINT_FOLDER)
+    parser.add_argument('--workers', type = int, default = MAX_WORKERS)
+    parser.add_argument('--requests-per-minute', type = int, default = REQUESTS_PER_MINUTE)
+    parser.add_argument('--url', default = ARCHIVE_URL)
+    args = parser.parse_args()
+
+    if args.check:
+        problems = check_against_mock()
+        for problem in problems:
+            print(problem)
+        if len(problems) > 0:
+            raise SystemExit(1)
+        print("Enrichment matches the mock archive")
+        raise SystemExit(0)
+    if args.accidents == None or args.output == None:
+        parser.error("accidents and output are required unless --check is given")
+
+    df_accidents = pd.read_csv(args.accidents)
+    enrich(df_accidents, folder = args.checkpoints, url = args.url, max_workers = args.workers,
+           requests_per_minute = args.requests_per_minute).to_csv(args.output, index = False)
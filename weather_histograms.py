@@ -0,0 +1,202 @@
+'''
+This module counts accidents in each borough by fixed bins of each weather parameter, so
+the Fatal Accidents by Borough chart is a lookup of a few hundred counts instead of a
+groupby over every distinct weather value.
+
+Run in command line (in main project directory) to build the counts ahead of time:
+python weather_histograms.py
+'''
+
+import os
+import json
+import argparse
+from hashlib import sha1
+import numpy as np
+import pandas as pd
+import streamlit as st
+from weather_data import FATAL_WEATHER_PATH, WEATHER_PARAMETERS, read_weather_data
+from instrumentation import timed
+
+# Bin edges of each weather parameter. Bins include their lower edge, and the outer bins
+# are open ended.
+WEATHER_BINS = {
+    'temperature_2m': [-5, 0, 5, 10, 15, 20, 25, 30],
+    'relative_humidity_2m': [30, 40, 50, 60, 70, 80, 90],
+    'precipitation': [0.1, 0.5, 1, 2, 5],
+    'rain': [0.1, 0.5, 1, 2, 5],
+    'snowfall': [0.1, 1, 5],
+    'cloud_cover': [20, 40, 60, 80],
+    'wind_speed_10m': [6, 12, 20, 29, 39, 50], # Beaufort scale
+}
+
+def bin_labels(edges):
+    """
+    Names the bins between some edges.
+
+    Args:
+        edges (list): Inner bin edges in increasing order.
+
+    Returns:
+        (list): Label of each of the len(edges) + 1 bins.
+    """
+    labels = [f'Below {edges[0]:g}']
+    labels += [f'{lower:g} to {upper:g}' for lower, upper in zip(edges[:-1], edges[1:])]
+    labels.append(f'{edges[-1]:g} and above')
+    return labels
+
+def bins_version(bins = WEATHER_BINS):
+    """
+    Makes a short identifier that changes whenever any bin edge changes.
+
+    Args:
+        bins (dict, default = WEATHER_BINS): Inner bin edges of each weather column.
+
+    Returns:
+        (str): Hash of the bin edges.
+    """
+    return sha1(json.dumps(bins, sort_keys = True).encode()).hexdigest()[:8]
+
+def histograms_path(csv, bins = WEATHER_BINS):
+    """
+    Gets where the histograms of a merged CSV are saved.
+
+    Args:
+        csv (str): Path to a merged accidents and weather CSV.
+        bins (dict, default = WEATHER_BINS): Bins the histograms are counted in.
+
+    Returns:
+        (str): Path to the Parquet file next to the CSV, named by the version of the bins.
+    """
+    return f"{os.path.splitext(csv)[0]}_histograms_{bins_version(bins)}.parquet"
+
+@timed('aggregate.weather_histograms')
+def build_histograms(df_weather, bins = WEATHER_BINS):
+    """
+    Counts accidents in each borough by the bins of each weather parameter.
+
+    Args:
+        df_weather (DataFrame): Accidents with 'borough' and weather columns, as returned
+                                by weather_data.read_weather_data.
+        bins (dict, default = WEATHER_BINS):
+            keys (str): Weather columns.
+            values (list): Inner bin edges.
+
+    Returns:
+        (DataFrame): 'parameter', 'borough', 'bin' (the bin's position) and 'count' columns,
+                     with one row for each combination that has accidents.
+    """
+    boroughs = pd.Categorical(df_weather['borough'])
+    # Codes are as small an integer as the boroughs fit in, which overflows once multiplied
+    codes = boroughs.codes.astype(np.int64)
+    frames = []
+    for parameter, edges in bins.items():
+        if parameter not in df_weather:
+            continue
+        values = df_weather[parameter].to_numpy(dtype = float)
+        known = ~np.isnan(values) & (codes >= 0)
+        # Each (borough, bin) pair gets its own count, so one bincount counts everything
+        positions = codes[known] * (len(edges) + 1) + np.digitize(values[known], edges)
+        counts = np.bincount(positions, minlength = len(boroughs.categories) * (len(edges) + 1))
+        cells = np.flatnonzero(counts)
+        frames.append(pd.DataFrame({
+            'parameter': parameter,
+            'borough': np.asarray(boroughs.categories)[cells // (len(edges) + 1)],
+            'bin': (cells % (len(edges) + 1)).astype(np.int8),
+            'count': counts[cells].astype(np.int32),
+            }))
+    df_histograms = pd.concat(frames, ignore_index = True)
+    return df_histograms.astype({'parameter': 'category', 'borough': 'category'})
+
+def check_histograms(df_weather, df_histograms, bins = WEATHER_BINS):
+    """
+    Checks histograms against a groupby of the accidents they were built from.
+
+    Args:
+        df_weather (DataFrame): Accidents passed to build_histograms.
+        df_histograms (DataFrame): Output of build_histograms.
+        bins (dict, default = WEATHER_BINS): Bins passed to build_histograms.
+
+    Returns:
+        (list): Weather columns whose counts differ, which is empty if every count matches.
+    """
+    mismatched = []
+    for parameter, edges in bins.items():
+        if parameter not in df_weather:
+            continue
+        df_known = df_weather[df_weather[parameter].notna() & df_weather['borough'].notna()]
+        expected = df_known.groupby([df_known['borough'].astype(str).to_numpy(),
+                                     np.digitize(df_known[parameter].to_numpy(dtype = float), edges)]).size()
+        df_histogram = df_histograms[df_histograms['parameter'] == parameter]
+        actual = pd.Series(df_histogram['count'].to_numpy(),
+                           index = pd.MultiIndex.from_arrays([df_histogram['borough'].astype(str).to_numpy(),
+                                                              df_histogram['bin'].to_numpy(dtype = np.int64)]))
+        if not expected.sort_index().equals(actual.sort_index().astype(expected.dtype)):
+            mismatched.append(parameter)
+    return mismatched
+
+def read_histograms(csv = FATAL_WEATHER_PATH, bins = WEATHER_BINS):
+    """
+    Reads the histograms of a merged CSV, building and saving them if they are older than it
+    or were counted in other bins.
+
+    Args:
+        csv (str, default = FATAL_WEATHER_PATH): Path to a merged accidents and weather CSV.
+        bins (dict, default = WEATHER_BINS): Bins to count in.
+
+    Returns:
+        (DataFrame): Output of build_histograms.
+    """
+    path = histograms_path(csv, bins)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(csv):
+        return pd.read_parquet(path)
+
+    df_histograms = build_histograms(read_weather_data(csv), bins)
+    try:
+        df_histograms.to_parquet(path, index = False)
+    except OSError:
+        pass
+    return df_histograms
+
+@st.cache_data(show_spinner = False)
+def _cached_histograms(csv, mtime, version):
+    return read_histograms(csv)
+
+def borough_histogram(parameter, csv = FATAL_WEATHER_PATH):
+    """
+    Gets the accidents in each borough by the bins of a weather parameter.
+
+    Args:
+        parameter (str): Weather column, or its name in weather_data.WEATHER_PARAMETERS.
+        csv (str, default = FATAL_WEATHER_PATH): Path to a merged accidents and weather CSV.
+
+    Returns:
+        (DataFrame): 'borough', 'count' and the parameter's bin labels in a column named
+                     parameter, as an ordered categorical.
+    """
+    names = {name: column for column, name in WEATHER_PARAMETERS.items()}
+    column = names.get(parameter, parameter)
+    df_histograms = _cached_histograms(csv, os.path.getmtime(csv), bins_version())
+    df_histogram = df_histograms[df_histograms['parameter'] == column]
+
+    labels = bin_labels(WEATHER_BINS[column])
+    return pd.DataFrame({
+        'borough': df_histogram['borough'].astype(str).to_numpy(),
+        parameter: pd.Categorical.from_codes(df_histogram['bin'].to_numpy(), categories = labels, ordered = True),
+        'count': df_histogram['count'].to_numpy(),
+        })
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Count accidents in each borough by bins of each weather parameter.")
+    parser.add_argument('csv', nargs = '?', default = FATAL_WEATHER_PATH)
+    parser.add_argument('--check', action = 'store_true', help = "Check the counts against a groupby of the accidents.")
+    args = parser.parse_args()
+    df_histograms = read_histograms(args.csv)
+    print(f"Saved {len(df_histograms)} counts to {histograms_path(args.csv)}")
+
+    if args.check:
+        df_weather = read_weather_data(args.csv)
+        mismatched = check_histograms(df_weather, df_histograms)
+        if len(mismatched) > 0:
+            print(f"Counts of {', '.join(mismatched)} differ from the accidents")
+            raise SystemExit(1)
+        print(f"Every count of the {df_weather['borough'].nunique()} boroughs matches the accidents")
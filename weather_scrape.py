@@ -3,6 +3,7 @@ import requests_cache
 import pandas as pd
 from retry_requests import retry
 from datetime import datetime, timezone
+from weather_enrichment import ARCHIVE_URL, HOURLY_VARIABLES
 
 # Setup the Open-Meteo API client with cache and retry on error
 cache_session = requests_cache.CachedSession('.cache', expire_after=-1)
@@ -10,7 +11,7 @@ retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
 openmeteo = openmeteo_requests.Client(session=retry_session)
 
 def fetch_weather_data(latitude, longitude, timestamp):
-    url = "https://archive-api.open-meteo.com/v1/archive"
+    url = ARCHIVE_URL
     # Ensure the timestamp is truncated to the hour and timezone-aware in UTC
     if timestamp.tzinfo is None:
         timestamp = timestamp.replace(tzinfo=timezone.utc)
@@ -24,7 +25,7 @@ def fetch_weather_data(latitude, longitude, timestamp):
         "longitude": longitude,
         "start_date": date_str,
         "end_date": date_str,
-        "hourly": ["temperature_2m", "relative_humidity_2m", "precipitation", "rain", "snowfall", "cloud_cover", "wind_speed_10m"]
+        "hourly": HOURLY_VARIABLES
     }
 
     responses = openmeteo.weather_api(url, params=params)
@@ -35,21 +36,15 @@ def fetch_weather_data(latitude, longitude, timestamp):
                           end=pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
                           freq=pd.Timedelta(seconds=hourly.Interval()), inclusive="left")
     
-    weather_data = {
-        "temperature_2m": hourly.Variables(0).ValuesAsNumpy(),
-        "relative_humidity_2m": hourly.Variables(1).ValuesAsNumpy(),
-        "precipitation": hourly.Variables(2).ValuesAsNumpy(),
-        "rain": hourly.Variables(3).ValuesAsNumpy(),
-        "snowfall": hourly.Variables(4).ValuesAsNumpy(),
-        "cloud_cover": hourly.Variables(5).ValuesAsNumpy(),
-        "wind_speed_10m": hourly.Variables(6).ValuesAsNumpy(),
-    }
+    weather_data = {variable: hourly.Variables(i).ValuesAsNumpy() for i, variable in enumerate(HOURLY_VARIABLES)}
     
     weather_df = pd.DataFrame(data=weather_data, index=times)
     return weather_df.loc[timestamp_hour]
 
-# Test the function with an example
-example_latitude = 51.488749
-example_longitude = -0.165406
-example_timestamp = datetime(2010, 1, 1, 10, 30, tzinfo=timezone.utc)  # Example timestamp
-print(fetch_weather_data(example_latitude, example_longitude, example_timestamp))
+if __name__ == "__main__":
+    # Test the function with an example
+    example_latitude = 51.488749
+    example_longitude = -0.165406
+    example_timestamp = datetime(2010, 1, 1, 10, 30, tzinfo=timezone.utc)  # Example timestamp
+    print(fetch_weather_data(example_latitude, example_longitude, example_timestamp))
+
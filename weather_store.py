@@ -0,0 +1,189 @@
+'''
+This module contains a local store of hourly weather for each Open-Meteo grid cell, held
+as a memory-mapped NumPy array so weather can be looked up for any number of accidents
+without HTTP requests.
+
+Run in command line (in main project directory) to build the store from the requests
+saved by weather_enrichment.py:
+python weather_store.py
+'''
+
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from weather_enrichment import CHECKPOINT_FOLDER, GRID_RESOLUTION, HOURLY_VARIABLES
+
+WEATHER_STORE_FOLDER = 'data/weather_store'
+
+def _hours_since_epoch(timestamps):
+    # Naive timestamps are taken to be UTC, as in weather_scrape.fetch_weather_data
+    timestamps = pd.DatetimeIndex(pd.to_datetime(timestamps, utc = True))
+    return timestamps.tz_localize(None).to_numpy().astype('datetime64[h]').astype(np.int64)
+
+def _cell_index(degrees, resolution):
+    return np.round(np.asarray(degrees, dtype = float) / resolution).astype(np.int64)
+
+class WeatherStore:
+    """
+    Hourly weather indexed by grid cell and hour, read from a folder written by WeatherStore.build.
+
+    The array has shape (latitude cells, longitude cells, hours, variables) and is memory
+    mapped, so only the parts that are looked up are read from disk.
+
+    Args:
+        folder (str, default = WEATHER_STORE_FOLDER): Folder containing weather.npy and metadata.json.
+    """
+    def __init__(self, folder = WEATHER_STORE_FOLDER):
+        with open(os.path.join(folder, 'metadata.json')) as f:
+            metadata = json.load(f)
+        self.resolution = metadata['resolution']
+        self.first_lat_cell = metadata['first_lat_cell']
+        self.first_lon_cell = metadata['first_lon_cell']
+        self.first_hour = metadata['first_hour']
+        self.variables = metadata['variables']
+        self.values = np.load(os.path.join(folder, 'weather.npy'), mmap_mode = 'r')
+
+    @staticmethod
+    def build(weather, folder = WEATHER_STORE_FOLDER, resolution = GRID_RESOLUTION, variables = HOURLY_VARIABLES):
+        """
+        Saves hourly weather as a store.
+
+        Args:
+            weather (DataFrame): 'cell_lat', 'cell_lon' and 'date_hour' columns along with
+                                 a column for each variable, as returned by
+                                 weather_enrichment.fetch_cell.
+            folder (str, default = WEATHER_STORE_FOLDER): Output folder.
+            resolution (float, default = GRID_RESOLUTION): Size of grid cells in degrees.
+            variables (list, default = HOURLY_VARIABLES): Weather variables to store.
+
+        Returns:
+            (WeatherStore): The saved store.
+        """
+        os.makedirs(folder, exist_ok = True)
+        lat_cells = _cell_index(weather['cell_lat'], resolution)
+        lon_cells = _cell_index(weather['cell_lon'], resolution)
+        hours = _hours_since_epoch(weather['date_hour'])
+        metadata = {
+            'resolution': resolution,
+            'first_lat_cell': int(lat_cells.min()),
+            'first_lon_cell': int(lon_cells.min()),
+            'first_hour': int(hours.min()),
+            'variables': list(variables),
+        }
+        shape = (int(lat_cells.max()) - metadata['first_lat_cell'] + 1,
+                 int(lon_cells.max()) - metadata['first_lon_cell'] + 1,
+                 int(hours.max()) - metadata['first_hour'] + 1,
+                 len(variables))
+
+        # Hours and cells without any fetched weather are left as NaN
+        values = np.lib.format.open_memmap(os.path.join(folder, 'weather.npy'), mode = 'w+',
+                                           dtype = np.float32, shape = shape)
+        values[:] = np.nan
+        values[lat_cells - metadata['first_lat_cell'],
+               lon_cells - metadata['first_lon_cell'],
+               hours - metadata['first_hour']] = weather[list(variables)].to_numpy(dtype = np.float32)
+        values.flush()
+        del values
+
+        with open(os.path.join(folder, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+        return WeatherStore(folder)
+
+    @staticmethod
+    def from_checkpoints(checkpoint_folder = CHECKPOINT_FOLDER, folder = WEATHER_STORE_FOLDER,
+                         resolution = GRID_RESOLUTION):
+        """
+        Builds a store from the requests saved by weather_enrichment.enrich.
+
+        Args:
+            checkpoint_folder (str, default = CHECKPOINT_FOLDER): Folder of saved requests.
+            folder (str, default = WEATHER_STORE_FOLDER): Output folder.
+            resolution (float, default = GRID_RESOLUTION): Grid resolution the requests were made at.
+
+        Returns:
+            (WeatherStore): The saved store.
+        """
+        filenames = [os.path.join(checkpoint_folder, filename) for filename in sorted(os.listdir(checkpoint_folder))
+                     if filename.endswith('.parquet')]
+        if len(filenames) == 0:
+            raise FileNotFoundError(f"No saved weather requests found in {checkpoint_folder}")
+        weather = pd.concat([pd.read_parquet(filename) for filename in filenames], ignore_index = True)
+        return WeatherStore.build(weather, folder, resolution)
+
+    def indices(self, latitudes, longitudes, timestamps):
+        """
+        Snaps places and times to the nearest grid cell and the hour they fall in.
+
+        Args:
+            latitudes (array-like): Latitudes in degrees.
+            longitudes (array-like): Longitudes in degrees.
+            timestamps (array-like): Times, taken to be UTC if they have no timezone.
+
+        Returns:
+            (tuple): Latitude cell, longitude cell and hour positions in the array, followed
+                     by a mask of which places and times are within the store.
+        """
+        lat_positions = _cell_index(latitudes, self.resolution) - self.first_lat_cell
+        lon_positions = _cell_index(longitudes, self.resolution) - self.first_lon_cell
+        hour_positions = _hours_since_epoch(timestamps) - self.first_hour
+        inside = (lat_positions >= 0) & (lat_positions < self.values.shape[0]) &\
+            (lon_positions >= 0) & (lon_positions < self.values.shape[1]) &\
+                (hour_positions >= 0) & (hour_positions < self.values.shape[2])
+        return lat_positions, lon_positions, hour_positions, inside
+
+    def lookup(self, latitudes, longitudes, timestamps):
+        """
+        Gets the weather at many places and times at once.
+
+        Args:
+            latitudes (array-like): Latitudes in degrees.
+            longitudes (array-like): Longitudes in degrees.
+            timestamps (array-like): Times, taken to be UTC if they have no timezone.
+
+        Returns:
+            (DataFrame): A float32 column for each stored variable, with NaN where the
+                         place or time is outside the store.
+        """
+        lat_positions, lon_positions, hour_positions, inside = self.indices(latitudes, longitudes, timestamps)
+        result = np.full((len(inside), len(self.variables)), np.nan, dtype = np.float32)
+        result[inside] = self.values[lat_positions[inside], lon_positions[inside], hour_positions[inside]]
+        return pd.DataFrame(result, columns = self.variables)
+
+    def enrich(self, accidents):
+        """
+        Adds the weather at the hour and place of every accident.
+
+        Args:
+            accidents (DataFrame): Accidents with 'lat', 'lon' and 'date' columns.
+
+        Returns:
+            (DataFrame): accidents with a column for each stored variable.
+        """
+        weather = self.lookup(accidents['lat'], accidents['lon'], accidents['date'])
+        weather.index = accidents.index
+        return accidents.drop(columns = self.variables, errors = 'ignore').join(weather)
+
+    def missing(self, accidents):
+        """
+        Finds the accidents whose weather isn't in the store, to be fetched with
+        weather_enrichment.enrich.
+
+        Args:
+            accidents (DataFrame): Accidents with 'lat', 'lon' and 'date' columns.
+
+        Returns:
+            (Series): True for each accident without stored weather.
+        """
+        weather = self.lookup(accidents['lat'], accidents['lon'], accidents['date'])
+        return pd.Series(weather.isna().all(axis = 1).to_numpy(), index = accidents.index)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "Build the local weather store from saved weather requests.")
+    parser.add_argument('--checkpoints', default = CHECKPOINT_FOLDER)
+    parser.add_argument('--output', default = WEATHER_STORE_FOLDER)
+    args = parser.parse_args()
+    store = WeatherStore.from_checkpoints(args.checkpoints, args.output)
+    print(f"Saved weather for {store.values.shape[0] * store.values.shape[1]} cells and "
+          f"{store.values.shape[2]} hours to {args.output}")